@@ -1,27 +1,136 @@
-from flask import Flask, request, jsonify, session
+"""Flask app for the trading platform.
+
+create_app() builds the app and starts the components behind it - market
+data, the trading engine, the tick clock and its stop loss / take profit
+and stop-out checks. Nothing is started at import, so importing this module
+is cheap, and dependencies only some routes need (the replay engine, the
+multi-worker machinery, JSONBin clients) are imported on first use.
+
+    gunicorn 'app:create_app()'
+    python app.py
+"""
+from flask import Flask, Blueprint, current_app, request, jsonify, session, Response, stream_with_context, g
 from flask_cors import CORS
-import yfinance as yf
-from datetime import datetime, timedelta
-import json
-from auth import authenticate_user, create_user, get_user_data, update_user_data
+import logging
+import os
+import time
+from auth import authenticate_user, create_user, end_session
 from trading_engine import TradingEngine
 from data_fetcher import DataFetcher
+from market_feed import TickEngine, stream_ticks, sse_event
+from order_triggers import TriggerEngine
+from risk import StopOutEngine
+from portfolio_feed import PortfolioFeed, stream_portfolio
+from ownership import multi_worker, owns, OwnerRouter
+from storage import get_store
+from symbols import SYMBOLS
+from wire import encode_columns, encode_binary, series_etag, BINARY_MIMETYPE
+from data_fetcher import series_to_records
+from indicators import parse_indicators
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Largest batch accepted by the bulk order endpoints
+MAX_BATCH_ORDERS = 500
+
+api = Blueprint('api', __name__)
+
+
+class Platform:
+    """The long-lived components behind one app"""
+
+    def __init__(self):
+        self.data_fetcher = DataFetcher()
+        self.trading_engine = TradingEngine(self.data_fetcher)
+        self._replay_engine = None
+
+        if multi_worker():
+            # One of several gunicorn workers: prices and chart history come from
+            # the market process (see gunicorn.conf.py)
+            from shared_market import PriceBoard, RemoteHistory, SharedTickReader
+            self.data_fetcher.history = RemoteHistory()
+            self.tick_engine = SharedTickReader(self.data_fetcher, SYMBOLS, PriceBoard(SYMBOLS))
+        else:
+            # One shared price clock for every client
+            self.tick_engine = TickEngine(self.data_fetcher, SYMBOLS)
+
+        # Server-side stop loss / take profit and margin stop-out, evaluated on
+        # every tick for the accounts this process owns
+        open_accounts = [(user_id, user_data) for user_id, user_data in get_store().iter_users()
+                         if user_data.get('open_orders') and owns(user_id)]
+        self.trigger_engine = TriggerEngine(self.trading_engine)
+        self.trigger_engine.load(open_accounts)
+        self.trading_engine.margin.load(open_accounts)
+        self.stop_out_engine = StopOutEngine(self.trading_engine)
+        self.tick_engine.add_listener(self.trigger_engine.on_tick)
+        self.tick_engine.add_batch_listener(self.stop_out_engine.on_ticks)
+
+        # Pushes order events and equity marks to each user's open portfolio streams
+        self.portfolio_feed = PortfolioFeed(self.trading_engine)
+
+    def start(self):
+        self.tick_engine.start()
+
+    @property
+    def replay_engine(self):
+        # Only the replay routes need it
+        if self._replay_engine is None:
+            from replay import MAX_REPLAY_BARS, ReplayEngine
+            self._replay_engine = ReplayEngine(self.data_fetcher, self.trading_engine,
+                                               max_bars=MAX_REPLAY_BARS)
+        return self._replay_engine
+
+
+def platform():
+    """Components of the app handling the current request"""
+    return current_app.extensions['trading']
+
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+def record_request(response):
+    # The URL rule rather than the path keeps one series per route
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.http_request_duration.observe(
+        time.perf_counter() - g.request_started, route, request.method, response.status_code
+    )
+    if response.content_length is not None:
+        metrics.http_response_size.observe(response.content_length, route)
+    return response
+
+
+def create_app():
+    # DEBUG also logs every generated data set and replay bar
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s %(message)s'
+    )
+
+    app = Flask(__name__)
+    app.secret_key = 'your-secret-key-here'  # Change this in production
+    CORS(app, supports_credentials=True)
+
+    components = Platform()
+    app.extensions['trading'] = components
+
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    if multi_worker():
+        # Account requests for users owned by another worker are forwarded there
+        app.extensions['owner_router'] = OwnerRouter(app)
+    app.register_blueprint(api)
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'  # Change this in production
-CORS(app, supports_credentials=True)
+    components.start()
+    return app
 
-# Initialize components
-data_fetcher = DataFetcher()
-trading_engine = TradingEngine()
 
-# Available symbols
-SYMBOLS = {
-    'XAUUSD': 'GC=F',  # Gold
-    'EURUSD': 'EURUSD=X'  # EUR/USD
-}
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.json
     username = data.get('username')
@@ -34,7 +143,7 @@ def login():
     else:
         return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.json
     username = data.get('username')
@@ -47,43 +156,110 @@ def register():
     else:
         return jsonify({'success': False, 'error': result['error']}), 400
 
-@app.route('/api/logout', methods=['POST'])
+@api.route('/api/logout', methods=['POST'])
 def logout():
-    session.pop('user_id', None)
+    username = session.pop('user_id', None)
+    if username:
+        end_session(username)
     return jsonify({'success': True})
 
-@app.route('/api/data/<symbol>', methods=['GET'])
+@api.route('/api/symbols', methods=['GET'])
+def get_symbols():
+    return jsonify([spec.as_dict() for spec in SYMBOLS.values()])
+
+@api.route('/api/data/<symbol>', methods=['GET'])
 def get_data(symbol):
-    if symbol not in ['XAUUSD', 'EURUSD']:
+    if symbol not in SYMBOLS:
         return jsonify({'error': 'Invalid symbol'}), 400
     
     period = request.args.get('period', '5d')
     interval = request.args.get('interval', '1h')
+    data_format = request.args.get('format', 'records')
+    precision = request.args.get('precision', 64, type=int)
+    since = request.args.get('since', type=int)
+
+    if data_format not in ('records', 'columns', 'binary'):
+        return jsonify({'error': 'Invalid format'}), 400
+
+    try:
+        indicators = parse_indicators(request.args.get('indicators'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if indicators and data_format == 'binary':
+        return jsonify({'error': 'Indicators are not available in the binary format'}), 400
     
     try:
-        data = data_fetcher.get_historical_data(symbol, period, interval)
-        return jsonify(data)
-    except Exception as e:
-        print(f"Error in /api/data: {str(e)}")
+        series = platform().data_fetcher.get_historical_series(symbol, period, interval, since, indicators)
+
+        # Bars only change when new ones are appended, so the last bar
+        # identifies the response
+        count = len(series['timestamp'])
+        etag = series_etag(
+            symbol, period, interval, data_format, precision, since,
+            ','.join(indicator.key for indicator in indicators), count,
+            series['timestamp'][-1] if count else None,
+            series['close'][-1] if count else None
+        )
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            with metrics.serialization_duration.time(data_format):
+                if data_format == 'binary':
+                    response = Response(encode_binary(series, precision), mimetype=BINARY_MIMETYPE)
+                elif data_format == 'columns':
+                    response = jsonify(encode_columns(series))
+                else:
+                    response = jsonify(series_to_records(series))
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception:
+        logger.exception('chart data failed symbol=%s interval=%s', symbol, interval)
         # Return demo data even if there's an error
-        demo_data = data_fetcher.generate_realistic_data(symbol, 50, interval)
+        demo_data = platform().data_fetcher.generate_realistic_data(symbol, 50, interval)
         return jsonify(demo_data)
 
-@app.route('/api/current-price/<symbol>', methods=['GET'])
+@api.route('/api/current-price/<symbol>', methods=['GET'])
 def get_current_price(symbol):
-    if symbol not in ['XAUUSD', 'EURUSD']:
+    if symbol not in SYMBOLS:
         return jsonify({'error': 'Invalid symbol'}), 400
     
     try:
-        price = data_fetcher.get_current_price(symbol)
+        price = platform().data_fetcher.get_current_price(symbol)
         return jsonify({'price': price})
-    except Exception as e:
-        print(f"Error in /api/current-price: {str(e)}")
+    except Exception:
+        logger.exception('current price failed symbol=%s', symbol)
         # Always return a price, even if there's an error
-        fallback_price = data_fetcher.base_prices.get(symbol, 1000.0)
+        fallback_price = platform().data_fetcher.base_prices.get(symbol, 1000.0)
         return jsonify({'price': fallback_price})
 
-@app.route('/api/place-order', methods=['POST'])
+@api.route('/api/stream/prices', methods=['GET'])
+def stream_prices():
+    symbols = request.args.get('symbols')
+    symbols = symbols.split(',') if symbols else list(SYMBOLS)
+    if any(symbol not in SYMBOLS for symbol in symbols):
+        return jsonify({'error': 'Invalid symbol'}), 400
+
+    return Response(
+        stream_with_context(stream_ticks(platform().tick_engine, symbols)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/stream/portfolio', methods=['GET'])
+def stream_portfolio_events():
+    """Portfolio snapshot, then order, balance and equity changes as they happen"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return Response(
+        stream_with_context(stream_portfolio(platform().portfolio_feed, session['user_id'])),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/place-order', methods=['POST'])
 def place_order():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
@@ -92,12 +268,14 @@ def place_order():
     user_id = session['user_id']
     
     try:
-        result = trading_engine.place_order(user_id, data)
+        result = platform().trading_engine.place_order(user_id, data)
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/close-order', methods=['POST'])
+@api.route('/api/close-order', methods=['POST'])
 def close_order():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
@@ -106,39 +284,145 @@ def close_order():
     user_id = session['user_id']
     
     try:
-        result = trading_engine.close_order(user_id, data['order_id'])
+        result = platform().trading_engine.close_order(user_id, data['order_id'])
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/place-orders', methods=['POST'])
+def place_orders():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    orders = (request.json or {}).get('orders')
+    if not isinstance(orders, list) or not orders:
+        return jsonify({'error': 'orders must be a non-empty list'}), 400
+    if len(orders) > MAX_BATCH_ORDERS:
+        return jsonify({'error': f'At most {MAX_BATCH_ORDERS} orders per batch'}), 400
+
+    try:
+        result = platform().trading_engine.place_orders(session['user_id'], orders)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/close-orders', methods=['POST'])
+def close_orders():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    order_ids = (request.json or {}).get('order_ids')
+    if not isinstance(order_ids, list) or not order_ids:
+        return jsonify({'error': 'order_ids must be a non-empty list'}), 400
+    if len(order_ids) > MAX_BATCH_ORDERS:
+        return jsonify({'error': f'At most {MAX_BATCH_ORDERS} orders per batch'}), 400
+
+    try:
+        result = platform().trading_engine.close_orders(session['user_id'], order_ids)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/portfolio', methods=['GET'])
+@api.route('/api/close-all', methods=['POST'])
+def close_all():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    symbol = (request.json or {}).get('symbol')
+    if symbol is not None and symbol not in SYMBOLS:
+        return jsonify({'error': 'Invalid symbol'}), 400
+
+    try:
+        result = platform().trading_engine.close_all(session['user_id'], symbol)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/portfolio', methods=['GET'])
 def get_portfolio():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     user_id = session['user_id']
-    user_data = get_user_data(user_id)
-    
-    return jsonify({
-        'balance': user_data.get('balance', 10000),
-        'open_orders': user_data.get('open_orders', []),
-        'closed_orders': user_data.get('closed_orders', [])
-    })
+    return jsonify(platform().trading_engine.get_portfolio(user_id))
 
-@app.route('/api/replay', methods=['POST'])
+@api.route('/api/history', methods=['GET'])
+def get_history():
+    """Closed trades, newest first; pass cursor back as before for older pages"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify(platform().trading_engine.get_history(
+        session['user_id'],
+        limit=request.args.get('limit', 50, type=int),
+        before=request.args.get('before', type=int),
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float)
+    ))
+
+@api.route('/api/replay', methods=['POST'])
 def replay_data():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
     data = request.json
     symbol = data.get('symbol')
-    date = data.get('date')
-    
+
     if symbol not in SYMBOLS:
         return jsonify({'error': 'Invalid symbol'}), 400
-    
+
     try:
-        replay_data = data_fetcher.get_data_at_date(SYMBOLS[symbol], date)
+        if data.get('start') and data.get('end'):
+            # Backtest a set of orders over a reproducible series
+            report = platform().replay_engine.backtest(
+                symbol, data['start'], data['end'], data.get('orders', []),
+                interval=data.get('interval', '1h'),
+                balance=data.get('balance', 10000.0),
+                seed=data.get('seed')
+            )
+            return jsonify(report)
+
+        replay_data = platform().data_fetcher.get_data_at_date(symbol, data.get('date'))
         return jsonify(replay_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/replay/stream', methods=['GET'])
+def replay_stream():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    symbol = request.args.get('symbol')
+    start = request.args.get('start')
+    end = request.args.get('end')
+
+    if symbol not in SYMBOLS:
+        return jsonify({'error': 'Invalid symbol'}), 400
+    if not start or not end:
+        return jsonify({'error': 'start and end are required'}), 400
+
+    try:
+        bars = platform().replay_engine.stream(
+            symbol, start, end,
+            interval=request.args.get('interval', '1h'),
+            speed=float(request.args.get('speed', 10)),
+            seed=request.args.get('seed')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def events():
+        for bar in bars:
+            yield sse_event(bar)
+        yield sse_event({'done': True}, event='end')
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
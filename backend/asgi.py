@@ -0,0 +1,202 @@
+"""ASGI entry point for serving many concurrent and streaming clients.
+
+    uvicorn asgi:create_app --factory --host 0.0.0.0 --port 5000
+
+Live prices (polling and Server-Sent Events) and portfolio streams are
+served directly on the event loop, so thousands of open streams cost no threads. Chart requests,
+whose bar generation is CPU-bound, run on their own executor so they cannot
+starve the other routes. Everything else is delegated to the Flask app on a
+bounded thread pool. Logins load the account with the async storage client
+before they reach Flask, so no worker thread waits on a storage round-trip.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+from app import create_app as create_flask_app
+from async_storage import open_async_store
+from metrics import http_request_duration
+from market_feed import AsyncTickFanout, astream_ticks
+from portfolio_feed import astream_portfolio
+from portfolio_cache import get_portfolio_cache
+from symbols import SYMBOLS
+
+# Threads running delegated Flask requests, and threads generating chart data
+FLASK_WORKERS = int(os.getenv('ASGI_FLASK_WORKERS', '32'))
+GENERATION_WORKERS = int(os.getenv('ASGI_GENERATION_WORKERS', str(os.cpu_count() or 2)))
+
+
+class TradingASGI:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.platform = flask_app.extensions['trading']
+        self.flask_wsgi = WSGIMiddleware(flask_app, workers=FLASK_WORKERS)
+        self.chart_wsgi = WSGIMiddleware(flask_app, workers=GENERATION_WORKERS)
+        self.store = None
+        self.fanout = None
+        # Local stores are called through this pool rather than the loop's default one
+        self.storage_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='async-storage')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path, method = scope['path'], scope['method']
+        if method == 'GET' and path.startswith('/api/current-price/'):
+            await self.current_price(scope, send, path.rsplit('/', 1)[1])
+        elif method == 'GET' and path == '/api/stream/prices':
+            await self.stream_prices(scope, receive, send)
+        elif method == 'GET' and path == '/api/stream/portfolio':
+            await self.stream_portfolio(scope, receive, send)
+        elif method == 'GET' and path.startswith('/api/data/'):
+            await self.chart_wsgi(scope, receive, send)
+        elif method == 'POST' and path == '/api/login':
+            await self.login(scope, receive, send)
+        else:
+            await self.flask_wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.store = open_async_store(self.storage_executor)
+                self.fanout = AsyncTickFanout(self.platform.tick_engine, asyncio.get_running_loop())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.fanout.close()
+                await self.store.aclose()
+                self.storage_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def current_price(self, scope, send, symbol):
+        started = time.perf_counter()
+        if symbol not in SYMBOLS:
+            await self.send_json(scope, send, {'error': 'Invalid symbol'}, 400)
+            status = 400
+        else:
+            await self.send_json(scope, send, {'price': self.platform.data_fetcher.get_current_price(symbol)})
+            status = 200
+        # Same route label as the Flask view
+        http_request_duration.observe(time.perf_counter() - started,
+                                      '/api/current-price/<symbol>', 'GET', status)
+
+    async def stream_prices(self, scope, receive, send):
+        # Blank symbols= means every symbol, as in the WSGI route
+        symbols = parse_qs(scope['query_string'].decode()).get('symbols', [''])[0]
+        symbols = symbols.split(',') if symbols else list(SYMBOLS)
+        if any(symbol not in SYMBOLS for symbol in symbols):
+            await self.send_json(scope, send, {'error': 'Invalid symbol'}, 400)
+            return
+
+        await self.send_events(scope, receive, send, astream_ticks(self.fanout, symbols))
+
+    async def stream_portfolio(self, scope, receive, send):
+        user_id = self.session_user(scope)
+        if user_id is None:
+            await self.send_json(scope, send, {'error': 'Not authenticated'}, 401)
+            return
+        await self.send_events(scope, receive, send, astream_portfolio(self.platform.portfolio_feed, user_id))
+
+    async def send_events(self, scope, receive, send, messages):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')
+            ] + self.cors_headers(scope)
+        })
+
+        async def pump():
+            async for message in messages:
+                await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        # Stream until the client goes away; cancelling the pump closes the
+        # generator, which drops its subscription
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(wait_for_disconnect())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # End the response; the server drops it if the client is gone
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def login(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        try:
+            username = json.loads(body).get('username')
+        except (ValueError, AttributeError):
+            username = None
+
+        cache = get_portfolio_cache()
+        if isinstance(username, str) and not cache.cached(username):
+            cache.prime(username, await self.store.get_user(username))
+
+        replayed = False
+
+        async def replay_body():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        await self.flask_wsgi(scope, replay_body, send)
+
+    def session_user(self, scope):
+        """user_id from the Flask session cookie, None unless signed by this app"""
+        cookie = SimpleCookie(dict(scope['headers']).get(b'cookie', b'').decode('latin-1'))
+        morsel = cookie.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if morsel is None or serializer is None:
+            return None
+        try:
+            return serializer.loads(morsel.value).get('user_id')
+        except Exception:
+            return None
+
+    @staticmethod
+    def cors_headers(scope):
+        # Same policy as flask-cors with supports_credentials: echo the origin
+        origin = dict(scope['headers']).get(b'origin')
+        if origin is None:
+            return []
+        return [(b'access-control-allow-origin', origin),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin')]
+
+    async def send_json(self, scope, send, payload, status=200):
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())] + self.cors_headers(scope)
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def create_app():
+    return TradingASGI(create_flask_app())
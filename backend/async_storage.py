@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+
+from metrics import observe_storage, storage_payload_size
+from storage import (
+    JSONBIN_API_KEY, JSONBIN_BIN_ID, JSONBIN_URL, JSONBIN_TIMEOUT, JSONBIN_POOL_SIZE,
+    USER_STORE, StorageError, get_store
+)
+
+
+class AsyncJSONBinStore:
+    """Non-blocking JSONBin client for the ASGI server.
+
+    All calls share one httpx client, so concurrent requests multiplex over
+    a small pool of keep-alive connections instead of each opening its own.
+    Must be created and closed on the event loop that uses it.
+    """
+
+    def __init__(self):
+        # Imported here so servers on a local store never load it
+        import httpx
+
+        self._client = httpx.AsyncClient(
+            headers={'X-Master-Key': JSONBIN_API_KEY},
+            timeout=JSONBIN_TIMEOUT,
+            limits=httpx.Limits(max_connections=JSONBIN_POOL_SIZE,
+                                max_keepalive_connections=JSONBIN_POOL_SIZE)
+        )
+        # Read-modify-write of the single document must not interleave
+        self._write_lock = asyncio.Lock()
+
+    async def _get_document(self):
+        import httpx
+
+        started = time.perf_counter()
+        try:
+            response = await self._client.get(
+                f'{JSONBIN_URL}/{JSONBIN_BIN_ID}/latest',
+                headers={'X-Bin-Meta': 'false'}
+            )
+        except httpx.HTTPError:
+            observe_storage('jsonbin', 'get', started, 'error')
+            raise
+        observe_storage('jsonbin', 'get', started, 'ok' if response.status_code == 200 else 'miss')
+        storage_payload_size.observe(len(response.content), 'jsonbin', 'read')
+        if response.status_code == 200:
+            return response.json()
+        # Return empty structure if bin doesn't exist
+        return {'users': {}}
+
+    async def _put_document(self, data):
+        import httpx
+
+        body = json.dumps(data)
+        storage_payload_size.observe(len(body), 'jsonbin', 'write')
+        started = time.perf_counter()
+        try:
+            response = await self._client.put(
+                f'{JSONBIN_URL}/{JSONBIN_BIN_ID}',
+                headers={'Content-Type': 'application/json'},
+                content=body
+            )
+        except httpx.HTTPError:
+            observe_storage('jsonbin', 'put', started, 'error')
+            raise
+        observe_storage('jsonbin', 'put', started, 'ok' if response.status_code == 200 else 'error')
+        return response.status_code == 200
+
+    async def get_user(self, username):
+        return (await self._get_document()).get('users', {}).get(username, {})
+
+    async def put_user(self, username, user_data):
+        return await self.put_users({username: user_data})
+
+    async def put_users(self, users):
+        async with self._write_lock:
+            data = await self._get_document()
+            data.setdefault('users', {}).update(users)
+            return await self._put_document(data)
+
+    async def create_user(self, username, user_data):
+        async with self._write_lock:
+            data = await self._get_document()
+            existing = data.setdefault('users', {})
+            if username in existing:
+                return False
+
+            existing[username] = user_data
+            if not await self._put_document(data):
+                raise StorageError('Failed to write JSONBin document')
+            return True
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class AsyncStoreAdapter:
+    """Async facade over a synchronous store, calls run on an executor.
+
+    Used for local backends such as SQLite, where a call is short but still
+    must not run on the event loop.
+    """
+
+    def __init__(self, store, executor=None):
+        self.store = store
+        self.executor = executor
+
+    async def _call(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, method, *args)
+
+    async def get_user(self, username):
+        return await self._call(self.store.get_user, username)
+
+    async def put_user(self, username, user_data):
+        return await self._call(self.store.put_user, username, user_data)
+
+    async def put_users(self, users):
+        return await self._call(self.store.put_users, users)
+
+    async def create_user(self, username, user_data):
+        return await self._call(self.store.create_user, username, user_data)
+
+    async def aclose(self):
+        pass
+
+
+def open_async_store(executor=None):
+    """Async counterpart of get_store() for the running event loop"""
+    if USER_STORE == 'jsonbin':
+        return AsyncJSONBinStore()
+    return AsyncStoreAdapter(get_store(), executor)
@@ -1,94 +1,88 @@
-import requests
-import json
-import os
-from dotenv import load_dotenv
+from storage import get_store, StorageError
+from portfolio_cache import get_portfolio_cache
+from passwords import hash_password, verify_password, run_hashing, dummy_hash
+from ledger import get_order_ledger
 
-load_dotenv()
+def authenticate_user(username, password):
+    cache = get_portfolio_cache()
+    user = cache.get(username)
+    # Unknown users are checked against a dummy hash, so the response time
+    # does not tell whether an account exists
+    stored = user.get('password') if user else dummy_hash()
 
-JSONBIN_API_KEY = os.getenv('JSONBIN_API_KEY', 'your-jsonbin-api-key')
-JSONBIN_BIN_ID = os.getenv('JSONBIN_BIN_ID', 'your-jsonbin-bin-id')
+    # Hashing is CPU-bound, so only a bounded number of logins hash at once
+    matches, needs_rehash = run_hashing(verify_password, stored, password)
+    if not user or not matches:
+        return None
 
-def get_bin_data():
-    headers = {
-        'X-Master-Key': JSONBIN_API_KEY,
-        'X-Bin-Meta': 'false'
-    }
-    
-    response = requests.get(
-        f'https://api.jsonbin.io/v3/b/{JSONBIN_BIN_ID}/latest',
-        headers=headers
-    )
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        # Return empty structure if bin doesn't exist
-        return {'users': {}}
+    if needs_rehash:
+        # Plaintext or outdated hash - store it with the current cost
+        new_hash = run_hashing(hash_password, password)
+        with cache.lock(username):
+            user = cache.get(username)
+            user['password'] = new_hash
+            cache.put(username, user)
 
-def update_bin_data(data):
-    headers = {
-        'X-Master-Key': JSONBIN_API_KEY,
-        'Content-Type': 'application/json'
+    return {
+        'username': username,
+        'balance': user.get('balance', 10000),
+        'open_orders': user.get('open_orders', [])
     }
-    
-    response = requests.put(
-        f'https://api.jsonbin.io/v3/b/{JSONBIN_BIN_ID}',
-        headers=headers,
-        data=json.dumps(data)
-    )
-    
-    return response.status_code == 200
-
-def authenticate_user(username, password):
-    data = get_bin_data()
-    users = data.get('users', {})
-    
-    user = users.get(username)
-    if user and user.get('password') == password:
-        return {
-            'username': username,
-            'balance': user.get('balance', 10000),
-            'open_orders': user.get('open_orders', []),
-            'closed_orders': user.get('closed_orders', [])
-        }
-    return None
 
 def create_user(username, password):
-    data = get_bin_data()
-    users = data.get('users', {})
-    
-    if username in users:
-        return {'success': False, 'error': 'Username already exists'}
-    
-    users[username] = {
-        'password': password,
+    if not isinstance(username, str) or not username or not isinstance(password, str) or not password:
+        return {'success': False, 'error': 'Username and password are required'}
+
+    user = {
+        'password': run_hashing(hash_password, password),
         'balance': 10000,
-        'open_orders': [],
-        'closed_orders': []
+        'open_orders': []
     }
-    
-    data['users'] = users
-    if update_bin_data(data):
-        return {
-            'success': True,
-            'user': {
-                'username': username,
-                'balance': 10000,
-                'open_orders': [],
-                'closed_orders': []
-            }
-        }
-    else:
+
+    try:
+        created = get_store().create_user(username, user)
+    except StorageError:
         return {'success': False, 'error': 'Failed to create user'}
 
+    if not created:
+        return {'success': False, 'error': 'Username already exists'}
+
+    # Drop any cached "no such user" left by an earlier lookup
+    get_portfolio_cache().invalidate(username)
+
+    return {
+        'success': True,
+        'user': {
+            'username': username,
+            'balance': 10000,
+            'open_orders': []
+        }
+    }
+
+def end_session(username):
+    """Release the account cached for a session that logged out"""
+    get_portfolio_cache().invalidate(username)
+
 def get_user_data(username):
-    data = get_bin_data()
-    users = data.get('users', {})
-    return users.get(username, {})
+    user_data = get_portfolio_cache().get(username)
+    if 'closed_orders' in user_data:
+        user_data = _move_history_to_ledger(username)
+    return user_data
+
+def _move_history_to_ledger(username):
+    """Accounts from before the order ledger carry their closed orders in the record"""
+    cache = get_portfolio_cache()
+    with cache.lock(username):
+        user_data = cache.get(username)
+        closed_orders = user_data.pop('closed_orders', None)
+        if closed_orders is not None:
+            get_order_ledger().import_closed(username, closed_orders)
+            cache.put(username, user_data)
+    return user_data
 
 def update_user_data(username, user_data):
-    data = get_bin_data()
-    users = data.get('users', {})
-    users[username] = user_data
-    data['users'] = users
-    return update_bin_data(data)
\ No newline at end of file
+    return get_portfolio_cache().put(username, user_data)
+
+def user_lock(username):
+    """Lock to hold around a get_user_data/update_user_data cycle"""
+    return get_portfolio_cache().lock(username)
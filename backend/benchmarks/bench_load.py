@@ -0,0 +1,191 @@
+"""End-to-end load scenarios against a locally started backend.
+
+The server runs in a subprocess with a throwaway database and journal. With
+--store jsonbin its accounts live in benchmarks/fake_jsonbin.py instead of
+the real service, so nothing leaves the machine.
+
+Scenarios:
+    login_storm    every user logs in --logins times, --clients at once
+    order_burst    every client places --orders orders back to back
+    price_pollers  --pollers clients poll /api/current-price for --duration s
+
+Usage:
+    python benchmarks/bench_load.py [--server wsgi|asgi] [--store sqlite|jsonbin]
+                                    [--scenarios login_storm,order_burst,price_pollers]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import BACKEND_DIR, summarize_latencies, write_results
+from fake_jsonbin import start_fake_jsonbin
+
+SCENARIOS = ('login_storm', 'order_burst', 'price_pollers')
+
+WSGI_SERVER = (
+    'import sys, app; from werkzeug.serving import run_simple; '
+    'run_simple("127.0.0.1", int(sys.argv[1]), app.create_app(), threaded=True)'
+)
+
+
+def start_server(kind, port, env):
+    if kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:create_app', '--factory', '--port', str(port),
+                   '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-c', WSGI_SERVER, str(port)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base_url = f'http://127.0.0.1:{port}/api'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited with code {process.returncode}')
+        try:
+            requests.get(f'{base_url}/current-price/XAUUSD', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+def timed(call):
+    """Run call(), returns (seconds, ok)"""
+    start = time.perf_counter()
+    try:
+        ok = call().status_code < 400
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_clients(clients, worker):
+    """Run worker(index) on clients threads, returns (latencies, errors, elapsed)"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        outcomes = list(pool.map(worker, range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies, errors = [], 0
+    for samples in outcomes:
+        for seconds, ok in samples:
+            if ok:
+                latencies.append(seconds)
+            else:
+                errors += 1
+    return latencies, errors, elapsed
+
+
+def login(session, base_url, username):
+    return session.post(f'{base_url}/login', json={'username': username, 'password': 'bench'})
+
+
+def login_storm(base_url, usernames, args):
+    def worker(index):
+        session = requests.Session()
+        return [timed(lambda: login(session, base_url, username))
+                for username in usernames[index::args.clients]
+                for _ in range(args.logins)]
+    return run_clients(args.clients, worker)
+
+
+def order_burst(base_url, usernames, args):
+    sessions = []
+    for index in range(args.clients):
+        session = requests.Session()
+        login(session, base_url, usernames[index % len(usernames)])
+        sessions.append(session)
+
+    order = {'symbol': 'XAUUSD', 'type': 'buy', 'lot_size': 0.001}
+
+    def worker(index):
+        session = sessions[index]
+        return [timed(lambda: session.post(f'{base_url}/place-order', json=order))
+                for _ in range(args.orders)]
+    result = run_clients(args.clients, worker)
+
+    for session in sessions:
+        session.post(f'{base_url}/close-all', json={})
+    return result
+
+
+def price_pollers(base_url, usernames, args):
+    def worker(index):
+        session = requests.Session()
+        deadline = time.monotonic() + args.duration
+        samples = []
+        while time.monotonic() < deadline:
+            samples.append(timed(lambda: session.get(f'{base_url}/current-price/XAUUSD')))
+        return samples
+    return run_clients(args.pollers, worker)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end backend load scenarios')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--store', choices=('sqlite', 'jsonbin'), default='sqlite')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=3)
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--pollers', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--jsonbin-latency-ms', type=float, default=40.0)
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/load-<commit>.json)')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    workdir = tempfile.mkdtemp(prefix='trading-bench-')
+    env = dict(os.environ,
+               USER_STORE=args.store,
+               USER_DB_PATH=os.path.join(workdir, 'users.db'),
+               PORTFOLIO_JOURNAL_PATH=os.path.join(workdir, 'portfolio.journal'),
+               ORDER_LEDGER_PATH=os.path.join(workdir, 'orders.ledger'))
+    fake_jsonbin = None
+    if args.store == 'jsonbin':
+        fake_jsonbin = start_fake_jsonbin(latency=args.jsonbin_latency_ms / 1000)
+        env.update(JSONBIN_BASE_URL=fake_jsonbin.base_url, JSONBIN_BIN_ID='bench',
+                   JSONBIN_API_KEY='bench')
+
+    process, base_url = start_server(args.server, args.port, env)
+    results = {}
+    try:
+        usernames = [f'bench{i}' for i in range(args.users)]
+        for username in usernames:
+            requests.post(f'{base_url}/register', json={'username': username, 'password': 'bench'})
+
+        for name in scenarios:
+            latencies, errors, elapsed = globals()[name](base_url, usernames, args)
+            results[name] = summarize_latencies(latencies, elapsed, errors)
+            summary = results[name]
+            print(f"{name:14} {summary['requests']:>7} req  {summary.get('throughput_rps', 0):>9,.1f} req/s  "
+                  f"p50 {summary.get('p50_ms', 0):8.2f} ms  p99 {summary.get('p99_ms', 0):8.2f} ms  "
+                  f"errors {errors}")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        if fake_jsonbin is not None:
+            fake_jsonbin.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    write_results('load', params, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Micro-benchmarks for the hot data and P&L paths.
+
+Usage:
+    python benchmarks/bench_micro.py [--repeat 5] [--output results.json]
+"""
+import argparse
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import timeit
+
+from common import write_results
+
+# The trading engine opens the order ledger; give it a throwaway one, set
+# before the backend modules read their paths
+_DATA_DIR = tempfile.mkdtemp(prefix='bench-micro-')
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+os.environ['USER_DB_PATH'] = os.path.join(_DATA_DIR, 'users.db')
+os.environ['PORTFOLIO_JOURNAL_PATH'] = os.path.join(_DATA_DIR, 'portfolio.journal')
+os.environ['ORDER_LEDGER_PATH'] = os.path.join(_DATA_DIR, 'orders.ledger')
+
+from data_fetcher import DataFetcher
+from risk import MarginBook
+from symbols import SymbolSpec
+from trading_engine import TradingEngine
+
+# Synthetic instruments for the batched tick step
+TICK_SYMBOLS = 500
+# Accounts with open positions for the per-tick margin pass
+MARGIN_ACCOUNTS = 10000
+
+
+def measure(func, repeat):
+    """Per-call seconds over repeat runs, each long enough to be stable"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'calls_per_run': number,
+        'best_us': round(min(runs) * 1e6, 3),
+        'median_us': round(statistics.median(runs) * 1e6, 3),
+        'ops_per_sec': round(1 / statistics.median(runs), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Data fetcher and trading engine micro-benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/micro-<commit>.json)')
+    args = parser.parse_args()
+
+    data_fetcher = DataFetcher()
+    trading_engine = TradingEngine(data_fetcher)
+
+    specs = {
+        f'SYM{i:03d}': SymbolSpec(f'SYM{i:03d}', f'Synthetic {i}', base_price=100.0, bounds=(50, 150),
+                                  tick_size=0.01, volatility=1, move_cap=2, tick_move=0.05,
+                                  base_volume=10000)
+        for i in range(TICK_SYMBOLS)
+    }
+    many_symbols = DataFetcher(specs)
+    tick_symbols = list(specs)
+
+    margin_book = MarginBook(data_fetcher.symbols)
+    margin_book.load(
+        (f'user{i}', {'balance': 10000.0, 'open_orders': [
+            {'symbol': 'XAUUSD', 'type': 'buy', 'lot_size': 1, 'open_price': 1950.0},
+            {'symbol': 'EURUSD', 'type': 'sell', 'lot_size': 2, 'open_price': 1.085}
+        ]})
+        for i in range(MARGIN_ACCOUNTS)
+    )
+
+    cases = {
+        'generate_realistic_data_100': lambda: data_fetcher.generate_realistic_data('XAUUSD', 100, '1h'),
+        'generate_realistic_data_1000': lambda: data_fetcher.generate_realistic_data('XAUUSD', 1000, '1h'),
+        'generate_series_100000': lambda: data_fetcher.generate_series('EURUSD', 100000, '1m'),
+        'get_current_price': lambda: data_fetcher.get_current_price('XAUUSD'),
+        f'advance_prices_{TICK_SYMBOLS}': lambda: many_symbols.advance_prices(tick_symbols),
+        f'margin_breached_{MARGIN_ACCOUNTS}': lambda: margin_book.breached(data_fetcher.current_prices),
+        'calculate_pnl': lambda: trading_engine.calculate_pnl('buy', 1950.0, 1952.5, 1000)
+    }
+
+    results = {}
+    for name, func in cases.items():
+        results[name] = measure(func, args.repeat)
+        print(f"{name:32} {results[name]['median_us']:>12.3f} µs/call "
+              f"({results[name]['ops_per_sec']:,.0f} ops/s)")
+
+    write_results('micro', {'repeat': args.repeat}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Cold start cost of a backend process: import time, app creation and memory.
+
+Every run starts a fresh interpreter with a throwaway database, journal and
+ledger, as a new worker would, and reports:
+    spawn_ms       interpreter start until the app is ready to serve
+    import_ms      importing the entry point module
+    create_app_ms  create_app(), which starts the tick engine
+    rss_import_mb  resident memory after the import
+    rss_ready_mb   resident memory once the app is ready
+
+Usage:
+    python benchmarks/bench_startup.py [--target wsgi|asgi] [--runs 5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BACKEND_DIR, write_results
+
+TARGETS = {'wsgi': 'app', 'asgi': 'asgi'}
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+rss_import = rss_mb()
+module.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'rss_import_mb': rss_import,
+    'rss_ready_mb': rss_mb()
+}))
+sys.stdout.flush()
+'''
+
+
+def run_once(module, workdir):
+    env = dict(os.environ,
+               USER_DB_PATH=os.path.join(workdir, 'users.db'),
+               PORTFOLIO_JOURNAL_PATH=os.path.join(workdir, 'portfolio.journal'),
+               ORDER_LEDGER_PATH=os.path.join(workdir, 'orders.ledger'),
+               LOG_LEVEL='WARNING')
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', PROBE, module], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.PIPE, text=True)
+    # The probe prints once the app is ready; shutting down is not counted
+    line = process.stdout.readline()
+    ready = time.perf_counter()
+    if process.wait() != 0 or not line:
+        raise RuntimeError(f'{module} failed to start')
+    sample = json.loads(line)
+    sample['spawn_ms'] = (ready - started) * 1000
+    return sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend import time and memory at startup')
+    parser.add_argument('--target', choices=sorted(TARGETS), default='wsgi')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/startup-<commit>.json)')
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix='bench-startup-')
+        try:
+            samples.append(run_once(TARGETS[args.target], workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {args.target: {
+        metric: round(statistics.median(sample[metric] for sample in samples), 1)
+        for metric in ('spawn_ms', 'import_ms', 'create_app_ms', 'rss_import_mb', 'rss_ready_mb')
+    }}
+    for metric, value in results[args.target].items():
+        print(f'{args.target} {metric:16} {value:>10.1f}')
+
+    write_results('startup', {'target': args.target, 'runs': args.runs}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
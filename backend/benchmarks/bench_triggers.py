@@ -0,0 +1,67 @@
+"""Benchmark SL/TP trigger evaluation against a large resting order book.
+
+Usage:
+    python benchmarks/bench_triggers.py [--orders 100000] [--ticks 10000]
+"""
+import argparse
+import random
+import time
+
+from common import percentile
+
+from order_triggers import TriggerEngine
+
+
+class _NullTradingEngine:
+    def __init__(self):
+        self.order_listeners = []
+
+
+def build_engine(orders, price, spread):
+    engine = TriggerEngine(_NullTradingEngine())
+    for i in range(orders):
+        is_buy = random.random() < 0.5
+        stop = random.uniform(0, spread)
+        target = random.uniform(0, spread)
+        engine.add_order(f'user{i % 1000}', {
+            'id': f'order{i}',
+            'symbol': 'XAUUSD',
+            'type': 'buy' if is_buy else 'sell',
+            'stop_loss': price - stop if is_buy else price + stop,
+            'take_profit': price + target if is_buy else price - target
+        })
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SL/TP trigger engine benchmark')
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--ticks', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    price = 1950.0
+    # Levels spread over $200 either side, ticks move up to $0.50
+    engine = build_engine(args.orders, price, 200.0)
+
+    timings = []
+    triggered = 0
+    for _ in range(args.ticks):
+        price += random.uniform(-0.5, 0.5)
+        start = time.perf_counter()
+        triggered += len(engine.check('XAUUSD', price))
+        timings.append(time.perf_counter() - start)
+
+    print(f"Resting orders:    {args.orders}")
+    print(f"Ticks evaluated:   {args.ticks}")
+    print(f"Orders triggered:  {triggered}")
+    print(f"Per tick p50:      {percentile(timings, 50) * 1e6:.1f} µs")
+    print(f"Per tick p99:      {percentile(timings, 99) * 1e6:.1f} µs")
+    print(f"Per tick max:      {max(timings) * 1e6:.1f} µs")
+    if triggered:
+        print(f"Per triggered order: {sum(timings) / triggered * 1e6:.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
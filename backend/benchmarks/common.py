@@ -0,0 +1,71 @@
+"""Shared helpers for the benchmark scripts: latency summaries and result files.
+
+Result files are JSON documents of the form
+    {"benchmark": ..., "commit": ..., "python": ..., "created": ...,
+     "params": {...}, "results": {name: {metric: value}}}
+so two runs can be compared with benchmarks/compare.py.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def summarize_latencies(samples, elapsed, errors=0):
+    """Latency percentiles in milliseconds plus throughput for one scenario"""
+    if not samples:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(benchmark, params, results, path=None):
+    """Write a result document, by default to results/<benchmark>-<commit>.json"""
+    commit = git_commit()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{benchmark}-{commit or "unknown"}.json')
+
+    document = {
+        'benchmark': benchmark,
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': params,
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"💾 Results written to {path}")
+    return path
@@ -0,0 +1,49 @@
+"""Compare two benchmark result files, e.g. from two commits.
+
+Usage:
+    python benchmarks/compare.py results/load-abc123.json results/load-def456.json
+"""
+import argparse
+import json
+
+# Metrics where a smaller value is better; everything else is a rate
+LOWER_IS_BETTER = ('_ms', '_us', '_mb', 'errors')
+# Counts that describe the run rather than its performance
+IGNORED = ('requests', 'calls_per_run')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Flag changes worse than this many percent')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline['benchmark']}: {baseline['commit']} -> {candidate['commit']}")
+    regressions = 0
+    for name, metrics in baseline['results'].items():
+        for metric, old in metrics.items():
+            new = candidate['results'].get(name, {}).get(metric)
+            if metric in IGNORED or not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+                continue
+            change = (new - old) / old * 100 if old else (100.0 if new else 0.0)
+            worse = -change if not metric.endswith(LOWER_IS_BETTER) else change
+            flag = ''
+            if worse > args.threshold:
+                flag = '  ⚠️ regression'
+                regressions += 1
+            print(f"  {name:32} {metric:16} {old:>12} -> {new:>12} ({change:+.1f}%){flag}")
+
+    if regressions:
+        print(f"❌ {regressions} metrics regressed by more than {args.threshold}%")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Local stand-in for the JSONBin API so storage benchmarks run offline.
+
+Serves GET /v3/b/<bin>/latest and PUT /v3/b/<bin> from memory, with an
+optional delay per request to mimic the round-trip to the real service.
+
+Usage:
+    python benchmarks/fake_jsonbin.py [--port 8787] [--latency-ms 40]
+    JSONBIN_BASE_URL=http://127.0.0.1:8787/v3 USER_STORE=jsonbin python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeJSONBinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def _bin_id(self, suffix=''):
+        parts = self.path.strip('/').split('/')
+        if len(parts) < 3 or parts[:2] != ['v3', 'b'] or '/'.join(parts[3:]) != suffix:
+            return None
+        return parts[2]
+
+    def _reply(self, status, payload):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.delay()
+        bin_id = self._bin_id('latest')
+        with self.server.lock:
+            document = self.server.bins.get(bin_id)
+            body = json.dumps(document).encode() if document is not None else None
+        if body is None:
+            self._reply(404, {'message': 'Bin not found'})
+        else:
+            self._reply(200, body)
+
+    def do_PUT(self):
+        self.server.delay()
+        bin_id = self._bin_id()
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            document = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400, {'message': 'Invalid JSON'})
+            return
+        if bin_id is None:
+            self._reply(404, {'message': 'Bin not found'})
+            return
+        with self.server.lock:
+            self.server.bins[bin_id] = document
+        self._reply(200, {'record': document})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeJSONBinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, FakeJSONBinHandler)
+        self.latency = latency
+        self.bins = {}
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v3'
+
+
+def start_fake_jsonbin(port=0, latency=0.0, bins=None):
+    """Serve a fake JSONBin on a background thread, returns the server"""
+    server = FakeJSONBinServer(('127.0.0.1', port), latency)
+    server.bins.update(bins or {})
+    threading.Thread(target=server.serve_forever, name='fake-jsonbin', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline stand-in for the JSONBin API')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeJSONBinServer(('127.0.0.1', args.port), args.latency_ms / 1000)
+    print(f"🗄️ Fake JSONBin listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
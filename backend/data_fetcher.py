@@ -1,213 +1,319 @@
-import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime
 import random
-import json
+import logging
+import time
+import zlib
+
+from symbols import SYMBOLS
+from timeframes import INTERVAL_SECONDS, PERIOD_POINTS, DEFAULT_PERIOD, HistoryStore
+from indicators import IndicatorCache, ewm
+from metrics import bar_generation_duration, bars_generated
+from wire import indicator_columns
+
+logger = logging.getLogger(__name__)
+
+# Share of the gap between the price and its trend level closed per hour.
+# Generated prices revert to that level, so long histories wander around it
+# instead of drifting into a bound; the stationary spread is about
+# volatility * 0.1 / sqrt(2 * rate)
+MEAN_REVERSION_RATE = 0.002
+
+# Largest share of the distance from the base price to a bound that a trend
+# may shift the level prices revert to
+MAX_TREND_SHIFT = 0.25
+
+# Walks are clamped block by block; each block converges in one pass
+# unless the price bounces between both bounds inside it
+_WALK_BLOCK = 4096
+
+def _bounded_walk(start_price, moves, low, high):
+    """Vectorized equivalent of price = clamp(price + move, low, high) per bar"""
+    prices = np.empty_like(moves)
+    price = start_price
+    for start in range(0, len(moves), _WALK_BLOCK):
+        path = price + np.cumsum(moves[start:start + _WALK_BLOCK])
+        if path.min() < low or path.max() > high:
+            # Two-sided Skorokhod reflection: alternate the lower and upper
+            # pushes until neither changes
+            push_up = np.zeros_like(path)
+            push_down = np.zeros_like(path)
+            while True:
+                new_up = np.maximum.accumulate(np.maximum(low - (path - push_down), 0.0))
+                new_down = np.maximum.accumulate(np.maximum(path + new_up - high, 0.0))
+                if np.array_equal(new_up, push_up) and np.array_equal(new_down, push_down):
+                    break
+                push_up, push_down = new_up, new_down
+            path = path + push_up - push_down
+        prices[start:start + len(path)] = path
+        price = path[-1]
+    return prices
+
+def series_to_records(series):
+    """Convert a columnar series into the list of bar dicts the API returns"""
+    timestamps = [datetime.fromtimestamp(ts).isoformat() for ts in series['timestamp'].tolist()]
+    records = [
+        {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for ts, o, h, l, c, v in zip(
+            timestamps,
+            np.round(series['open'], 4).tolist(),
+            np.round(series['high'], 4).tolist(),
+            np.round(series['low'], 4).tolist(),
+            np.round(series['close'], 4).tolist(),
+            series['volume'].tolist()
+        )
+    ]
+    # Indicator columns, if any
+    for column, values in indicator_columns(series):
+        for record, value in zip(records, values):
+            record[column] = value
+    return records
 
 class DataFetcher:
-    def __init__(self):
+    def __init__(self, symbols=None):
+        # Instrument specs by symbol (see symbols.py)
+        self.symbols = symbols or SYMBOLS
+
         # Realistic starting prices
-        self.base_prices = {
-            'XAUUSD': 1950.0,  # Gold around $1950
-            'EURUSD': 1.0850   # EUR/USD around 1.0850
-        }
+        self.base_prices = {symbol: spec.base_price for symbol, spec in self.symbols.items()}
         
         # Current prices that will evolve realistically
         self.current_prices = self.base_prices.copy()
         
         # Store historical trends for realistic movement
         self.trends = {
-            'XAUUSD': {'direction': 1, 'strength': 0.3, 'volatility': 15},
-            'EURUSD': {'direction': -1, 'strength': 0.1, 'volatility': 0.005}
+            symbol: {'direction': spec.direction, 'strength': spec.strength, 'volatility': spec.volatility}
+            for symbol, spec in self.symbols.items()
         }
-        
-        # Market hours simulation (more activity during certain hours)
-        self.market_hours = {
-            'london_open': 8,   # 8 AM London
-            'london_close': 16, # 4 PM London  
-            'ny_open': 13,      # 1 PM London (8 AM NY)
-            'ny_close': 21      # 9 PM London (4 PM NY)
+
+        # Per-symbol arrays for batched ticks, by symbol list
+        self._tick_batches = {}
+
+        # Shared multi-timeframe chart history served by get_historical_data
+        self.history = HistoryStore(self)
+        # Indicator values kept up to date as that history grows
+        self.indicators = IndicatorCache()
+
+    def generate_series(self, symbol, points=100, interval='1h', seed=None,
+                        start_price=None, end_time=None):
+        """Generate OHLCV bars as whole arrays.
+
+        Returns a dict of numpy arrays keyed by timestamp (epoch seconds of
+        each bar's open), open, high, low, close and volume. The last bar
+        opens at end_time (defaults to the current bar), and passing a seed
+        makes the series reproducible.
+        """
+        started = time.perf_counter()
+        # One stream per column keeps a seeded series' prefix identical
+        # whatever the number of points
+        move_rng, high_rng, low_rng, close_rng, volume_rng = [
+            np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(5)
+        ]
+        step = INTERVAL_SECONDS.get(interval, INTERVAL_SECONDS['1d'])
+        if end_time is None:
+            end_time = int(datetime.now().timestamp()) // step * step
+        spec = self.symbols[symbol]
+        if start_price is None:
+            start_price = spec.base_price
+
+        timestamps = end_time - step * np.arange(points - 1, -1, -1, dtype=np.int64)
+
+        # Session activity follows the local clock, like datetime.now().hour
+        utc_offset = int(datetime.now().astimezone().utcoffset().total_seconds())
+        hours = (timestamps + utc_offset) // 3600 % 24
+        market_activity = spec.hourly_activity[hours]
+
+        # Noise capped per bar at the symbol's move cap, plus a pull
+        # towards the trend level. The parameters are per hour, so other bar
+        # lengths scale the noise with the square root of time
+        scale = step / 3600
+        trend = self.trends[symbol]
+        noise = move_rng.normal(0, trend['volatility'] * 0.1 * np.sqrt(scale), points) * market_activity
+        cap = spec.move_cap * np.sqrt(scale)
+        noise = np.clip(noise, -cap, cap)
+
+        # price[i] = price[i-1] + pull * (level - price[i-1]) + noise[i]
+        level = self._trend_level(symbol)
+        pull = 1.0 - np.exp(-MEAN_REVERSION_RATE * scale)
+        path = ewm(level + noise / pull, pull, start_price)
+        moves = np.diff(path, prepend=start_price)
+        prices = _bounded_walk(start_price, moves, *spec.bounds)
+
+        # OHLC envelopes around each bar's price
+        size = np.abs(moves)
+        open_prices = prices
+        high_prices = prices + size * high_rng.uniform(0.5, 2.0, points)
+        low_prices = prices - size * low_rng.uniform(0.5, 2.0, points)
+        close_prices = prices + close_rng.uniform(-1.0, 1.0, points) * size
+
+        # Ensure high/low are logical
+        high_prices = np.maximum(np.maximum(open_prices, close_prices), high_prices)
+        low_prices = np.minimum(np.minimum(open_prices, close_prices), low_prices)
+
+        # Volume based on market activity
+        volume = (spec.base_volume * scale * market_activity * volume_rng.uniform(0.8, 1.2, points)).astype(np.int64)
+
+        bar_generation_duration.observe(time.perf_counter() - started, interval)
+        bars_generated.inc(interval, amount=points)
+
+        return {
+            'timestamp': timestamps,
+            'open': open_prices,
+            'high': high_prices,
+            'low': low_prices,
+            'close': close_prices,
+            'volume': volume
         }
 
-    def _get_market_activity(self, hour):
-        """Simulate market activity based on time of day"""
-        if self.market_hours['london_open'] <= hour <= self.market_hours['london_close']:
-            return 1.5  # High activity during London hours
-        elif self.market_hours['ny_open'] <= hour <= self.market_hours['ny_close']:
-            return 2.0  # Highest activity during NY/London overlap
-        else:
-            return 0.5  # Low activity during Asian session
-
-    def _calculate_price_movement(self, symbol, hour):
-        """Calculate realistic price movement based on symbol and market conditions"""
+    def _trend_level(self, symbol):
+        """Price generated series revert to: the base price shifted by the trend.
+
+        The shift is the level where trend and reversion balance, but never
+        more than MAX_TREND_SHIFT of the way to the bound it points at.
+        """
+        spec = self.symbols[symbol]
         trend = self.trends[symbol]
-        market_activity = self._get_market_activity(hour)
-        
-        # Base movement based on trend
-        base_move = trend['direction'] * trend['strength'] * market_activity
-        
-        # Random component based on volatility
-        random_move = random.gauss(0, trend['volatility'] * 0.1) * market_activity
-        
-        # Combine movements
-        total_move = base_move + random_move
-        
-        # Ensure realistic bounds
-        if symbol == 'XAUUSD':
-            total_move = max(min(total_move, 20), -20)  # Max $20 move
-        else:
-            total_move = max(min(total_move, 0.02), -0.02)  # Max 2% move
-            
-        return total_move
+        bound = spec.bounds[1] if trend['direction'] > 0 else spec.bounds[0]
+        shift = min(trend['strength'] / MEAN_REVERSION_RATE,
+                    MAX_TREND_SHIFT * abs(bound - spec.base_price))
+        return spec.base_price + np.sign(trend['direction']) * shift
 
-    def generate_realistic_data(self, symbol, points=100, interval='1h'):
+    def generate_realistic_data(self, symbol, points=100, interval='1h', seed=None):
         """Generate completely realistic trading data"""
-        data = []
-        current_time = datetime.now() - timedelta(hours=points)
-        current_price = self.base_prices[symbol]
-        
-        for i in range(points):
-            hour = current_time.hour
-            minute = current_time.minute
-            
-            # Calculate price movement
-            price_move = self._calculate_price_movement(symbol, hour)
-            
-            # Update current price
-            current_price += price_move
-            
-            # Ensure price doesn't go to unrealistic levels
-            if symbol == 'XAUUSD':
-                current_price = max(1800, min(2200, current_price))  # Gold between 1800-2200
-            else:
-                current_price = max(1.05, min(1.12, current_price))  # EUR/USD between 1.05-1.12
-            
-            # Create realistic OHLC data
-            open_price = current_price
-            high_price = current_price + abs(price_move) * random.uniform(0.5, 2.0)
-            low_price = current_price - abs(price_move) * random.uniform(0.5, 2.0)
-            close_price = current_price + random.uniform(-abs(price_move), abs(price_move))
-            
-            # Ensure high/low are logical
-            high_price = max(open_price, close_price, high_price)
-            low_price = min(open_price, close_price, low_price)
-            
-            # Volume based on market activity
-            base_volume = 10000 if symbol == 'XAUUSD' else 50000
-            market_activity = self._get_market_activity(hour)
-            volume = int(base_volume * market_activity * random.uniform(0.8, 1.2))
-            
-            data.append({
-                'timestamp': current_time.isoformat(),
-                'open': round(open_price, 4),
-                'high': round(high_price, 4),
-                'low': round(low_price, 4),
-                'close': round(close_price, 4),
-                'volume': volume
-            })
-            
-            # Move to next time period
-            if interval == '1h':
-                current_time += timedelta(hours=1)
-            else:  # 1d
-                current_time += timedelta(days=1)
-        
-        # Update current price for real-time queries
-        self.current_prices[symbol] = close_price
-        
-        print(f"📊 Generated realistic demo data for {symbol}: {points} {interval} points")
-        print(f"📈 Final price: {close_price:.4f}")
+        series = self.generate_series(symbol, points, interval, seed=seed)
+        data = series_to_records(series)
+        close_price = float(series['close'][-1])
+
+        logger.debug('generated demo data symbol=%s points=%d interval=%s close=%.4f',
+                     symbol, points, interval, close_price)
         
         return data
 
+    def get_historical_series(self, symbol, period='5d', interval='1h', since=None, indicators=()):
+        """Columnar bars for a period, only those at or after since if given.
+
+        The bar at since itself is included so a client can refresh the
+        last bar it already holds. Each indicator (see indicators.py) adds
+        its columns, computed over the whole period.
+        """
+        if interval not in PERIOD_POINTS:
+            interval = '1d'
+        periods = PERIOD_POINTS[interval]
+        points = periods.get(period, periods[DEFAULT_PERIOD[interval]])
+
+        series = self.history.slice(symbol, interval, points)
+        if indicators:
+            series.update(self.indicators.compute(symbol, interval, series, indicators))
+        if since is not None:
+            first = int(np.searchsorted(series['timestamp'], since, side='left'))
+            series = {column: values[first:] for column, values in series.items()}
+        return series
+
     def get_historical_data(self, symbol, period='5d', interval='1h'):
         """Get historical data - completely self-contained"""
         try:
-            print(f"🎯 Generating historical data for {symbol} ({period}, {interval})")
-            
-            # Calculate number of points needed
-            if interval == '1h':
-                if period == '1d':
-                    points = 24
-                elif period == '5d':
-                    points = 24 * 5
-                else:  # 1mo
-                    points = 24 * 30
-            else:  # 1d
-                if period == '1mo':
-                    points = 30
-                else:  # 3mo
-                    points = 90
+            return series_to_records(self.get_historical_series(symbol, period, interval))
             
-            data = self.generate_realistic_data(symbol, points, interval)
-            return data
-            
-        except Exception as e:
-            print(f"❌ Error in get_historical_data: {str(e)}")
+        except Exception:
+            logger.exception('get_historical_data failed symbol=%s period=%s interval=%s',
+                             symbol, period, interval)
             # Fallback to basic data
             return self.generate_realistic_data(symbol, 50, interval)
 
     def get_current_price(self, symbol):
-        """Get current price with realistic evolution"""
+        """Get the latest price published by the tick engine"""
         try:
-            # Simulate small price movement from last known price
-            current_price = self.current_prices[symbol]
-            hour = datetime.now().hour
-            
-            # Small random walk
-            if symbol == 'XAUUSD':
-                change = random.uniform(-0.5, 0.5)
-            else:
-                change = random.uniform(-0.0005, 0.0005)
-                
-            # Apply market activity
-            market_activity = self._get_market_activity(hour)
-            change *= market_activity
-            
-            new_price = current_price + change
-            
-            # Keep within realistic bounds
-            if symbol == 'XAUUSD':
-                new_price = max(1800, min(2200, new_price))
-            else:
-                new_price = max(1.05, min(1.12, new_price))
-            
-            self.current_prices[symbol] = new_price
-            
-            print(f"🎯 Current {symbol} price: {new_price:.4f}")
-            return new_price
-            
-        except Exception as e:
-            print(f"❌ Error in get_current_price: {str(e)}")
+            return self.current_prices[symbol]
+        except Exception:
+            logger.exception('get_current_price failed symbol=%s', symbol)
             return self.base_prices[symbol]
 
+    def advance_price(self, symbol):
+        """Move the live price one tick with realistic evolution"""
+        return self.advance_prices([symbol])[0]
+
+    def _tick_batch(self, symbols):
+        key = tuple(symbols)
+        batch = self._tick_batches.get(key)
+        if batch is None:
+            specs = [self.symbols[symbol] for symbol in symbols]
+            batch = self._tick_batches[key] = {
+                'tick_move': np.array([spec.tick_move for spec in specs]),
+                'tick_size': np.array([spec.tick_size for spec in specs]),
+                'low': np.array([spec.bounds[0] for spec in specs]),
+                'high': np.array([spec.bounds[1] for spec in specs]),
+                # hour -> activity of every symbol
+                'activity': np.array([spec.hourly_activity for spec in specs]).T.copy()
+            }
+        return batch
+
+    def advance_prices(self, symbols):
+        """Move several live prices one tick in one vectorized step.
+
+        Each price takes a random step of up to its tick_move, scaled by
+        session activity, kept inside its bounds and on its tick grid.
+        """
+        batch = self._tick_batch(symbols)
+        current = np.fromiter((self.current_prices[symbol] for symbol in symbols), np.float64, len(symbols))
+        change = np.random.uniform(-1.0, 1.0, len(symbols)) * batch['tick_move']
+        change *= batch['activity'][datetime.now().hour]
+
+        prices = np.clip(current + change, batch['low'], batch['high'])
+        prices = np.round(np.round(prices / batch['tick_size']) * batch['tick_size'], 10).tolist()
+
+        now = time.time()
+        for symbol, price in zip(symbols, prices):
+            self.current_prices[symbol] = price
+            self.history.on_tick(symbol, price, now)
+        return prices
+
+    def generate_replay_series(self, symbol, start_time, end_time, interval='1h', seed=None):
+        """Reproducible bars between two epoch times for replay and backtests.
+
+        Unless a seed is given, the series is seeded from the symbol, interval
+        and start time with a stable hash, so every process generates the same
+        bars for the same request.
+        """
+        step = INTERVAL_SECONDS.get(interval, INTERVAL_SECONDS['1d'])
+        start_time = int(start_time) // step * step
+        points = max(1, (int(end_time) - start_time) // step + 1)
+        if seed is None:
+            seed = zlib.crc32(f'{symbol}:{interval}:{start_time}'.encode())
+
+        # Start somewhere inside the symbol's range, also derived from the seed
+        low, high = self.symbols[symbol].bounds
+        start_price = low + (seed % 10000) / 10000 * (high - low)
+
+        return self.generate_series(
+            symbol, points, interval, seed=seed,
+            start_price=start_price,
+            end_time=start_time + (points - 1) * step
+        )
+
     def get_data_at_date(self, symbol, target_date):
         """Get data for replay mode"""
         try:
-            # For replay, we'll generate data based on the target date
-            # This creates consistent but date-specific prices
+            # The bar comes from the reproducible replay series of that day
             target_dt = datetime.fromisoformat(target_date.replace('Z', '+00:00'))
-            
-            # Use date to seed random but consistent price
-            date_seed = hash(target_date) % 10000 / 10000  # 0-1 based on date
-            
-            if symbol == 'XAUUSD':
-                base_price = 1800 + (date_seed * 400)  # 1800-2200 based on date
-            else:
-                base_price = 1.05 + (date_seed * 0.07)  # 1.05-1.12 based on date
-            
+            target_ts = int(target_dt.timestamp())
+            day_start = target_ts // 86400 * 86400
+
+            series = self.generate_replay_series(symbol, day_start, day_start + 86400 - 3600, '1h')
+            index = (target_ts - day_start) // 3600
+
             result = {
                 'timestamp': target_date,
-                'open': round(base_price - 0.5, 4),
-                'high': round(base_price + 1.2, 4),
-                'low': round(base_price - 1.2, 4),
-                'close': round(base_price, 4)
+                'open': round(float(series['open'][index]), 4),
+                'high': round(float(series['high'][index]), 4),
+                'low': round(float(series['low'][index]), 4),
+                'close': round(float(series['close'][index]), 4)
             }
-            
-            print(f"🎯 Replay data for {symbol} on {target_date}: {result['close']:.4f}")
+
+            logger.debug('replay bar symbol=%s date=%s close=%.4f', symbol, target_date, result['close'])
             return result
-            
-        except Exception as e:
-            print(f"❌ Error in get_data_at_date: {str(e)}")
+
+        except Exception:
+            logger.exception('get_data_at_date failed symbol=%s date=%s', symbol, target_date)
             return {
                 'timestamp': target_date,
                 'open': self.base_prices[symbol],
@@ -228,4 +334,4 @@ class DataFetcher:
                 trend['volatility'] * 1.2
             )
         
-        print(f"📈 Updated {symbol} trend: {self.trends[symbol]}")
\ No newline at end of file
+        logger.info('updated trend symbol=%s trend=%s', symbol, self.trends[symbol])
\ No newline at end of file
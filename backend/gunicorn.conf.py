@@ -0,0 +1,104 @@
+"""Multi-worker deployment: gunicorn -c gunicorn.conf.py
+
+The master starts the market process (shared_market.py) before forking, so
+every worker reads the same prices and chart history from it. Each worker
+gets a stable slot that decides which accounts it owns (see ownership.py),
+and its own portfolio journal and order ledger; a restarted worker takes
+over its slot.
+
+Before forking, the master drains every worker's portfolio journal into the
+store and, when the worker count changed, moves each account's order history
+to the ledger of its new owner. That runs in a subprocess because backend
+modules read their paths and the worker count when they are imported.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 2)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Price streams stay open, so don't treat a quiet worker as hung
+timeout = 120
+wsgi_app = 'app:create_app()'
+chdir = BACKEND_DIR
+
+run_dir = os.getenv('TRADING_RUN_DIR', tempfile.gettempdir())
+os.environ.setdefault('OWNER_SOCKET_DIR', run_dir)
+os.environ.setdefault('MARKET_SOCKET', os.path.join(run_dir, 'trading-market.sock'))
+os.environ.setdefault('MARKET_SHM_NAME', f'trading-prices-{os.getpid()}')
+
+if os.getenv('USER_STORE') == 'jsonbin':
+    # Workers flush different accounts into the same document independently,
+    # which would lose updates
+    raise RuntimeError('Multi-worker mode needs the sqlite user store')
+
+_market = None
+
+# Run before forking with WORKER_COUNT set to the new worker count
+RECOVERY = '''
+from ledger import LEDGER_PATH, rebalance
+from ownership import WORKER_COUNT, owner_of
+from portfolio_cache import JOURNAL_PATH, recover_worker_journals
+from storage import get_store
+
+recover_worker_journals(JOURNAL_PATH, get_store())
+rebalance(LEDGER_PATH, WORKER_COUNT, owner_of)
+'''
+
+
+def _wait_for_socket(path, deadline):
+    while time.monotonic() < deadline:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def on_starting(server):
+    global _market
+    # Ownership hashes over the worker count, so it must not change while
+    # running (no TTIN/TTOU)
+    os.environ['WORKER_COUNT'] = str(server.num_workers)
+    subprocess.run([sys.executable, '-c', RECOVERY], cwd=BACKEND_DIR, check=True)
+    _market = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'shared_market.py')],
+                               cwd=BACKEND_DIR)
+    if not _wait_for_socket(os.environ['MARKET_SOCKET'], time.monotonic() + 60):
+        _market.kill()
+        raise RuntimeError('Market process did not start')
+    server.log.info('Market process started (pid %s)', _market.pid)
+
+
+def pre_fork(server, worker):
+    # Lowest slot not held by a live worker, so a replacement inherits the
+    # accounts of the worker it replaces
+    taken = {getattr(live, 'slot', None) for live in server.WORKERS.values()}
+    worker.slot = min(slot for slot in range(server.num_workers + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    os.environ['WORKER_SLOT'] = str(worker.slot)
+    if server.num_workers == 1:
+        # A lone worker owns every account and uses the single-process files
+        return
+    journal = os.getenv('PORTFOLIO_JOURNAL_PATH', os.path.join(BACKEND_DIR, 'portfolio.journal'))
+    root, ext = os.path.splitext(journal)
+    os.environ['PORTFOLIO_JOURNAL_PATH'] = f'{root}-{worker.slot}{ext}'
+    ledger = os.getenv('ORDER_LEDGER_PATH', os.path.join(BACKEND_DIR, 'orders.ledger'))
+    root, ext = os.path.splitext(ledger)
+    os.environ['ORDER_LEDGER_PATH'] = f'{root}-{worker.slot}{ext}'
+
+
+def on_exit(server):
+    if _market is not None:
+        _market.terminate()
+        _market.wait(timeout=10)
@@ -0,0 +1,331 @@
+"""Technical indicators over chart bars, kept current as bars append.
+
+Indicators are requested as name:param[:param] specs, for example sma:20,
+ema:50, rsi:14, bb:20:2 or atr:14. The first request for a (symbol,
+interval, window size, spec) computes the whole window with vectorized
+numpy windows; after that the series keeps its values and smoothing state up
+to the last closed bar, so a refresh only computes the bars closed since and
+the forming bar.
+
+EMA, RSI and ATR are seeded with the average of the window's first bars,
+and that seed is still felt long after, so once the window slides past a
+closed bar they are computed again over the whole window; any other refresh
+only computes the forming bar.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# (symbol, interval, spec) series kept in memory
+INDICATOR_CACHE_SIZE = int(os.getenv('INDICATOR_CACHE_SIZE', '256'))
+
+# Limits on what one request may ask for
+MAX_INDICATORS = 8
+MAX_PERIOD = 500
+
+# Largest factor a smoothing block may scale values by; keeps the scaled
+# prefix sums in ewm well inside float64 precision
+_EWM_RANGE = 1e8
+
+
+def ewm(values, alpha, initial):
+    """y[i] = y[i-1] + alpha * (values[i] - y[i-1]) starting from y[-1] = initial.
+
+    Within a block, y[i] = decay**(i+1) * (initial + alpha * sum(values[j] /
+    decay**(j+1))), so each block is one cumsum instead of a Python loop.
+    """
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return np.array(values, dtype=np.float64)
+
+    out = np.empty(len(values))
+    block = max(1, int(np.log(_EWM_RANGE) / -np.log(decay)))
+    previous = initial
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        smoothed = powers * (previous + alpha * np.cumsum(chunk / powers))
+        out[start:start + len(chunk)] = smoothed
+        previous = smoothed[-1]
+    return out
+
+
+def rolling(values, period, func):
+    """func over each trailing window, NaN until the first full window"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = func(sliding_window_view(values, period), axis=1)
+    return out
+
+
+def true_range(high, low, close, previous_close=None):
+    """True range per bar; the first bar has no previous close unless given"""
+    prior = np.empty(len(close))
+    prior[1:] = close[:-1]
+    prior[:1] = close[:1] if previous_close is None else previous_close
+    return np.maximum(high - low, np.maximum(np.abs(high - prior), np.abs(low - prior)))
+
+
+class Indicator:
+    """Base class; compute(bars, start, state) returns (values for bars[start:], state).
+
+    state is whatever the indicator carries from bar start - 1 (None when
+    nothing is known yet), and the returned state is as of the last bar.
+    """
+
+    defaults = ()
+    # Whether values depend on where the window starts
+    seeded = False
+
+    def __init__(self, *params):
+        self.params = params
+        self.key = '_'.join([self.name] + [f'{param:g}' for param in params])
+        self.columns = (self.key,)
+
+    @property
+    def warmup(self):
+        """Leading bars of a window that have no value"""
+        return self.params[0] - 1
+
+    def compute(self, bars, start, state):
+        raise NotImplementedError
+
+
+class SMA(Indicator):
+    name = 'sma'
+    defaults = (20,)
+
+    def compute(self, bars, start, state):
+        period = self.params[0]
+        close = bars['close'][max(0, start - period + 1):]
+        values = rolling(close, period, np.mean)
+        return {self.key: values[len(values) - (len(bars['close']) - start):]}, None
+
+
+class Bollinger(Indicator):
+    name = 'bb'
+    defaults = (20, 2)
+
+    def __init__(self, period, width):
+        super().__init__(period, width)
+        self.columns = tuple(f'{self.key}_{band}' for band in ('mid', 'upper', 'lower'))
+
+    def compute(self, bars, start, state):
+        period, width = self.params
+        close = bars['close'][max(0, start - period + 1):]
+        skip = len(close) - (len(bars['close']) - start)
+        mid = rolling(close, period, np.mean)[skip:]
+        spread = width * rolling(close, period, np.std)[skip:]
+        mid_key, upper_key, lower_key = self.columns
+        return {mid_key: mid, upper_key: mid + spread, lower_key: mid - spread}, None
+
+
+class EMA(Indicator):
+    """Exponential average seeded with the simple average of the first bars"""
+
+    name = 'ema'
+    seeded = True
+    defaults = (20,)
+
+    def compute(self, bars, start, state):
+        period = self.params[0]
+        close = bars['close']
+        if state is not None:
+            values = ewm(close[start:], 2.0 / (period + 1), state)
+            return {self.key: values}, values[-1] if len(values) else state
+
+        values = np.full(len(close), np.nan)
+        if len(close) >= period:
+            seed = close[:period].mean()
+            values[period - 1] = seed
+            values[period:] = ewm(close[period:], 2.0 / (period + 1), seed)
+            state = values[-1]
+        return {self.key: values[start:]}, state
+
+
+class RSI(Indicator):
+    """Relative strength index with Wilder smoothing; state is (avg gain, avg loss)"""
+
+    name = 'rsi'
+    seeded = True
+    defaults = (14,)
+
+    @staticmethod
+    def _rsi(gain, loss):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = 100.0 * gain / (gain + loss)
+        values[(gain + loss) == 0] = 50.0
+        return values
+
+    @property
+    def warmup(self):
+        return self.params[0]
+
+    def compute(self, bars, start, state):
+        period = self.params[0]
+        close = bars['close']
+        if state is not None:
+            change = np.diff(close[start - 1:])
+            gain = ewm(np.maximum(change, 0.0), 1.0 / period, state[0])
+            loss = ewm(np.maximum(-change, 0.0), 1.0 / period, state[1])
+            if len(change):
+                state = (gain[-1], loss[-1])
+            return {self.key: self._rsi(gain, loss)}, state
+
+        values = np.full(len(close), np.nan)
+        if len(close) > period:
+            change = np.diff(close)
+            gains = np.maximum(change, 0.0)
+            losses = np.maximum(-change, 0.0)
+            gain = np.concatenate([[gains[:period].mean()],
+                                   ewm(gains[period:], 1.0 / period, gains[:period].mean())])
+            loss = np.concatenate([[losses[:period].mean()],
+                                   ewm(losses[period:], 1.0 / period, losses[:period].mean())])
+            values[period:] = self._rsi(gain, loss)
+            state = (gain[-1], loss[-1])
+        return {self.key: values[start:]}, state
+
+
+class ATR(Indicator):
+    """Average true range with Wilder smoothing"""
+
+    name = 'atr'
+    seeded = True
+    defaults = (14,)
+
+    def compute(self, bars, start, state):
+        period = self.params[0]
+        high, low, close = bars['high'], bars['low'], bars['close']
+        if state is not None:
+            ranges = true_range(high[start:], low[start:], close[start:], close[start - 1])
+            values = ewm(ranges, 1.0 / period, state)
+            return {self.key: values}, values[-1] if len(values) else state
+
+        values = np.full(len(close), np.nan)
+        if len(close) >= period:
+            ranges = true_range(high, low, close)
+            seed = ranges[:period].mean()
+            values[period - 1] = seed
+            values[period:] = ewm(ranges[period:], 1.0 / period, seed)
+            state = values[-1]
+        return {self.key: values[start:]}, state
+
+
+INDICATORS = {indicator.name: indicator for indicator in (SMA, EMA, RSI, Bollinger, ATR)}
+
+
+def parse_indicators(text):
+    """Indicators for a comma separated list of specs, e.g. 'sma:20,bb:20:2'.
+
+    Raises ValueError for unknown names or out of range parameters.
+    """
+    indicators = []
+    for spec in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, *params = spec.split(':')
+        cls = INDICATORS.get(name.lower())
+        if cls is None:
+            raise ValueError(f'Unknown indicator: {name}')
+        if len(params) > len(cls.defaults):
+            raise ValueError(f'Too many parameters for {name}')
+
+        values = list(cls.defaults)
+        for i, param in enumerate(params):
+            try:
+                values[i] = int(param) if i == 0 else float(param)
+            except ValueError:
+                raise ValueError(f'Invalid parameter for {name}: {param}')
+        if not 1 <= values[0] <= MAX_PERIOD or any(value <= 0 for value in values[1:]):
+            raise ValueError(f'Parameter out of range for {name}')
+        indicators.append(cls(*values))
+
+    if len(indicators) > MAX_INDICATORS:
+        raise ValueError(f'At most {MAX_INDICATORS} indicators per request')
+    return indicators
+
+
+class IndicatorSeries:
+    """One indicator's values over the closed bars of a symbol and interval"""
+
+    def __init__(self, indicator):
+        self.indicator = indicator
+        self.lock = threading.Lock()
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.values = {column: np.empty(0) for column in indicator.columns}
+        self.state = None
+        self._last_close = None
+
+    def _known(self, timestamps, closed):
+        """How many of the window's closed bars are already computed, None if unusable"""
+        if not len(self.timestamps) or self.timestamps[0] > timestamps[0]:
+            return None
+        last = int(np.searchsorted(timestamps[:closed], self.timestamps[-1]))
+        if last >= closed or timestamps[last] != self.timestamps[-1]:
+            return None
+        return last + 1
+
+    def refresh(self, bars):
+        """Values aligned to bars; the last bar is treated as still forming"""
+        timestamps = bars['timestamp']
+        closed = len(timestamps) - 1
+        if closed < 0:
+            return {column: np.empty(0) for column in self.indicator.columns}
+
+        closed_bars = {name: values[:closed] for name, values in bars.items()}
+        known = self._known(timestamps, closed)
+        if known is not None and bars['close'][known - 1] != self._last_close:
+            # Same times but different bars - the history was regenerated
+            known = None
+        if known is not None and self.indicator.seeded and self.timestamps[0] != timestamps[0]:
+            # The window moved on, so the seed from its first bars changed
+            known = None
+
+        if known is None:
+            self.values, self.state = self.indicator.compute(closed_bars, 0, None)
+            self.timestamps = timestamps[:closed].copy()
+        elif known < closed:
+            added, self.state = self.indicator.compute(closed_bars, known, self.state)
+            self.timestamps = np.concatenate([self.timestamps, timestamps[known:closed]])[-closed:]
+            self.values = {column: np.concatenate([self.values[column], added[column]])[-closed:]
+                           for column in self.indicator.columns}
+        if closed:
+            self._last_close = bars['close'][closed - 1]
+
+        forming, _ = self.indicator.compute(bars, closed, self.state)
+        columns = {column: np.concatenate([self.values[column][len(self.values[column]) - closed:],
+                                           forming[column]])
+                   for column in self.indicator.columns}
+        # Values carried over from bars before the window start
+        for values in columns.values():
+            values[:self.indicator.warmup] = np.nan
+        return columns
+
+
+class IndicatorCache:
+    """IndicatorSeries per (symbol, interval, window size, spec), least recently used dropped"""
+
+    def __init__(self, max_entries=INDICATOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, indicator):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = IndicatorSeries(indicator)
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_entries:
+                self._series.popitem(last=False)
+        return series
+
+    def compute(self, symbol, interval, bars, indicators):
+        """Columns for each indicator, aligned to bars"""
+        columns = {}
+        for indicator in indicators:
+            series = self._get((symbol, interval, len(bars['timestamp']), indicator.key), indicator)
+            with series.lock:
+                columns.update(series.refresh(bars))
+        return columns
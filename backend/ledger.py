@@ -0,0 +1,333 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+import numpy as np
+
+from metrics import ledger_events
+from ownership import multi_worker, slot_files, slot_path
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = os.getenv(
+    'ORDER_LEDGER_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'orders.ledger')
+)
+LEDGER_FSYNC = os.getenv('ORDER_LEDGER_FSYNC', '1') != '0'
+# Events appended between snapshots of the history index; startup loads the
+# latest snapshot and only replays the events written after it
+LEDGER_SNAPSHOT_EVERY = int(os.getenv('ORDER_LEDGER_SNAPSHOT_EVERY', '5000'))
+
+# Largest page the history query returns
+MAX_HISTORY_PAGE = 500
+
+
+def event_time(order, field='close_time'):
+    """Epoch seconds of an order's ISO timestamp, 0 when it has none"""
+    try:
+        return datetime.fromisoformat(order[field]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+class _TradeIndex:
+    """Close times and ledger offsets of one user's trades, oldest first"""
+
+    __slots__ = ('times', 'offsets')
+
+    def __init__(self, times=b'', offsets=b''):
+        self.times = array('d', times)
+        self.offsets = array('q', offsets)
+
+    def add(self, at, offset):
+        self.times.append(at)
+        self.offsets.append(offset)
+
+
+class OrderLedger:
+    """Append-only log of order events with a per-user trade history index.
+
+    Each line is one event: {"seq", "time", "user", "event", "order"} with
+    event "open" or "close", so recording a trade costs one appended line no
+    matter how long the account has been trading. Close events are indexed
+    by user and time, and history pages are read back from their offsets.
+
+    Every snapshot_every events the index is written to a snapshot next to
+    the ledger along with the offset it covers, so a restart loads the
+    snapshot and replays only the tail of the ledger.
+    """
+
+    def __init__(self, path=LEDGER_PATH, fsync=LEDGER_FSYNC, snapshot_every=LEDGER_SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+
+        self._index = {}
+        self._seq = 0
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+
+        self._recover()
+        self._file = open(self.path, 'ab')
+
+    def order_opened(self, user_id, order, user_data):
+        self.append(user_id, 'open', order, event_time(order, 'open_time') or time.time())
+
+    def order_closed(self, user_id, order, user_data):
+        self.append(user_id, 'close', order, time.time())
+
+    def append(self, user_id, event, order, at):
+        with self._lock:
+            self._seq += 1
+            line = json.dumps({'seq': self._seq, 'time': at, 'user': user_id,
+                               'event': event, 'order': order}).encode() + b'\n'
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            if event == 'close':
+                self._add(user_id, at, offset)
+            self._since_snapshot += 1
+            due = self._since_snapshot >= self.snapshot_every
+        ledger_events.inc(event)
+
+        if due:
+            self.snapshot()
+
+    def import_closed(self, user_id, orders):
+        """Record closed orders kept in an account from before the ledger"""
+        for order in sorted(orders, key=event_time):
+            self.append(user_id, 'close', order, event_time(order))
+
+    def history(self, user_id, limit=50, before=None, since=None, until=None):
+        """Closed trades newest first, one page at a time.
+
+        since/until bound the close time (epoch seconds). Pass the returned
+        cursor back as before for the next, older page; it is None on the
+        last page.
+        """
+        limit = max(1, min(limit, MAX_HISTORY_PAGE))
+        with self._lock:
+            index = self._index.get(user_id)
+            if index is None:
+                return {'trades': [], 'total': 0, 'cursor': None}
+            lo = bisect_left(index.times, since) if since is not None else 0
+            hi = bisect_right(index.times, until) if until is not None else len(index.times)
+            total = max(hi - lo, 0)
+            if before is not None:
+                hi = min(hi, before)
+            start = max(lo, hi - limit)
+            offsets = index.offsets[start:hi]
+
+        trades = []
+        with open(self.path, 'rb') as f:
+            for offset in reversed(offsets):
+                f.seek(offset)
+                trades.append(json.loads(f.readline())['order'])
+        return {'trades': trades, 'total': total, 'cursor': start if start > lo else None}
+
+    def snapshot(self):
+        """Write the history index and the ledger offset it covers"""
+        with self._snapshot_lock:
+            with self._lock:
+                self._since_snapshot = 0
+                offset = self._file.tell()
+                seq = self._seq
+                users = list(self._index)
+                counts = np.array([len(self._index[u].times) for u in users], dtype=np.int64)
+                times = np.concatenate([np.frombuffer(self._index[u].times, dtype=np.float64)
+                                        for u in users] or [np.empty(0)])
+                offsets = np.concatenate([np.frombuffer(self._index[u].offsets, dtype=np.int64)
+                                          for u in users] or [np.empty(0, dtype=np.int64)])
+
+            header = json.dumps({'seq': seq, 'offset': offset, 'users': users})
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, header=np.array(header), counts=counts, times=times, offsets=offsets)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+    def close(self):
+        self.snapshot()
+        with self._lock:
+            self._file.close()
+
+    def _add(self, user_id, at, offset):
+        index = self._index.get(user_id)
+        if index is None:
+            index = self._index[user_id] = _TradeIndex()
+        index.add(at, offset)
+
+    def _load_snapshot(self, size):
+        """Restore the index from the snapshot, returns the offset to replay from"""
+        try:
+            with np.load(self.snapshot_path) as snapshot:
+                header = json.loads(str(snapshot['header']))
+                counts = snapshot['counts']
+                times = snapshot['times']
+                offsets = snapshot['offsets']
+        except FileNotFoundError:
+            return 0
+        except Exception:
+            logger.warning('ignoring unreadable ledger snapshot path=%s', self.snapshot_path)
+            return 0
+
+        if header['offset'] > size:
+            # The ledger was replaced or truncated since
+            logger.warning('ledger snapshot is ahead of the ledger, rebuilding path=%s', self.path)
+            return 0
+
+        bounds = np.cumsum(counts)
+        for user_id, end, count in zip(header['users'], bounds, counts):
+            self._index[user_id] = _TradeIndex(times[end - count:end].tobytes(),
+                                               offsets[end - count:end].tobytes())
+        self._seq = header['seq']
+        return header['offset']
+
+    def _recover(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        start = self._load_snapshot(size)
+        offset = start
+        replayed = 0
+
+        if size > start:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('torn line')
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn final write - it was never acknowledged
+                        break
+                    self._seq = entry['seq']
+                    if entry['event'] == 'close':
+                        self._add(entry['user'], entry['time'], offset)
+                    offset += len(line)
+                    replayed += 1
+            if offset < size:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(offset)
+
+        self._since_snapshot = replayed
+        if replayed:
+            logger.info('replayed order ledger tail events=%d from_offset=%d', replayed, start)
+
+
+def _read_events(path):
+    """Events of a ledger file up to the first torn or unreadable line"""
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('torn line')
+                entry = json.loads(line)
+            except ValueError:
+                # Torn final write - it was never acknowledged
+                return
+            yield entry
+
+
+def rebalance(path, count, owner_of):
+    """Move every account's events into the ledger of the slot that owns it.
+
+    A single process (count 1) keeps its ledger at path, count worker slots
+    use slot_path(path, slot). path.layout records the count the files were
+    last laid out for, so they are only rewritten when it changes. The new
+    files are staged in path.rebalance and moved in once complete; a crash
+    in between is finished on the next start.
+    """
+    layout_path = path + '.layout'
+    staging = path + '.rebalance'
+    marker = os.path.join(staging, 'complete')
+    directory = os.path.dirname(os.path.abspath(path))
+
+    if not os.path.exists(marker):
+        try:
+            with open(layout_path) as f:
+                if int(f.read()) == count:
+                    return
+        except (FileNotFoundError, ValueError):
+            pass
+
+        sources = [source for source in [path] + slot_files(path) if os.path.exists(source)]
+        if not sources or (count == 1 and sources == [path]):
+            _write_layout(layout_path, count)
+            return
+
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        targets = {}
+        moved = 0
+        for source in sources:
+            for entry in _read_events(source):
+                slot = owner_of(entry['user']) if count > 1 else 0
+                target = targets.get(slot)
+                if target is None:
+                    name = os.path.basename(slot_path(path, slot) if count > 1 else path)
+                    target = targets[slot] = [open(os.path.join(staging, name), 'wb'), 0]
+                target[1] += 1
+                entry['seq'] = target[1]
+                target[0].write(json.dumps(entry).encode() + b'\n')
+                moved += 1
+        for target, _ in targets.values():
+            target.flush()
+            os.fsync(target.fileno())
+            target.close()
+        # From here on the staged files are the ledger
+        with open(marker, 'w') as f:
+            json.dump([name for name in os.listdir(staging) if name != 'complete'], f)
+            f.flush()
+            os.fsync(f.fileno())
+        logger.warning('rebalancing order ledgers events=%d from=%d files to=%d slots',
+                       moved, len(sources), count)
+
+    with open(marker) as f:
+        keep = set(json.load(f))
+    for old in [path] + slot_files(path):
+        if os.path.basename(old) not in keep and os.path.exists(old):
+            os.remove(old)
+        # Indexes are rebuilt from the new files
+        if os.path.exists(old + '.snapshot'):
+            os.remove(old + '.snapshot')
+    for name in keep:
+        staged = os.path.join(staging, name)
+        if os.path.exists(staged):
+            os.replace(staged, os.path.join(directory, name))
+    shutil.rmtree(staging)
+    _write_layout(layout_path, count)
+
+
+def _write_layout(layout_path, count):
+    with open(layout_path, 'w') as f:
+        f.write(str(count))
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_order_ledger():
+    """Return the process-wide order ledger, opening it on first use"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                if not multi_worker():
+                    # Pick up history left in per-worker ledgers; in multi-worker
+                    # mode gunicorn.conf.py does this before forking
+                    rebalance(LEDGER_PATH, 1, None)
+                _ledger = OrderLedger()
+                atexit.register(_ledger.close)
+    return _ledger
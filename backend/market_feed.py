@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import tick_duration, stream_subscribers
+
+logger = logging.getLogger(__name__)
+
+# Seconds between price ticks, shared by every client
+TICK_INTERVAL = float(os.getenv('TICK_INTERVAL', '1.0'))
+
+# Ticks buffered per subscriber before the oldest ones are dropped
+SUBSCRIBER_BUFFER = 256
+
+
+class TickEngine:
+    """Single clock that advances every symbol's price and fans ticks out.
+
+    Prices move once per tick_interval no matter how many clients are
+    connected. Streaming clients get their own queue through subscribe();
+    in-process consumers register a callback with add_listener().
+    """
+
+    def __init__(self, data_fetcher, symbols, tick_interval=TICK_INTERVAL):
+        self.data_fetcher = data_fetcher
+        self.symbols = list(symbols)
+        self.tick_interval = tick_interval
+
+        self.last_ticks = {}
+        self._subscribers = set()
+        self._listeners = []
+        self._batch_listeners = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Generate the chart history first so the live price continues from it
+        self.data_fetcher.history.warm(self.symbols)
+        for symbol in self.symbols:
+            self.last_ticks[symbol] = {
+                'symbol': symbol,
+                'price': self.data_fetcher.get_current_price(symbol),
+                'time': time.time()
+            }
+        self._thread = threading.Thread(target=self._run, name='tick-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.tick_interval + 1)
+            self._thread = None
+
+    def subscribe(self):
+        """Return a queue receiving every tick from now on"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        stream_subscribers.inc('wsgi')
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                return
+            self._subscribers.discard(subscriber)
+        stream_subscribers.dec('wsgi')
+
+    def add_listener(self, callback):
+        """Call callback(tick) on the engine thread for every tick"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def add_batch_listener(self, callback):
+        """Call callback(ticks) on the engine thread once per tick, with every symbol that moved"""
+        with self._lock:
+            self._batch_listeners.append(callback)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stopped.is_set():
+            self._tick()
+            # Fixed schedule, so slow ticks don't stretch the clock
+            next_tick += self.tick_interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            self._stopped.wait(delay)
+
+    def _tick(self):
+        started = time.perf_counter()
+        now = time.time()
+        # Every symbol moves in one batched step
+        prices = self.data_fetcher.advance_prices(self.symbols)
+        ticks = [
+            {'symbol': symbol, 'price': price, 'time': now}
+            for symbol, price in zip(self.symbols, prices)
+        ]
+        self._dispatch(ticks)
+        tick_duration.observe(time.perf_counter() - started)
+
+    def _dispatch(self, ticks):
+        """Record ticks and hand them to listeners and subscribers, then to batch listeners"""
+        for tick in ticks:
+            self.last_ticks[tick['symbol']] = tick
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+            batch_listeners = list(self._batch_listeners)
+
+        for tick in ticks:
+            for callback in listeners:
+                try:
+                    callback(tick)
+                except Exception:
+                    logger.exception('tick listener failed symbol=%s', tick['symbol'])
+
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(tick)
+                except queue.Full:
+                    # Slow client - drop its oldest tick, prices only need the latest
+                    try:
+                        subscriber.get_nowait()
+                        subscriber.put_nowait(tick)
+                    except (queue.Empty, queue.Full):
+                        pass
+
+        for callback in batch_listeners:
+            try:
+                callback(ticks)
+            except Exception:
+                logger.exception('tick batch listener failed')
+
+
+class AsyncTickFanout:
+    """Delivers ticks to asyncio queues on one event loop.
+
+    The tick thread hands every tick to the loop once, so each streaming
+    client costs a queue rather than a thread.
+    """
+
+    def __init__(self, tick_engine, loop):
+        self.tick_engine = tick_engine
+        self.loop = loop
+        self._subscribers = set()
+        tick_engine.add_listener(self._on_tick)
+
+    def close(self):
+        self.tick_engine.remove_listener(self._on_tick)
+
+    def subscribe(self):
+        subscriber = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self._subscribers.add(subscriber)
+        stream_subscribers.inc('asgi')
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self._subscribers:
+            self._subscribers.discard(subscriber)
+            stream_subscribers.dec('asgi')
+
+    def _on_tick(self, tick):
+        self.loop.call_soon_threadsafe(self._publish, tick)
+
+    def _publish(self, tick):
+        for subscriber in self._subscribers:
+            if subscriber.full():
+                # Slow client - drop its oldest tick, prices only need the latest
+                subscriber.get_nowait()
+            subscriber.put_nowait(tick)
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Events message"""
+    message = f'data: {json.dumps(data)}\n\n'
+    if event:
+        message = f'event: {event}\n' + message
+    return message
+
+
+def stream_ticks(tick_engine, symbols, keepalive=15):
+    """Yield SSE messages for the given symbols until the client disconnects"""
+    subscriber = tick_engine.subscribe()
+    try:
+        for symbol in symbols:
+            if symbol in tick_engine.last_ticks:
+                yield sse_event(tick_engine.last_ticks[symbol])
+
+        while True:
+            try:
+                tick = subscriber.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if tick['symbol'] in symbols:
+                yield sse_event(tick)
+    finally:
+        tick_engine.unsubscribe(subscriber)
+
+
+async def astream_ticks(fanout, symbols, keepalive=15):
+    """Async stream_ticks for clients served by the ASGI app"""
+    subscriber = fanout.subscribe()
+    try:
+        last_ticks = fanout.tick_engine.last_ticks
+        for symbol in symbols:
+            if symbol in last_ticks:
+                yield sse_event(last_ticks[symbol])
+
+        while True:
+            try:
+                tick = await asyncio.wait_for(subscriber.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if tick['symbol'] in symbols:
+                yield sse_event(tick)
+    finally:
+        fanout.unsubscribe(subscriber)
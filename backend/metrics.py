@@ -0,0 +1,182 @@
+"""Process-wide counters and histograms, exposed in Prometheus text format.
+
+Recording is a dict lookup and a few additions under a per-metric lock, so
+it is cheap enough for every request, storage call and tick. The series
+every subsystem records are defined at the bottom of this module.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds - from sub-millisecond cache hits to slow remote storage calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes - from a single price to a full JSONBin document
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Items per batch
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = {key: self._snapshot(value) for key, value in self._values.items()}
+        for key, value in sorted(values.items()):
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _snapshot(self, value):
+        return value
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labels, key)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of the with block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _snapshot(self, value):
+        return list(value[0]), value[1], value[2]
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            le = f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+def render():
+    """Every registered metric in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# HTTP
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request',
+    ('route', 'method', 'status'))
+http_response_size = Histogram(
+    'http_response_size_bytes', 'Response body size', ('route',), SIZE_BUCKETS)
+serialization_duration = Histogram(
+    'serialization_duration_seconds', 'Time spent encoding chart payloads', ('format',))
+
+# Storage
+storage_requests = Counter(
+    'storage_requests_total', 'Calls made to the account store', ('backend', 'operation', 'outcome'))
+storage_duration = Histogram(
+    'storage_request_duration_seconds', 'Time spent in account store calls', ('backend', 'operation'))
+storage_payload_size = Histogram(
+    'storage_payload_bytes', 'Bytes read from or written to the account store',
+    ('backend', 'direction'), SIZE_BUCKETS)
+
+
+def observe_storage(backend, operation, started, outcome='ok'):
+    """Record one store call that began at perf_counter() value started"""
+    storage_duration.observe(time.perf_counter() - started, backend, operation)
+    storage_requests.inc(backend, operation, outcome)
+
+
+account_cache_lookups = Counter(
+    'account_cache_lookups_total', 'Account cache lookups by result (hit, miss, missing)', ('result',))
+portfolio_flush_duration = Histogram(
+    'portfolio_flush_duration_seconds', 'Time spent writing dirty accounts back to the store')
+portfolio_flush_accounts = Histogram(
+    'portfolio_flush_accounts', 'Accounts written per flush', buckets=COUNT_BUCKETS)
+portfolio_journal_writes = Counter(
+    'portfolio_journal_writes_total', 'Account updates appended to the journal')
+
+# Market data
+bar_generation_duration = Histogram(
+    'bar_generation_duration_seconds', 'Time spent generating bars', ('interval',))
+bars_generated = Counter('bars_generated_total', 'Bars generated', ('interval',))
+tick_duration = Histogram('tick_duration_seconds', 'Time spent on one tick of every symbol')
+stream_subscribers = Gauge('price_stream_subscribers', 'Open price stream connections', ('server',))
+portfolio_stream_subscribers = Gauge('portfolio_stream_subscribers', 'Open portfolio stream connections')
+
+# Trading
+orders_opened = Counter('orders_opened_total', 'Orders opened', ('symbol',))
+orders_closed = Counter('orders_closed_total', 'Orders closed', ('symbol', 'reason'))
+stop_outs = Counter('stop_outs_total', 'Accounts liquidated at the stop-out level')
+ledger_events = Counter('order_ledger_events_total', 'Events appended to the order ledger', ('event',))
@@ -0,0 +1,64 @@
+"""Import users from a JSONBin document into the local SQLite store.
+
+Usage:
+    python migrate_jsonbin.py                 # fetch the live bin from .env credentials
+    python migrate_jsonbin.py dump.json       # import an exported bin
+    python migrate_jsonbin.py dump.json --db /path/to/users.db --overwrite
+"""
+import argparse
+import json
+
+from storage import SQLiteStore, USER_DB_PATH, get_bin_data
+
+
+def load_dump(path):
+    with open(path) as f:
+        data = json.load(f)
+
+    # Exports made with bin metadata enabled wrap the document in 'record'
+    if 'record' in data and 'users' not in data:
+        data = data['record']
+    return data.get('users', {})
+
+
+def migrate(users, store, overwrite=False):
+    """Copy users into store, returns (imported, skipped)"""
+    if not overwrite:
+        existing = {username for username, _ in store.iter_users()}
+        skipped = [username for username in users if username in existing]
+        users = {username: user_data for username, user_data in users.items()
+                 if username not in existing}
+    else:
+        skipped = []
+
+    for user_data in users.values():
+        user_data.setdefault('balance', 10000)
+        user_data.setdefault('open_orders', [])
+
+    if users and not store.put_users(users):
+        raise SystemExit('❌ Failed to write users to the local store')
+    return len(users), len(skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a JSONBin users document into SQLite')
+    parser.add_argument('dump', nargs='?', help='JSON export of the bin (defaults to the live bin)')
+    parser.add_argument('--db', default=USER_DB_PATH, help='SQLite database path')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Replace accounts that already exist locally')
+    args = parser.parse_args()
+
+    if args.dump:
+        users = load_dump(args.dump)
+    else:
+        users = get_bin_data().get('users', {})
+
+    store = SQLiteStore(args.db)
+    imported, skipped = migrate(users, store, args.overwrite)
+    store.close()
+
+    print(f"✅ Imported {imported} users into {args.db} ({skipped} already present)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import heapq
+import itertools
+import logging
+import threading
+
+from storage import get_store
+
+logger = logging.getLogger(__name__)
+
+
+class TriggerBook:
+    """Resting stop-loss/take-profit levels for one symbol.
+
+    Levels that fire when the price falls to them live in a max-heap, levels
+    that fire when the price rises to them in a min-heap, so a tick only
+    touches the entries it actually crosses. Entries of orders that were
+    closed some other way are skipped lazily when they reach the top.
+    """
+
+    def __init__(self):
+        self.below = []  # (-level, seq, order_id, reason): fire when price <= level
+        self.above = []  # (level, seq, order_id, reason): fire when price >= level
+        self._seq = itertools.count()
+
+    def add(self, level, fires_below, order_id, reason):
+        if fires_below:
+            heapq.heappush(self.below, (-level, next(self._seq), order_id, reason))
+        else:
+            heapq.heappush(self.above, (level, next(self._seq), order_id, reason))
+
+    def pop_crossed(self, price):
+        """Remove and return (order_id, reason) for every level crossed by price"""
+        crossed = []
+        below, above = self.below, self.above
+        while below and -below[0][0] >= price:
+            entry = heapq.heappop(below)
+            crossed.append((entry[2], entry[3]))
+        while above and above[0][0] <= price:
+            entry = heapq.heappop(above)
+            crossed.append((entry[2], entry[3]))
+        return crossed
+
+    def __len__(self):
+        return len(self.below) + len(self.above)
+
+    def rebuild(self, live_orders):
+        """Drop entries of orders that are no longer open"""
+        self.below = [entry for entry in self.below if entry[2] in live_orders]
+        self.above = [entry for entry in self.above if entry[2] in live_orders]
+        heapq.heapify(self.below)
+        heapq.heapify(self.above)
+
+
+class TriggerEngine:
+    """Closes orders automatically when the live price reaches their SL or TP"""
+
+    def __init__(self, trading_engine):
+        self.trading_engine = trading_engine
+        self._books = {}
+        self._orders = {}  # order_id -> (user_id, symbol) for every open order with a trigger
+        self._lock = threading.Lock()
+        trading_engine.order_listeners.append(self)
+
+    def load(self, users=None):
+        """Index the open orders of every stored account"""
+        if users is None:
+            users = get_store().iter_users()
+        for user_id, user_data in users:
+            for order in user_data.get('open_orders', []):
+                self.add_order(user_id, order)
+
+    def add_order(self, user_id, order):
+        stop_loss = order.get('stop_loss')
+        take_profit = order.get('take_profit')
+        if stop_loss is None and take_profit is None:
+            return
+
+        is_buy = order['type'] == 'buy'
+        with self._lock:
+            book = self._books.get(order['symbol'])
+            if book is None:
+                book = self._books[order['symbol']] = TriggerBook()
+            if stop_loss is not None:
+                book.add(float(stop_loss), is_buy, order['id'], 'stop_loss')
+            if take_profit is not None:
+                book.add(float(take_profit), not is_buy, order['id'], 'take_profit')
+            self._orders[order['id']] = (user_id, order['symbol'])
+
+    def remove_order(self, order_id):
+        with self._lock:
+            entry = self._orders.pop(order_id, None)
+            if entry is None:
+                return
+            book = self._books[entry[1]]
+            # Compact once stale entries dominate the heaps
+            if len(book) > 2 * len(self._orders) + 1024:
+                book.rebuild(self._orders)
+
+    def check(self, symbol, price):
+        """Return (user_id, order_id, reason) for every order triggered at price"""
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None:
+                return []
+
+            triggered = []
+            for order_id, reason in book.pop_crossed(price):
+                entry = self._orders.pop(order_id, None)
+                if entry is not None:
+                    triggered.append((entry[0], order_id, reason))
+            return triggered
+
+    def on_tick(self, tick):
+        """Tick engine listener - close every order whose level was crossed"""
+        for user_id, order_id, reason in self.check(tick['symbol'], tick['price']):
+            result = self.trading_engine.close_order(user_id, order_id, close_price=tick['price'], reason=reason)
+            if result.get('success'):
+                logger.info('%s hit user=%s order=%s price=%.4f', reason, user_id, order_id, tick['price'])
+
+    # Trading engine order listener interface
+    def order_opened(self, user_id, order, user_data):
+        self.add_order(user_id, order)
+
+    def order_closed(self, user_id, order, user_data):
+        self.remove_order(order['id'])
@@ -0,0 +1,153 @@
+"""Per-user ownership when the app runs as several worker processes.
+
+Every account belongs to exactly one worker, picked by a hash of the
+username, so its cached copy, journal and per-user lock live in a single
+process and its updates stay serialized. A worker that receives a request
+for an account it does not own forwards the request to the owning worker
+over that worker's unix socket and relays the response.
+"""
+import glob
+import http.client
+import os
+import socket
+import tempfile
+import threading
+import zlib
+
+from flask import request, session, Response
+from werkzeug.serving import make_server
+
+# Set per worker by gunicorn.conf.py; a single process owns every account
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+WORKER_SLOT = int(os.getenv('WORKER_SLOT', '0'))
+OWNER_SOCKET_DIR = os.getenv('OWNER_SOCKET_DIR', tempfile.gettempdir())
+FORWARD_TIMEOUT = float(os.getenv('OWNER_FORWARD_TIMEOUT', '30'))
+
+# Routes that name their account in the body rather than the session
+BODY_USER_ROUTES = ('/api/login', '/api/register')
+
+# Routes that read or change one account; everything else (market data,
+# symbols, price stream, metrics) is served by whichever worker receives it
+ACCOUNT_ROUTES = BODY_USER_ROUTES + (
+    '/api/place-order', '/api/place-orders', '/api/close-order', '/api/close-orders',
+    '/api/close-all', '/api/portfolio', '/api/history', '/api/stream/portfolio'
+)
+
+# Headers that belong to one hop, or that each server sets for itself
+NOT_FORWARDED = ('connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host',
+                 'date', 'server')
+
+# Set in the WSGI environ of requests arriving from another worker
+FORWARDED_KEY = 'trading.forwarded'
+
+
+def multi_worker():
+    return WORKER_COUNT > 1
+
+
+def owner_of(username):
+    return zlib.crc32(username.encode()) % WORKER_COUNT
+
+
+def owns(username):
+    return owner_of(username) == WORKER_SLOT
+
+
+def slot_path(path, slot):
+    """File of one worker slot next to path, e.g. orders-2.ledger"""
+    root, ext = os.path.splitext(path)
+    return f'{root}-{slot}{ext}'
+
+
+def slot_files(path):
+    """Existing per-slot files next to path, by slot"""
+    root, ext = os.path.splitext(path)
+    found = {}
+    for candidate in glob.glob(f'{glob.escape(root)}-*{glob.escape(ext)}'):
+        slot = candidate[len(root) + 1:len(candidate) - len(ext)]
+        if slot.isdigit():
+            found[int(slot)] = candidate
+    return [found[slot] for slot in sorted(found)]
+
+
+def socket_path(slot):
+    return os.path.join(OWNER_SOCKET_DIR, f'trading-worker-{slot}.sock')
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=FORWARD_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class OwnerRouter:
+    """Sends account requests to the worker that owns the account"""
+
+    def __init__(self, app):
+        self.app = app
+        app.before_request(self.route)
+
+        path = socket_path(WORKER_SLOT)
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = make_server(f'unix://{path}', 0, self._mark_forwarded, threaded=True)
+        threading.Thread(target=self._server.serve_forever, name='owner-socket', daemon=True).start()
+
+    def _mark_forwarded(self, environ, start_response):
+        environ[FORWARDED_KEY] = True
+        return self.app(environ, start_response)
+
+    @staticmethod
+    def request_user():
+        if request.path in BODY_USER_ROUTES:
+            username = (request.get_json(silent=True) or {}).get('username')
+            return username if isinstance(username, str) else None
+        return session.get('user_id')
+
+    def route(self):
+        if request.environ.get(FORWARDED_KEY) or request.path not in ACCOUNT_ROUTES:
+            return None
+        username = self.request_user()
+        if username is None or owns(username):
+            return None
+        return self.forward(owner_of(username))
+
+    def forward(self, slot):
+        headers = {name: value for name, value in request.headers.items()
+                   if name.lower() not in NOT_FORWARDED}
+        path = request.full_path if request.query_string else request.path
+
+        conn = UnixHTTPConnection(socket_path(slot))
+        try:
+            conn.request(request.method, path, body=request.get_data(), headers=headers)
+            upstream = conn.getresponse()
+            streaming = upstream.getheader('Content-Type', '').startswith('text/event-stream')
+            body = self._relay(upstream, conn) if streaming else upstream.read()
+        except Exception:
+            conn.close()
+            raise
+        if not streaming:
+            conn.close()
+
+        return Response(body, status=upstream.status, headers=[
+            (name, value) for name, value in upstream.getheaders()
+            if name.lower() not in NOT_FORWARDED
+        ])
+
+    @staticmethod
+    def _relay(upstream, conn):
+        """Pass an event stream through as it arrives, without a timeout"""
+        conn.sock.settimeout(None)
+        try:
+            while True:
+                chunk = upstream.read1(65536)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
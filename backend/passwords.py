@@ -0,0 +1,76 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+# PBKDF2-SHA256 rounds for new hashes; raising it upgrades existing hashes
+# as their users log in
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', '100000'))
+# Threads hashing at once; further logins queue instead of starving requests
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+
+ALGORITHM = 'pbkdf2_sha256'
+
+_hashing_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS)
+_dummy_hash = None
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode('ascii')
+
+
+def _derive(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def hash_password(password, iterations=None):
+    """Salted hash in the form pbkdf2_sha256$iterations$salt$hash"""
+    iterations = iterations or PASSWORD_HASH_ITERATIONS
+    salt = os.urandom(16)
+    return f'{ALGORITHM}${iterations}${_b64(salt)}${_b64(_derive(password, salt, iterations))}'
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(ALGORITHM + '$')
+
+
+def verify_password(stored, password):
+    """Check a password, returns (matches, needs_rehash).
+
+    Accounts created before hashing still hold the plaintext password;
+    those match by value and always need a rehash.
+    """
+    if not isinstance(stored, str) or not isinstance(password, str):
+        return False, False
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+
+    try:
+        _, iterations, salt, expected = stored.split('$')
+        iterations = int(iterations)
+        salt = base64.b64decode(salt)
+        expected = base64.b64decode(expected)
+    except ValueError:
+        return False, False
+    matches = hmac.compare_digest(_derive(password, salt, iterations), expected)
+    return matches, iterations != PASSWORD_HASH_ITERATIONS
+
+
+def dummy_hash():
+    """Hash to verify against for unknown users, so they cost as much as known ones"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(_b64(os.urandom(16)))
+    return _dummy_hash
+
+
+def run_hashing(func, *args):
+    """Run a hashing call in the calling thread once one of the hashing slots is free.
+
+    Handing the call to a pool would not free the request thread, which has
+    nothing else to do until the login is answered; pbkdf2_hmac releases the
+    GIL, so other requests keep running while it hashes.
+    """
+    with _hashing_slots:
+        return func(*args)
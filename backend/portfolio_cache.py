@@ -0,0 +1,308 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import (
+    account_cache_lookups, portfolio_flush_duration, portfolio_flush_accounts, portfolio_journal_writes
+)
+from storage import get_store
+
+logger = logging.getLogger(__name__)
+
+# How often dirty accounts are written back, and how many dirty accounts
+# trigger an early flush
+FLUSH_INTERVAL = float(os.getenv('PORTFOLIO_FLUSH_INTERVAL', '2.0'))
+FLUSH_THRESHOLD = int(os.getenv('PORTFOLIO_FLUSH_THRESHOLD', '100'))
+JOURNAL_PATH = os.getenv(
+    'PORTFOLIO_JOURNAL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'portfolio.journal')
+)
+JOURNAL_FSYNC = os.getenv('PORTFOLIO_JOURNAL_FSYNC', '1') != '0'
+
+# Seconds an untouched, already flushed account stays in memory, and how long
+# an unknown username is remembered so repeated lookups skip the store
+ACCOUNT_CACHE_TTL = float(os.getenv('ACCOUNT_CACHE_TTL', '900'))
+MISSING_ACCOUNT_TTL = float(os.getenv('MISSING_ACCOUNT_TTL', '30'))
+# Per-user locks are striped over this many locks, so memory stays fixed
+# however many usernames are tried
+ACCOUNT_LOCK_STRIPES = int(os.getenv('ACCOUNT_LOCK_STRIPES', '4096'))
+
+
+def _rotation_number(path):
+    try:
+        return int(path.rsplit('.', 1)[1])
+    except ValueError:
+        return -1
+
+
+def _rotated_journals(journal_path):
+    return sorted(glob.glob(f'{glob.escape(journal_path)}.*'), key=_rotation_number)
+
+
+def _journal_files(journal_path):
+    """A journal's rotated predecessors oldest first, then the journal itself"""
+    paths = [path for path in _rotated_journals(journal_path) if _rotation_number(path) >= 0]
+    if os.path.exists(journal_path):
+        paths.append(journal_path)
+    return paths
+
+
+def replay_journals(paths, store):
+    """Write the last journaled state of every account in paths to the store, then delete them"""
+    pending = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn final write - it was never acknowledged
+                    continue
+                pending[entry['user']] = entry['data']
+
+    if pending and not store.put_users(pending):
+        raise RuntimeError('Failed to replay portfolio journal into the store')
+
+    for path in paths:
+        os.remove(path)
+    if pending:
+        logger.warning('recovered accounts from the portfolio journal accounts=%d', len(pending))
+    return len(pending)
+
+
+def recover_worker_journals(journal_path, store):
+    """Replay journal_path and every per-worker journal next to it.
+
+    Worker slots journal to portfolio-<slot>.journal and replay only their
+    own file, so journals of slots a restart no longer runs are drained here
+    before any worker starts.
+    """
+    from ownership import slot_files
+    paths = []
+    for path in [journal_path] + slot_files(journal_path):
+        paths.extend(_journal_files(path))
+    return replay_journals(paths, store)
+
+
+def _copy_account(user_data):
+    """Copy an account deep enough that callers can append/pop orders safely"""
+    return {key: list(value) if isinstance(value, list) else value
+            for key, value in user_data.items()}
+
+
+class PortfolioCache:
+    """In-process account cache with a local journal and write-behind flushes.
+
+    Every put is appended to the journal before it is acknowledged, so the
+    store can lag behind without losing anything on a crash. Dirty accounts
+    are written to the store in one batch every flush_interval seconds, or
+    sooner once flush_threshold accounts are waiting.
+
+    Accounts stay cached while their sessions use them; once clean and idle
+    for ttl seconds they are evicted and reloaded on the next access.
+    """
+
+    def __init__(self, store=None, flush_interval=FLUSH_INTERVAL,
+                 flush_threshold=FLUSH_THRESHOLD, journal_path=JOURNAL_PATH,
+                 fsync=JOURNAL_FSYNC, ttl=ACCOUNT_CACHE_TTL, missing_ttl=MISSING_ACCOUNT_TTL,
+                 lock_stripes=ACCOUNT_LOCK_STRIPES):
+        self.store = store or get_store()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.journal_path = journal_path
+        self.fsync = fsync
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+
+        self._accounts = {}
+        self._touched = {}  # username -> monotonic time of last use
+        self._missing = {}  # username -> monotonic time the cached miss expires
+        self._user_locks = [threading.RLock() for _ in range(lock_stripes)]
+        self._dirty = set()
+        # Accounts handed to the store by the running flush, until it confirms
+        self._flushing = set()
+        # Guards the journal file, the dirty and flushing sets and account
+        # replacement so a flush always sees a journal that matches them
+        self._journal_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rotation = 0
+
+        self._recover()
+        self._journal = open(self.journal_path, 'a')
+
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._flusher = threading.Thread(target=self._flush_loop, name='portfolio-flusher', daemon=True)
+        self._flusher.start()
+
+    def lock(self, username):
+        """Per-user lock serializing read-modify-write cycles on one account.
+
+        Users share a fixed set of reentrant locks by hash, so an account's
+        lock is always the same object and nothing is kept per username.
+        """
+        return self._user_locks[hash(username) % len(self._user_locks)]
+
+    def get(self, username):
+        """Return a private copy of the account, loading it on a miss"""
+        user_data = self._accounts.get(username)
+        if user_data is None:
+            with self.lock(username):
+                user_data = self._accounts.get(username)
+                if user_data is None:
+                    if self._missing.get(username, 0) > time.monotonic():
+                        account_cache_lookups.inc('missing')
+                        return {}
+                    account_cache_lookups.inc('miss')
+                    user_data = self.store.get_user(username)
+                    if not user_data:
+                        self._missing[username] = time.monotonic() + self.missing_ttl
+                        return {}
+                    self._accounts[username] = user_data
+        else:
+            account_cache_lookups.inc('hit')
+        self._touched[username] = time.monotonic()
+        return _copy_account(user_data)
+
+    def cached(self, username):
+        return username in self._accounts or self._missing.get(username, 0) > time.monotonic()
+
+    def invalidate(self, username):
+        """Forget a cached account or miss so the next read goes to the store.
+
+        Accounts with unflushed changes stay until their flush lands.
+        """
+        with self.lock(username):
+            self._missing.pop(username, None)
+            with self._journal_lock:
+                if username not in self._dirty and username not in self._flushing:
+                    self._accounts.pop(username, None)
+                    self._touched.pop(username, None)
+
+    def prime(self, username, user_data):
+        """Cache an account loaded elsewhere, unless a newer copy is already held"""
+        if not user_data:
+            return
+        with self.lock(username):
+            if username not in self._accounts:
+                self._accounts[username] = _copy_account(user_data)
+                self._touched[username] = time.monotonic()
+            self._missing.pop(username, None)
+
+    def put(self, username, user_data):
+        """Journal the new account state and queue it for the next flush"""
+        user_data = _copy_account(user_data)
+        line = json.dumps({'user': username, 'data': user_data}) + '\n'
+
+        with self._journal_lock:
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._accounts[username] = user_data
+            self._touched[username] = time.monotonic()
+            self._missing.pop(username, None)
+            self._dirty.add(username)
+            dirty_count = len(self._dirty)
+        portfolio_journal_writes.inc()
+
+        if dirty_count >= self.flush_threshold:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Write every dirty account to the store in a single batch"""
+        with self._flush_lock:
+            with self._journal_lock:
+                if not self._dirty:
+                    return True
+                rotated = self._rotate_journal()
+                dirty, self._dirty = self._dirty, set()
+                self._flushing = dirty
+                batch = {username: self._accounts[username] for username in dirty}
+
+            started = time.perf_counter()
+            try:
+                ok = self.store.put_users(batch)
+            except Exception:
+                logger.exception('portfolio flush failed accounts=%d', len(batch))
+                ok = False
+            portfolio_flush_duration.observe(time.perf_counter() - started)
+            portfolio_flush_accounts.observe(len(batch))
+
+            with self._journal_lock:
+                self._flushing = set()
+                if not ok:
+                    # Keep the rotated journal around and retry these accounts
+                    self._dirty |= dirty
+            if not ok:
+                return False
+
+            for path in _rotated_journals(self.journal_path):
+                if _rotation_number(path) <= rotated:
+                    os.remove(path)
+            return True
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._flusher.join(timeout=self.flush_interval + 5)
+        self.flush()
+        with self._journal_lock:
+            self._journal.close()
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self._stopped:
+                self.flush()
+                self.evict_idle()
+
+    def evict_idle(self):
+        """Drop clean accounts unused for ttl seconds and expired misses"""
+        now = time.monotonic()
+        cutoff = now - self.ttl
+        with self._journal_lock:
+            for username, touched in list(self._touched.items()):
+                if touched < cutoff and username not in self._dirty and username not in self._flushing:
+                    self._accounts.pop(username, None)
+                    self._touched.pop(username, None)
+        for username, expires in list(self._missing.items()):
+            if expires <= now:
+                self._missing.pop(username, None)
+
+    def _rotate_journal(self):
+        """Start a fresh journal; the old one is deleted once its flush lands"""
+        self._journal.close()
+        self._rotation += 1
+        os.replace(self.journal_path, f'{self.journal_path}.{self._rotation}')
+        self._journal = open(self.journal_path, 'a')
+        return self._rotation
+
+    def _recover(self):
+        """Replay journals left by a previous process into the store"""
+        replay_journals(_journal_files(self.journal_path), self.store)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_portfolio_cache():
+    """Return the process-wide portfolio cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from ownership import multi_worker
+                if not multi_worker():
+                    # Drain journals left by an earlier multi-worker run; with
+                    # several workers gunicorn.conf.py does this before forking
+                    recover_worker_journals(JOURNAL_PATH, get_store())
+                _cache = PortfolioCache()
+                atexit.register(_cache.close)
+    return _cache
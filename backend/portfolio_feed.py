@@ -0,0 +1,212 @@
+"""Per-user portfolio event streams.
+
+A client subscribes once and receives the full portfolio, then only what
+changes: orders opening and closing (fills, stop loss and take profit) with
+the new balance, and mark events when equity or a position's P&L moves.
+Events come from the trading engine's order listeners and the in-memory
+margin book, so after the snapshot nothing is read from storage, and users
+without an open stream cost nothing.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+
+from auth import user_lock
+from market_feed import sse_event, SUBSCRIBER_BUFFER
+from metrics import portfolio_stream_subscribers
+
+logger = logging.getLogger(__name__)
+
+# Seconds between equity marks for users with an open stream
+PORTFOLIO_MARK_INTERVAL = float(os.getenv('PORTFOLIO_MARK_INTERVAL', '1.0'))
+
+
+def _mark_diff(previous, current):
+    """Mark event with the fields of current that differ from previous, or None"""
+    changed = {symbol: position for symbol, position in current['exposure'].items()
+               if previous['exposure'].get(symbol) != position}
+    removed = [symbol for symbol in previous['exposure'] if symbol not in current['exposure']]
+    if (not changed and not removed and previous['equity'] == current['equity']
+            and previous['free_margin'] == current['free_margin']):
+        return None
+    return {
+        'type': 'mark',
+        'equity': current['equity'],
+        'unrealized_pnl': current['unrealized_pnl'],
+        'free_margin': current['free_margin'],
+        'margin_level': current['margin_level'],
+        'exposure': changed,
+        'removed': removed
+    }
+
+
+class PortfolioFeed:
+    """Fans each user's portfolio changes out to their open streams.
+
+    Subscribers are deliver(event) callables; they are called from the
+    trading and mark threads and must not block.
+    """
+
+    def __init__(self, trading_engine, mark_interval=PORTFOLIO_MARK_INTERVAL):
+        self.trading_engine = trading_engine
+        self.mark_interval = mark_interval
+        # user_id -> {'balance': float, 'subscribers': {deliver: last mark sent}}
+        self._users = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        trading_engine.order_listeners.append(self)
+
+    def subscribe(self, user_id, deliver):
+        """Send user_id's portfolio to deliver, then every change after it"""
+        # Order events are published under the user's lock, so none can
+        # fall between the snapshot and the registration
+        with user_lock(user_id):
+            portfolio = self.trading_engine.get_portfolio(user_id)
+            balance = portfolio['balance']
+            mark = self._mark(user_id, balance)
+            deliver({'type': 'snapshot', 'balance': balance,
+                     'open_orders': portfolio['open_orders'], **mark})
+            with self._lock:
+                state = self._users.setdefault(user_id, {'balance': balance, 'subscribers': {}})
+                state['balance'] = balance
+                state['subscribers'][deliver] = mark
+        portfolio_stream_subscribers.inc()
+        self._start()
+
+    def unsubscribe(self, user_id, deliver):
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None or deliver not in state['subscribers']:
+                return
+            del state['subscribers'][deliver]
+            if not state['subscribers']:
+                del self._users[user_id]
+        portfolio_stream_subscribers.dec()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='portfolio-marks', daemon=True)
+                self._thread.start()
+
+    def _mark(self, user_id, balance):
+        """Equity, margin and per-symbol P&L at live prices, rounded to cents"""
+        prices = self.trading_engine.data_fetcher.current_prices
+        valuation = self.trading_engine.margin.summary(user_id, prices)
+        account = self.trading_engine.margin.account(user_id, prices)
+        equity = balance + valuation['unrealized_pnl']
+        used_margin = account['used_margin'] if account else 0.0
+        margin_level = account['margin_level'] if account else None
+        return {
+            'equity': round(equity, 2),
+            'unrealized_pnl': round(valuation['unrealized_pnl'], 2),
+            'free_margin': round(equity - used_margin, 2),
+            'margin_level': round(margin_level, 1) if margin_level is not None else None,
+            'exposure': {
+                symbol: dict(position, unrealized_pnl=round(position['unrealized_pnl'], 2))
+                for symbol, position in valuation['exposure'].items()
+            }
+        }
+
+    def _run(self):
+        while not self._stopped.wait(self.mark_interval):
+            with self._lock:
+                users = [(user_id, state['balance']) for user_id, state in self._users.items()]
+            for user_id, balance in users:
+                try:
+                    mark = self._mark(user_id, balance)
+                except Exception:
+                    logger.exception('portfolio mark failed user=%s', user_id)
+                    continue
+
+                events = []
+                with self._lock:
+                    subscribers = self._users.get(user_id, {}).get('subscribers', {})
+                    for deliver, previous in subscribers.items():
+                        event = _mark_diff(previous, mark)
+                        if event is not None:
+                            subscribers[deliver] = mark
+                            events.append((deliver, event))
+                for deliver, event in events:
+                    deliver(event)
+
+    def _publish(self, user_id, event):
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                return
+            state['balance'] = event['balance']
+            subscribers = list(state['subscribers'])
+        for deliver in subscribers:
+            deliver(event)
+
+    # Trading engine order listener interface
+    def order_opened(self, user_id, order, user_data):
+        self._publish(user_id, {'type': 'order_opened', 'order': order, 'balance': user_data['balance']})
+
+    def order_closed(self, user_id, order, user_data):
+        self._publish(user_id, {'type': 'order_closed', 'order': order, 'balance': user_data['balance']})
+
+
+def stream_portfolio(feed, user_id, keepalive=15):
+    """Yield SSE messages with user_id's portfolio events until the client disconnects.
+
+    A client too slow to keep up would miss diffs, so its stream ends
+    instead; EventSource reconnects and starts again from a snapshot.
+    """
+    events = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+    overflowed = threading.Event()
+
+    def deliver(event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            overflowed.set()
+
+    feed.subscribe(user_id, deliver)
+    try:
+        while not overflowed.is_set():
+            try:
+                event = events.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield sse_event(event)
+    finally:
+        feed.unsubscribe(user_id, deliver)
+
+
+async def astream_portfolio(feed, user_id, keepalive=15):
+    """Async stream_portfolio for clients served by the ASGI app"""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+    overflowed = False
+
+    def put(event):
+        nonlocal overflowed
+        if events.full():
+            overflowed = True
+        else:
+            events.put_nowait(event)
+
+    def deliver(event):
+        loop.call_soon_threadsafe(put, event)
+
+    # The snapshot may need a storage read
+    await loop.run_in_executor(None, feed.subscribe, user_id, deliver)
+    try:
+        while not overflowed:
+            try:
+                event = await asyncio.wait_for(events.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield sse_event(event)
+    finally:
+        feed.unsubscribe(user_id, deliver)
@@ -0,0 +1,276 @@
+"""Deterministic replay and backtesting over reproducible bar series.
+
+Besides serving /api/replay, this can run offline:
+    python replay.py XAUUSD 2024-01-01 2024-03-01 --interval 1h --orders orders.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from data_fetcher import INTERVAL_SECONDS, series_to_records
+
+# Upper bound on bars generated for one request to the replay routes, about
+# five years of hourly bars; offline backtests are not limited
+MAX_REPLAY_BARS = 50000
+
+# Equity curve points returned to clients, the full curve stays server-side
+MAX_CURVE_POINTS = 2000
+
+
+def parse_time(value):
+    """Accept epoch seconds or an ISO-8601 string"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def parse_seed(value):
+    """A non-negative integer seed (or its string form), or None"""
+    if value is None:
+        return None
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    raise ValueError('seed must be a non-negative integer')
+
+
+def parse_bar(value, key):
+    """A bar index from an order; negative indexes are rejected"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f'{key} must be a non-negative integer')
+    try:
+        index = int(value)
+    except ValueError:
+        raise ValueError(f'{key} must be a non-negative integer') from None
+    if index < 0:
+        raise ValueError(f'{key} must be a non-negative integer')
+    return index
+
+
+class ReplayEngine:
+    """Runs a simulated account through a reproducible bar series"""
+
+    def __init__(self, data_fetcher, trading_engine, max_bars=None):
+        self.data_fetcher = data_fetcher
+        self.trading_engine = trading_engine
+        self.max_bars = max_bars
+
+    def series(self, symbol, start, end, interval='1h', seed=None):
+        start_time, end_time = parse_time(start), parse_time(end)
+        if end_time < start_time:
+            raise ValueError('end must be after start')
+        step = INTERVAL_SECONDS.get(interval, INTERVAL_SECONDS['1d'])
+        if self.max_bars and (end_time - start_time) // step + 1 > self.max_bars:
+            raise ValueError(f'Replay limited to {self.max_bars} bars')
+        return self.data_fetcher.generate_replay_series(symbol, start_time, end_time, interval,
+                                                        parse_seed(seed))
+
+    def backtest(self, symbol, start, end, orders, interval='1h', balance=10000.0,
+                 seed=None, max_curve_points=MAX_CURVE_POINTS):
+        """Fill orders against the series and report equity, drawdown and trade stats.
+
+        Each order has a type, optional lot_size, stop_loss and take_profit,
+        and enters at the open of the bar containing its time (or at bar
+        index 'bar'). It exits at the first bar whose range crosses its stop
+        loss (checked first) or take profit, at its close_time if given, or
+        at the last close of the series.
+        """
+        bars = self.series(symbol, start, end, interval, seed)
+        timestamps = bars['timestamp']
+        opens, highs, lows, closes = bars['open'], bars['high'], bars['low'], bars['close']
+        count = len(timestamps)
+        step = INTERVAL_SECONDS.get(interval, INTERVAL_SECONDS['1d'])
+
+        # Equity = balance + realized(t) + slope(t) * close(t) + offset(t); each
+        # trade adds to these through difference arrays, so the curve costs
+        # O(bars + trades) however long trades stay open
+        realized = np.zeros(count + 1)
+        slope = np.zeros(count + 1)
+        offset = np.zeros(count + 1)
+        trades = []
+
+        for order in orders:
+            entry = self._bar_index(order, 'bar', 'time', timestamps, step)
+            if entry is None or entry >= count:
+                continue
+            exit_limit = self._bar_index(order, 'close_bar', 'close_time', timestamps, step)
+            exit_limit = count - 1 if exit_limit is None else min(max(exit_limit, entry), count - 1)
+
+            is_buy = order.get('type', 'buy') == 'buy'
+            units = self.trading_engine.units(symbol, order.get('lot_size', 1))
+            open_price = float(opens[entry])
+            stop_loss = order.get('stop_loss')
+            take_profit = order.get('take_profit')
+
+            window = slice(entry, exit_limit + 1)
+            exit_index, close_price, reason = exit_limit, float(closes[exit_limit]), 'end'
+            if stop_loss is not None or take_profit is not None:
+                hit_stop = self._crossed(lows[window], highs[window], stop_loss, below=is_buy)
+                hit_target = self._crossed(lows[window], highs[window], take_profit, below=not is_buy)
+                hit = hit_stop | hit_target
+                if hit.any():
+                    first = int(hit.argmax())
+                    exit_index = entry + first
+                    if hit_stop[first]:
+                        close_price, reason = float(stop_loss), 'stop_loss'
+                    else:
+                        close_price, reason = float(take_profit), 'take_profit'
+            if reason == 'end' and exit_limit < count - 1:
+                reason = 'close_time'
+
+            pnl = self.trading_engine.calculate_pnl(
+                'buy' if is_buy else 'sell', open_price, close_price, units
+            )
+            signed_units = units if is_buy else -units
+
+            # Open from entry up to (not including) the exit bar, realized after
+            slope[entry] += signed_units
+            slope[exit_index] -= signed_units
+            offset[entry] -= signed_units * open_price
+            offset[exit_index] += signed_units * open_price
+            realized[exit_index] += pnl
+
+            trades.append({
+                'type': 'buy' if is_buy else 'sell',
+                'lot_size': order.get('lot_size', 1),
+                'open_time': int(timestamps[entry]),
+                'open_price': open_price,
+                'close_time': int(timestamps[exit_index]),
+                'close_price': close_price,
+                'close_reason': reason,
+                'pnl': pnl
+            })
+
+        equity = (balance
+                  + np.cumsum(realized[:count])
+                  + np.cumsum(slope[:count]) * closes
+                  + np.cumsum(offset[:count]))
+
+        return {
+            'symbol': symbol,
+            'interval': interval,
+            'bars': count,
+            'trades': trades,
+            'stats': self._stats(trades, equity, balance),
+            'equity_curve': self._downsample(timestamps, equity, max_curve_points)
+        }
+
+    @staticmethod
+    def _bar_index(order, bar_key, time_key, timestamps, step):
+        if order.get(bar_key) is not None:
+            return parse_bar(order[bar_key], bar_key)
+        if order.get(time_key) is not None:
+            return max(0, (parse_time(order[time_key]) - int(timestamps[0])) // step)
+        return None if bar_key == 'close_bar' else 0
+
+    @staticmethod
+    def _crossed(lows, highs, level, below):
+        if level is None:
+            return np.zeros(len(lows), dtype=bool)
+        return lows <= level if below else highs >= level
+
+    @staticmethod
+    def _stats(trades, equity, balance):
+        pnls = np.array([trade['pnl'] for trade in trades], dtype=float)
+        wins = pnls[pnls > 0]
+        losses = pnls[pnls < 0]
+        drawdown = np.maximum.accumulate(equity) - equity
+        worst = int(drawdown.argmax()) if len(drawdown) else 0
+        peak = float(np.maximum.accumulate(equity)[worst]) if len(equity) else balance
+
+        return {
+            'trades': len(trades),
+            'wins': len(wins),
+            'losses': len(losses),
+            'win_rate': len(wins) / len(trades) if trades else 0.0,
+            'net_pnl': float(pnls.sum()),
+            'gross_profit': float(wins.sum()),
+            'gross_loss': float(losses.sum()),
+            'profit_factor': float(wins.sum() / -losses.sum()) if len(losses) else None,
+            'final_equity': float(equity[-1]) if len(equity) else balance,
+            'max_drawdown': float(drawdown[worst]) if len(drawdown) else 0.0,
+            'max_drawdown_pct': float(drawdown[worst] / peak * 100) if len(drawdown) and peak else 0.0
+        }
+
+    @staticmethod
+    def _downsample(timestamps, equity, max_points):
+        stride = max(1, -(-len(equity) // max_points))
+        return {
+            'timestamp': timestamps[::stride].tolist(),
+            'equity': np.round(equity[::stride], 2).tolist()
+        }
+
+    def stream(self, symbol, start, end, interval='1h', speed=10.0, seed=None):
+        """Bar dicts paced at speed bars per second for live scrubbing.
+
+        The series is generated up front, so a bad request raises ValueError
+        here rather than once iteration starts.
+        """
+        return self._paced(self.series(symbol, start, end, interval, seed), speed)
+
+    @staticmethod
+    def _paced(bars, speed):
+        delay = 1.0 / speed if speed > 0 else 0
+        next_bar = time.monotonic()
+        # Convert in chunks so the first bars go out without waiting for the rest
+        for chunk_start in range(0, len(bars['timestamp']), 256):
+            chunk = {column: values[chunk_start:chunk_start + 256] for column, values in bars.items()}
+            for bar in series_to_records(chunk):
+                if delay:
+                    next_bar += delay
+                    pause = next_bar - time.monotonic()
+                    if pause > 0:
+                        time.sleep(pause)
+                yield bar
+
+
+def main():
+    from data_fetcher import DataFetcher
+    from ledger import OrderLedger
+    from trading_engine import TradingEngine
+
+    parser = argparse.ArgumentParser(description='Run an offline backtest over a replay series')
+    parser.add_argument('symbol')
+    parser.add_argument('start')
+    parser.add_argument('end')
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--orders', help='JSON file with a list of orders')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--balance', type=float, default=10000.0)
+    args = parser.parse_args()
+
+    orders = []
+    if args.orders:
+        with open(args.orders) as f:
+            orders = json.load(f)
+
+    # Backtests never place real orders; the engine gets a throwaway ledger
+    # so the offline tool leaves the server's order history alone
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    ledger = OrderLedger(os.path.join(workdir, 'orders.ledger'), fsync=False)
+    try:
+        data_fetcher = DataFetcher()
+        engine = ReplayEngine(data_fetcher, TradingEngine(data_fetcher, ledger))
+
+        started = time.perf_counter()
+        report = engine.backtest(args.symbol, args.start, args.end, orders, args.interval,
+                                 args.balance, args.seed)
+        elapsed = time.perf_counter() - started
+    finally:
+        ledger.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report['stats'], indent=2))
+    print(f"⏱ {report['bars']} bars, {len(report['trades'])} trades in {elapsed:.3f}s "
+          f"({report['bars'] / elapsed:,.0f} bars/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Margin accounting, exposure and stop-out.
+
+Every account with open positions is one row of a few numpy arrays: its
+balance and used margin, and per symbol its net units, entry cost and order
+count. Orders opening and closing adjust their row in place, so re-valuing
+every account at new prices is one pass over the arrays - equity = balance
++ units @ prices - cost, margin level = equity / used margin - instead of a
+loop over order dicts. The same row gives an account's per-symbol exposure.
+
+An order's margin is margin_rate of its notional value at the open price.
+
+Accounts whose margin level falls to STOP_OUT_LEVEL percent are liquidated
+largest loss first, only as far as needed to lift the level back above it.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+from metrics import stop_outs
+
+logger = logging.getLogger(__name__)
+
+# Margin level (equity / used margin, in percent) at which positions are
+# closed by force
+STOP_OUT_LEVEL = float(os.getenv('STOP_OUT_LEVEL', '50'))
+
+# Rows allocated up front; the arrays double when they fill up
+_INITIAL_ROWS = 64
+
+
+class MarginBook:
+    """Used margin and net position per account and symbol, one array row each.
+
+    Only accounts with open orders hold a row; a row is released when its
+    last order closes and reused for the next account that opens one.
+    """
+
+    def __init__(self, symbols, rows=_INITIAL_ROWS):
+        self.symbols = symbols
+        self.columns = {symbol: i for i, symbol in enumerate(symbols)}
+        self._names = list(symbols)
+        self.balance = np.zeros(rows)
+        self.margin = np.zeros(rows)
+        self.units = np.zeros((rows, len(symbols)))
+        self.cost = np.zeros((rows, len(symbols)))
+        self.total_cost = np.zeros(rows)  # cost summed over symbols, for the per-tick pass
+        self.orders = np.zeros((rows, len(symbols)), dtype=np.int64)
+        self._rows = {}  # user_id -> row
+        self._users = [None] * rows  # row -> user_id
+        self._free = list(range(rows - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def order_margin(self, order):
+        spec = self.symbols[order['symbol']]
+        return order['lot_size'] * spec.contract_size * order['open_price'] * spec.margin_rate
+
+    def price_vector(self, prices):
+        return np.fromiter((prices[symbol] for symbol in self.symbols), np.float64, len(self.symbols))
+
+    def _grow(self):
+        rows = len(self._users)
+        self.balance = np.concatenate([self.balance, np.zeros(rows)])
+        self.margin = np.concatenate([self.margin, np.zeros(rows)])
+        self.units = np.concatenate([self.units, np.zeros(self.units.shape)])
+        self.cost = np.concatenate([self.cost, np.zeros(self.cost.shape)])
+        self.total_cost = np.concatenate([self.total_cost, np.zeros(rows)])
+        self.orders = np.concatenate([self.orders, np.zeros(self.orders.shape, dtype=np.int64)])
+        self._users.extend([None] * rows)
+        self._free.extend(range(2 * rows - 1, rows - 1, -1))
+
+    def _apply(self, row, order, direction):
+        spec = self.symbols[order['symbol']]
+        units = order['lot_size'] * spec.contract_size * direction
+        if order['type'] == 'sell':
+            units = -units
+        column = self.columns[order['symbol']]
+        self.units[row, column] += units
+        self.cost[row, column] += units * order['open_price']
+        self.total_cost[row] += units * order['open_price']
+        self.orders[row, column] += direction
+        if self.orders[row, column] == 0:
+            # Flat - drop it instead of carrying float residue around
+            self.total_cost[row] -= self.cost[row, column]
+            self.units[row, column] = self.cost[row, column] = 0.0
+        self.margin[row] += self.order_margin(order) * direction
+
+    def _load(self, user_id, user_data):
+        """(Re)build user_id's row from the account, or release it when flat"""
+        row = self._rows.get(user_id)
+        orders = user_data.get('open_orders', [])
+        if not orders:
+            if row is not None:
+                self._release(user_id, row)
+            return
+
+        if row is None:
+            row = self._allocate(user_id)
+        self.balance[row] = user_data.get('balance', 0.0)
+        self.margin[row] = self.total_cost[row] = 0.0
+        self.units[row] = self.cost[row] = self.orders[row] = 0
+        for order in orders:
+            self._apply(row, order, 1)
+
+    def _allocate(self, user_id):
+        if not self._free:
+            self._grow()
+        row = self._rows[user_id] = self._free.pop()
+        self._users[row] = user_id
+        return row
+
+    def _release(self, user_id, row):
+        del self._rows[user_id]
+        self._users[row] = None
+        self.balance[row] = self.margin[row] = self.total_cost[row] = 0.0
+        self.units[row] = self.cost[row] = self.orders[row] = 0
+        self._free.append(row)
+
+    def ensure(self, user_id, user_data):
+        """Track a user's open orders from the account on first use.
+
+        Call with the user's lock held so no order lands in between.
+        """
+        with self._lock:
+            if user_id not in self._rows:
+                self._load(user_id, user_data)
+
+    def load(self, users):
+        """Track every (user_id, user_data) with open orders"""
+        with self._lock:
+            for user_id, user_data in users:
+                self._load(user_id, user_data)
+
+    def account(self, user_id, prices):
+        """Balance, equity, used and free margin and margin level of one account"""
+        vector = self.price_vector(prices)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return None
+            balance = self.balance[row]
+            margin = self.margin[row]
+            equity = balance + self.units[row] @ vector - self.total_cost[row]
+        return {
+            'balance': float(balance),
+            'equity': float(equity),
+            'used_margin': float(margin),
+            'free_margin': float(equity - margin),
+            'margin_level': float(100.0 * equity / margin) if margin > 0 else None
+        }
+
+    def summary(self, user_id, prices):
+        """Per-symbol exposure and unrealized P&L at the given prices"""
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return {'unrealized_pnl': 0.0, 'exposure': {}}
+            units = self.units[row].copy()
+            cost = self.cost[row].copy()
+            orders = self.orders[row].copy()
+
+        exposure = {}
+        unrealized_pnl = 0.0
+        for column in np.flatnonzero(orders):
+            symbol = self._names[column]
+            pnl = float(prices[symbol] * units[column] - cost[column])
+            unrealized_pnl += pnl
+            exposure[symbol] = {
+                'net_lots': float(units[column]) / self.symbols[symbol].contract_size,
+                'avg_price': float(cost[column] / units[column]) if units[column] else None,
+                'orders': int(orders[column]),
+                'unrealized_pnl': pnl
+            }
+        return {'unrealized_pnl': unrealized_pnl, 'exposure': exposure}
+
+    def breached(self, prices, level=STOP_OUT_LEVEL):
+        """Users whose margin level at prices is at or below level percent"""
+        vector = self.price_vector(prices)
+        with self._lock:
+            equity = self.balance + self.units @ vector - self.total_cost
+            held = self.margin > 0
+            rows = np.flatnonzero(held & (100.0 * equity <= level * self.margin))
+            return [self._users[row] for row in rows]
+
+    # Trading engine order listener interface
+    def order_opened(self, user_id, order, user_data):
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                # Accounts holding orders already have a row (see ensure),
+                # so this account held none before this one
+                row = self._allocate(user_id)
+            self._apply(row, order, 1)
+            self.balance[row] = user_data['balance']
+
+    def order_closed(self, user_id, order, user_data):
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None or not user_data['open_orders']:
+                self._load(user_id, user_data)
+                return
+            self._apply(row, order, -1)
+            self.balance[row] = user_data['balance']
+
+
+def stop_out_orders(orders, pnls, margins, equity, level=STOP_OUT_LEVEL):
+    """Ids of the orders to close, largest loss first, to lift margin level above level.
+
+    Closing at market leaves equity unchanged and frees the order's margin,
+    so the number of closes follows from the running sum of freed margin.
+    """
+    by_loss = np.argsort(pnls, kind='stable')
+    remaining = margins.sum() - np.cumsum(margins[by_loss])
+    if equity > 0:
+        # Whether the level is safe once each close has freed its margin
+        safe = 100.0 * equity > level * remaining
+        count = int(np.argmax(safe)) + 1 if safe.any() else len(orders)
+    else:
+        count = len(orders)
+    return [orders[i]['id'] for i in by_loss[:count]]
+
+
+class StopOutEngine:
+    """Liquidates accounts whose margin level falls to the stop-out level"""
+
+    def __init__(self, trading_engine, level=STOP_OUT_LEVEL):
+        self.trading_engine = trading_engine
+        self.level = level
+
+    def on_ticks(self, ticks):
+        """Tick engine batch listener - one margin pass over every account"""
+        prices = self.trading_engine.data_fetcher.current_prices
+        for user_id in self.trading_engine.margin.breached(prices, self.level):
+            try:
+                result = self.trading_engine.stop_out(user_id, self.level)
+            except Exception:
+                logger.exception('stop out failed user=%s', user_id)
+                continue
+            if result is not None:
+                stop_outs.inc()
+                logger.warning('stop out user=%s margin_level=%.1f closed=%d pnl=%.2f',
+                               user_id, result['margin_level'], result['closed'], result['pnl'])
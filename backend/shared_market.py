@@ -0,0 +1,247 @@
+"""Market process shared by every worker in multi-worker mode.
+
+One process owns the price clock and the chart history. Its ticks are
+published to a shared memory board that workers poll, and workers fetch bar
+slices from it over a unix socket in the binary wire format, so every worker
+reports the same prices and charts. gunicorn.conf.py starts it:
+
+    python shared_market.py
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from market_feed import TickEngine
+from wire import encode_binary, decode_binary
+
+logger = logging.getLogger(__name__)
+
+MARKET_SHM_NAME = os.getenv('MARKET_SHM_NAME', 'trading-prices')
+MARKET_SOCKET = os.getenv('MARKET_SOCKET', os.path.join(tempfile.gettempdir(), 'trading-market.sock'))
+# How often workers look for a new tick on the board
+MARKET_POLL_INTERVAL = float(os.getenv('MARKET_POLL_INTERVAL', '0.02'))
+
+_FRAME = struct.Struct('<BI')  # status (0 ok, 1 error), payload length
+
+
+class PriceBoard:
+    """Latest price and time per symbol in shared memory.
+
+    The block is a float64 array: a sequence number, then (price, time) per
+    symbol in sorted symbol order. Writers make the sequence odd while they
+    update it, and readers retry until they see the same even sequence
+    before and after copying, so a reader never sees a torn tick.
+    """
+
+    def __init__(self, symbols, name=MARKET_SHM_NAME, create=False):
+        self.symbols = sorted(symbols)
+        self._index = {symbol: 1 + 2 * i for i, symbol in enumerate(self.symbols)}
+        size = (1 + 2 * len(self.symbols)) * 8
+        self._owner = create
+
+        if create:
+            try:
+                stale = SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = SharedMemory(name=name)
+            # Attaching registers the block with this process's resource
+            # tracker, which would unlink it when the worker exits
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._values = np.ndarray(1 + 2 * len(self.symbols), dtype=np.float64, buffer=self._shm.buf)
+        if create:
+            self._values[:] = 0
+
+    def publish(self, ticks):
+        values = self._values
+        values[0] += 1
+        for tick in ticks:
+            i = self._index[tick['symbol']]
+            values[i] = tick['price']
+            values[i + 1] = tick['time']
+        values[0] += 1
+
+    def read(self):
+        """Return (sequence, {symbol: (price, time)}) from a consistent snapshot"""
+        values = self._values
+        while True:
+            sequence = values[0]
+            if sequence % 2 == 0:
+                snapshot = values[1:].copy()
+                if values[0] == sequence:
+                    break
+            time.sleep(0)
+        return int(sequence), {
+            symbol: (float(snapshot[i - 1]), float(snapshot[i]))
+            for symbol, i in self._index.items()
+        }
+
+    def close(self):
+        self._values = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class SharedTickReader(TickEngine):
+    """Worker-side tick engine fed from the price board instead of its own clock.
+
+    Listeners and subscribers see the market process's ticks exactly as they
+    would see local ones, and the worker's current prices follow the board.
+    """
+
+    def __init__(self, data_fetcher, symbols, board, poll_interval=MARKET_POLL_INTERVAL):
+        super().__init__(data_fetcher, symbols, poll_interval)
+        self.board = board
+        self._sequence = None
+
+    def start(self):
+        # Take over the published prices before the first request
+        self._read_board()
+        super().start()
+
+    def _tick(self):
+        self._read_board()
+
+    def _read_board(self):
+        sequence, prices = self.board.read()
+        if sequence == self._sequence:
+            return
+        self._sequence = sequence
+
+        ticks = []
+        for symbol in self.symbols:
+            price, published = prices[symbol]
+            last = self.last_ticks.get(symbol)
+            if published and (last is None or last['time'] != published):
+                self.data_fetcher.current_prices[symbol] = price
+                ticks.append({'symbol': symbol, 'price': price, 'time': published})
+        if ticks:
+            self._dispatch(ticks)
+
+
+class _HistoryRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # One connection serves many requests, one JSON line each
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                series = self.server.data_fetcher.history.slice(
+                    request['symbol'], request['interval'], int(request['points'])
+                )
+                status, payload = 0, encode_binary(series, 64)
+            except Exception as e:
+                status, payload = 1, str(e).encode()
+            self.wfile.write(_FRAME.pack(status, len(payload)) + payload)
+            self.wfile.flush()
+
+
+class HistoryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, data_fetcher):
+        if os.path.exists(path):
+            os.remove(path)
+        self.data_fetcher = data_fetcher
+        super().__init__(path, _HistoryRequestHandler)
+
+
+class RemoteHistory:
+    """Stands in for a worker's HistoryStore; bars come from the market process"""
+
+    def __init__(self, path=MARKET_SOCKET):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            conn = self._local.conn = sock.makefile('rwb')
+        return conn
+
+    def _request(self, request):
+        conn = self._connection()
+        conn.write(json.dumps(request).encode() + b'\n')
+        conn.flush()
+        header = conn.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            raise ConnectionError('Market process closed the connection')
+        status, length = _FRAME.unpack(header)
+        payload = conn.read(length)
+        if status:
+            raise ValueError(payload.decode())
+        return decode_binary(payload)
+
+    def slice(self, symbol, interval, points):
+        request = {'symbol': symbol, 'interval': interval, 'points': points}
+        try:
+            return self._request(request)
+        except (ConnectionError, OSError):
+            # The market process may have restarted - reconnect once
+            self._local.conn = None
+            return self._request(request)
+
+    def get(self, symbol):
+        """History lives in the market process, nothing to warm here"""
+        return None
+
+    def warm(self, symbols):
+        pass
+
+    def on_tick(self, symbol, price, now):
+        pass
+
+
+def run_market():
+    from data_fetcher import DataFetcher
+
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s %(message)s'
+    )
+
+    data_fetcher = DataFetcher()
+    symbols = list(data_fetcher.symbols)
+    board = PriceBoard(symbols, create=True)
+    tick_engine = TickEngine(data_fetcher, symbols)
+    tick_engine.add_listener(lambda tick: board.publish([tick]))
+    tick_engine.start()
+    board.publish(list(tick_engine.last_ticks.values()))
+
+    server = HistoryServer(MARKET_SOCKET, data_fetcher)
+
+    def shutdown(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    logger.info('market process ready symbols=%s socket=%s', ','.join(symbols), MARKET_SOCKET)
+    try:
+        server.serve_forever()
+    finally:
+        tick_engine.stop()
+        server.server_close()
+        board.close()
+        if os.path.exists(MARKET_SOCKET):
+            os.remove(MARKET_SOCKET)
+
+
+if __name__ == '__main__':
+    run_market()
@@ -0,0 +1,263 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+from metrics import observe_storage, storage_payload_size
+
+load_dotenv()
+
+JSONBIN_API_KEY = os.getenv('JSONBIN_API_KEY', 'your-jsonbin-api-key')
+JSONBIN_BIN_ID = os.getenv('JSONBIN_BIN_ID', 'your-jsonbin-bin-id')
+# Point at a stand-in server (e.g. benchmarks/fake_jsonbin.py) for offline runs
+JSONBIN_BASE_URL = os.getenv('JSONBIN_BASE_URL', 'https://api.jsonbin.io/v3').rstrip('/')
+JSONBIN_URL = f'{JSONBIN_BASE_URL}/b'
+
+# Seconds to wait on JSONBin, and keep-alive connections kept open to it
+JSONBIN_TIMEOUT = float(os.getenv('JSONBIN_TIMEOUT', '10'))
+JSONBIN_POOL_SIZE = int(os.getenv('JSONBIN_POOL_SIZE', '16'))
+
+# Which backend holds user accounts: 'sqlite' (local, per-user rows) or
+# 'jsonbin' (legacy, whole document per request)
+USER_STORE = os.getenv('USER_STORE', 'sqlite')
+USER_DB_PATH = os.getenv(
+    'USER_DB_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'users.db')
+)
+
+
+class StorageError(Exception):
+    """Raised when a storage backend fails to persist data"""
+
+
+_http = None
+_http_lock = threading.Lock()
+
+def _http_session():
+    """Shared keep-alive session, so requests reuse pooled TLS connections"""
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                # Only the JSONBin backend talks HTTP, so the SQLite one never
+                # pays for importing requests
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=JSONBIN_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http = session
+    return _http
+
+def get_bin_data():
+    import requests
+
+    headers = {
+        'X-Master-Key': JSONBIN_API_KEY,
+        'X-Bin-Meta': 'false'
+    }
+
+    started = time.perf_counter()
+    try:
+        response = _http_session().get(
+            f'{JSONBIN_URL}/{JSONBIN_BIN_ID}/latest',
+            headers=headers,
+            timeout=JSONBIN_TIMEOUT
+        )
+    except requests.RequestException:
+        observe_storage('jsonbin', 'get', started, 'error')
+        raise
+    observe_storage('jsonbin', 'get', started, 'ok' if response.status_code == 200 else 'miss')
+    storage_payload_size.observe(len(response.content), 'jsonbin', 'read')
+
+    if response.status_code == 200:
+        return response.json()
+    else:
+        # Return empty structure if bin doesn't exist
+        return {'users': {}}
+
+def update_bin_data(data):
+    import requests
+
+    headers = {
+        'X-Master-Key': JSONBIN_API_KEY,
+        'Content-Type': 'application/json'
+    }
+
+    body = json.dumps(data)
+    storage_payload_size.observe(len(body), 'jsonbin', 'write')
+    started = time.perf_counter()
+    try:
+        response = _http_session().put(
+            f'{JSONBIN_URL}/{JSONBIN_BIN_ID}',
+            headers=headers,
+            data=body,
+            timeout=JSONBIN_TIMEOUT
+        )
+    except requests.RequestException:
+        observe_storage('jsonbin', 'put', started, 'error')
+        raise
+    observe_storage('jsonbin', 'put', started, 'ok' if response.status_code == 200 else 'error')
+
+    return response.status_code == 200
+
+
+class UserStore:
+    """Interface every account storage backend implements"""
+
+    def get_user(self, username):
+        """Return the stored record for a user, or an empty dict"""
+        raise NotImplementedError
+
+    def put_user(self, username, user_data):
+        """Replace a user's record, returns True on success"""
+        raise NotImplementedError
+
+    def create_user(self, username, user_data):
+        """Insert a new user, returns False if the username is taken"""
+        raise NotImplementedError
+
+    def put_users(self, users):
+        """Replace several records at once"""
+        return all(self.put_user(username, user_data)
+                   for username, user_data in users.items())
+
+    def iter_users(self):
+        """Yield (username, user_data) for every stored account"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JSONBinStore(UserStore):
+    """Legacy backend - the whole users document lives in a single bin"""
+
+    def get_user(self, username):
+        return get_bin_data().get('users', {}).get(username, {})
+
+    def put_user(self, username, user_data):
+        return self.put_users({username: user_data})
+
+    def put_users(self, users):
+        data = get_bin_data()
+        data.setdefault('users', {}).update(users)
+        return update_bin_data(data)
+
+    def create_user(self, username, user_data):
+        data = get_bin_data()
+        existing = data.setdefault('users', {})
+        if username in existing:
+            return False
+
+        existing[username] = user_data
+        if not update_bin_data(data):
+            raise StorageError('Failed to write JSONBin document')
+        return True
+
+    def iter_users(self):
+        return iter(get_bin_data().get('users', {}).items())
+
+
+class SQLiteStore(UserStore):
+    """Local embedded backend - one row per user, keyed by username"""
+
+    def __init__(self, path=USER_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS users ('
+            ' username TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        conn.commit()
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads, so every
+        # request thread gets its own one
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_user(self, username):
+        started = time.perf_counter()
+        row = self._connect().execute(
+            'SELECT data FROM users WHERE username = ?', (username,)
+        ).fetchone()
+        observe_storage('sqlite', 'get', started, 'ok' if row else 'miss')
+        if not row:
+            return {}
+        storage_payload_size.observe(len(row[0]), 'sqlite', 'read')
+        return json.loads(row[0])
+
+    def put_user(self, username, user_data):
+        return self.put_users({username: user_data})
+
+    def put_users(self, users):
+        conn = self._connect()
+        rows = [(username, json.dumps(user_data)) for username, user_data in users.items()]
+        for _, data in rows:
+            storage_payload_size.observe(len(data), 'sqlite', 'write')
+        started = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO users (username, data) VALUES (?, ?)', rows
+                )
+        except sqlite3.Error:
+            observe_storage('sqlite', 'put', started, 'error')
+            return False
+        observe_storage('sqlite', 'put', started)
+        return True
+
+    def create_user(self, username, user_data):
+        conn = self._connect()
+        started = time.perf_counter()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)',
+                    (username, json.dumps(user_data))
+                )
+        except sqlite3.Error as e:
+            observe_storage('sqlite', 'create', started, 'error')
+            raise StorageError(str(e))
+        observe_storage('sqlite', 'create', started, 'ok' if cursor.rowcount == 1 else 'exists')
+        return cursor.rowcount == 1
+
+    def iter_users(self):
+        cursor = self._connect().execute('SELECT username, data FROM users')
+        for username, data in cursor:
+            yield username, json.loads(data)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Return the process-wide user store selected by USER_STORE"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if USER_STORE == 'jsonbin':
+                    _store = JSONBinStore()
+                else:
+                    _store = SQLiteStore(USER_DB_PATH)
+    return _store
@@ -0,0 +1,101 @@
+"""Instrument registry.
+
+Every tradable symbol is described by one SymbolSpec: price grid, contract
+terms, simulation bounds and volatility, and session activity. The data
+generator, the trading engine and the routes all look specs up by symbol,
+so adding an instrument means adding a spec, not another branch.
+
+Extra instruments can be loaded from a JSON file (SYMBOLS_FILE) holding a
+list of objects with SymbolSpec's keyword arguments; a symbol that is
+already defined is replaced.
+"""
+import json
+import os
+
+import numpy as np
+
+SYMBOLS_FILE = os.getenv('SYMBOLS_FILE')
+
+# (first hour, last hour, activity) in local time, first match wins; hours
+# outside every session trade at OFF_SESSION_ACTIVITY
+FX_SESSIONS = (
+    (8, 16, 1.5),   # London
+    (13, 21, 2.0)   # New York
+)
+OFF_SESSION_ACTIVITY = 0.5
+
+
+class SymbolSpec:
+    """One instrument.
+
+    Prices move on a tick_size grid inside bounds. Lots are contract_size
+    units with margin_rate of that held as margin. The simulation drifts by
+    direction * strength per hour with hourly noise scaled by volatility,
+    never moving more than move_cap per hour or tick_move per live tick.
+    base_volume is the hourly volume at activity 1.
+    """
+
+    def __init__(self, symbol, name, base_price, bounds, tick_size, volatility,
+                 move_cap, tick_move, base_volume, direction=1, strength=0.1,
+                 contract_size=1000, margin_rate=0.01, sessions=FX_SESSIONS):
+        self.symbol = symbol
+        self.name = name
+        self.base_price = float(base_price)
+        self.bounds = (float(bounds[0]), float(bounds[1]))
+        self.tick_size = float(tick_size)
+        self.volatility = float(volatility)
+        self.move_cap = float(move_cap)
+        self.tick_move = float(tick_move)
+        self.base_volume = int(base_volume)
+        self.direction = direction
+        self.strength = float(strength)
+        self.contract_size = contract_size
+        self.margin_rate = float(margin_rate)
+        self.sessions = tuple(tuple(session) for session in sessions)
+
+        # Session activity for each local hour, so lookups are one index
+        self.hourly_activity = np.full(24, OFF_SESSION_ACTIVITY)
+        for hour in range(24):
+            for first, last, activity in self.sessions:
+                if first <= hour <= last:
+                    self.hourly_activity[hour] = activity
+                    break
+
+    def activity(self, hour):
+        return float(self.hourly_activity[hour])
+
+    def as_dict(self):
+        """Public description for clients"""
+        return {
+            'symbol': self.symbol,
+            'name': self.name,
+            'tick_size': self.tick_size,
+            'contract_size': self.contract_size,
+            'margin_rate': self.margin_rate,
+            'bounds': list(self.bounds)
+        }
+
+
+DEFAULT_SYMBOLS = (
+    SymbolSpec('XAUUSD', 'XAU/USD (Gold)', base_price=1950.0, bounds=(1800, 2200),
+               tick_size=0.01, volatility=15, move_cap=20, tick_move=0.5,
+               base_volume=10000, direction=1, strength=0.3),
+    SymbolSpec('EURUSD', 'EUR/USD', base_price=1.0850, bounds=(1.05, 1.12),
+               tick_size=0.00001, volatility=0.005, move_cap=0.02, tick_move=0.0005,
+               base_volume=50000, direction=-1, strength=0.1)
+)
+
+
+def load_symbols(path=SYMBOLS_FILE):
+    """Built-in specs plus those in path, keyed by symbol"""
+    symbols = {spec.symbol: spec for spec in DEFAULT_SYMBOLS}
+    if path:
+        with open(path) as f:
+            for fields in json.load(f):
+                spec = SymbolSpec(**fields)
+                symbols[spec.symbol] = spec
+    return symbols
+
+
+# Every symbol this process trades
+SYMBOLS = load_symbols()
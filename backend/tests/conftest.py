@@ -0,0 +1,41 @@
+"""Shared fixtures. Run from the repository root with: python -m pytest backend/tests
+
+Storage, journal and ledger paths point at a throwaway directory before any
+backend module is imported, so tests never touch the real data files.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+_DATA_DIR = tempfile.mkdtemp(prefix='trading-tests-')
+os.environ.setdefault('USER_DB_PATH', os.path.join(_DATA_DIR, 'users.db'))
+os.environ.setdefault('PORTFOLIO_JOURNAL_PATH', os.path.join(_DATA_DIR, 'portfolio.journal'))
+os.environ.setdefault('ORDER_LEDGER_PATH', os.path.join(_DATA_DIR, 'orders.ledger'))
+os.environ.setdefault('USER_STORE', 'sqlite')
+# Prices only move when a test moves them
+os.environ.setdefault('TICK_INTERVAL', '3600')
+os.environ.setdefault('PASSWORD_HASH_ITERATIONS', '1000')
+
+_usernames = (f'user{i}' for i in itertools.count())
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as a new account"""
+    client = app.test_client()
+    response = client.post('/api/register', json={'username': next(_usernames), 'password': 'secret'})
+    assert response.status_code == 200
+    return client
@@ -0,0 +1,41 @@
+import asyncio
+
+import asgi
+from symbols import SYMBOLS
+
+
+def run_stream(asgi_app, query_string, monkeypatch):
+    """Messages sent for a price stream request and the symbols it subscribed to"""
+    subscribed = []
+
+    async def two_ticks(fanout, symbols):
+        subscribed.extend(symbols)
+        yield 'data: 1\n\n'
+        yield 'data: 2\n\n'
+
+    monkeypatch.setattr(asgi, 'astream_ticks', two_ticks)
+    sent = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/stream/prices',
+             'query_string': query_string, 'headers': []}
+    asyncio.run(asgi_app.stream_prices(scope, receive, send))
+    return sent, subscribed
+
+
+def test_event_stream_ends_with_final_body(app, monkeypatch):
+    sent, _ = run_stream(asgi.TradingASGI(app), b'symbols=XAUUSD', monkeypatch)
+    assert sent[0]['status'] == 200
+    assert [message['body'] for message in sent[1:3]] == [b'data: 1\n\n', b'data: 2\n\n']
+    assert sent[-1] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+
+
+def test_blank_symbols_streams_every_symbol(app, monkeypatch):
+    sent, subscribed = run_stream(asgi.TradingASGI(app), b'symbols=', monkeypatch)
+    assert sent[0]['status'] == 200
+    assert subscribed == list(SYMBOLS)
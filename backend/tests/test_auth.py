@@ -0,0 +1,21 @@
+import threading
+
+import auth
+import passwords
+
+
+def test_unknown_user_is_checked_against_a_dummy_hash(app, monkeypatch):
+    checked = []
+
+    def recording_verify(stored, password):
+        checked.append(stored)
+        return passwords.verify_password(stored, password)
+
+    monkeypatch.setattr(auth, 'verify_password', recording_verify)
+    response = app.test_client().post('/api/login', json={'username': 'nobody-here', 'password': 'secret'})
+    assert response.status_code == 401
+    assert checked == [passwords.dummy_hash()]
+
+
+def test_hashing_runs_in_the_calling_thread():
+    assert passwords.run_hashing(threading.current_thread) is threading.current_thread()
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from data_fetcher import DataFetcher
+from timeframes import SEED_SECONDS, MarketHistory
+
+
+@pytest.mark.parametrize('symbol', ['XAUUSD', 'EURUSD'])
+def test_seeded_history_stays_off_the_bounds(symbol):
+    data_fetcher = DataFetcher()
+    low, high = data_fetcher.symbols[symbol].bounds
+    margin = (high - low) * 0.005
+
+    history = MarketHistory(symbol, data_fetcher)
+    for interval in ('1m', '1h', '1d'):
+        closes = history.bars(interval, SEED_SECONDS)['close']
+        at_bounds = np.mean((closes < low + margin) | (closes > high - margin))
+        assert at_bounds < 0.2, f'{interval}: {at_bounds:.0%} of closes at the bounds'
@@ -0,0 +1,34 @@
+import numpy as np
+
+from data_fetcher import DataFetcher
+from indicators import IndicatorCache, parse_indicators
+
+SPECS = 'sma:20,ema:20,ema:200,rsi:14,bb:20:2,atr:14'
+
+
+def test_refreshed_window_matches_a_full_recompute():
+    bars = DataFetcher().generate_series('XAUUSD', 700, '1m', seed=7)
+    indicators = parse_indicators(SPECS)
+    cache = IndicatorCache()
+
+    # A fixed size window slides as bars close, with a few refreshes per bar
+    window = 500
+    for end in [window, window, window + 1, window + 5, window + 5, window + 60, window + 200]:
+        view = {column: values[end - window:end] for column, values in bars.items()}
+        refreshed = cache.compute('XAUUSD', '1m', view, indicators)
+        full = IndicatorCache().compute('XAUUSD', '1m', view, indicators)
+        for column, values in full.items():
+            np.testing.assert_allclose(refreshed[column], values, rtol=1e-9, err_msg=f'{column} at {end}')
+
+
+def test_windows_of_different_sizes_do_not_share_a_seed():
+    bars = DataFetcher().generate_series('XAUUSD', 600, '1m', seed=3)
+    indicators = parse_indicators('ema:20,rsi:14')
+    cache = IndicatorCache()
+
+    for size in (600, 100, 600, 100):
+        view = {column: values[-size:] for column, values in bars.items()}
+        refreshed = cache.compute('XAUUSD', '1m', view, indicators)
+        full = IndicatorCache().compute('XAUUSD', '1m', view, indicators)
+        for column, values in full.items():
+            np.testing.assert_allclose(refreshed[column], values, rtol=1e-9, err_msg=f'{column} at {size}')
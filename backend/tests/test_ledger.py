@@ -0,0 +1,104 @@
+import os
+import zlib
+
+import pytest
+
+import ledger
+from ledger import OrderLedger, rebalance
+from ownership import slot_path
+
+
+def closed(order_id, at):
+    return {'id': order_id, 'symbol': 'XAUUSD', 'type': 'buy', 'lot_size': 1, 'pnl': 1.0,
+            'close_time': f'2024-01-01T00:00:{at:02d}'}
+
+
+def record(path, trades, snapshot_every=5000):
+    """Append (user, order_id) close events, leaving the ledger open as a crash would"""
+    book = OrderLedger(path, fsync=False, snapshot_every=snapshot_every)
+    for i, (user, order_id) in enumerate(trades):
+        book.append(user, 'close', closed(order_id, i), 1000.0 + i)
+    return book
+
+
+def history_ids(path, user):
+    book = OrderLedger(path, fsync=False)
+    try:
+        return [trade['id'] for trade in book.history(user, limit=500)['trades']]
+    finally:
+        book.close()
+
+
+def test_reopen_loads_snapshot_and_replays_the_tail(tmp_path):
+    path = str(tmp_path / 'orders.ledger')
+    # A snapshot after the first two events, the third only in the ledger
+    record(path, [('alice', 'a1'), ('alice', 'a2'), ('alice', 'a3')], snapshot_every=2)
+    assert os.path.exists(path + '.snapshot')
+    assert history_ids(path, 'alice') == ['a3', 'a2', 'a1']
+
+
+def test_torn_final_line_is_dropped(tmp_path):
+    path = str(tmp_path / 'orders.ledger')
+    record(path, [('alice', 'a1')])
+    with open(path, 'ab') as f:
+        f.write(b'{"seq": 2, "user": "alice", "ev')
+
+    book = OrderLedger(path, fsync=False)
+    book.append('alice', 'close', closed('a2', 2), 2000.0)
+    book.close()
+    assert history_ids(path, 'alice') == ['a2', 'a1']
+
+
+def test_snapshot_ahead_of_the_ledger_is_ignored(tmp_path):
+    path = str(tmp_path / 'orders.ledger')
+    record(path, [('alice', 'a1'), ('alice', 'a2')]).close()
+    open(path, 'wb').close()
+    assert history_ids(path, 'alice') == []
+
+
+def owner_among(count):
+    return lambda user: zlib.crc32(user.encode()) % count
+
+
+def test_history_follows_accounts_when_the_worker_count_changes(tmp_path):
+    path = str(tmp_path / 'orders.ledger')
+    users = [f'user{i}' for i in range(20)]
+    record(path, [(user, f'{user}-{n}') for n in range(3) for user in users]).close()
+    expected = {user: [f'{user}-2', f'{user}-1', f'{user}-0'] for user in users}
+
+    rebalance(path, 4, owner_among(4))
+    assert not os.path.exists(path)
+    for user in users:
+        assert history_ids(slot_path(path, owner_among(4)(user)), user) == expected[user]
+
+    rebalance(path, 3, owner_among(3))
+    assert not os.path.exists(slot_path(path, 3))
+    for user in users:
+        assert history_ids(slot_path(path, owner_among(3)(user)), user) == expected[user]
+
+    rebalance(path, 1, None)
+    assert all(history_ids(path, user) == expected[user] for user in users)
+
+
+def test_interrupted_rebalance_finishes_on_the_next_start(tmp_path, monkeypatch):
+    path = str(tmp_path / 'orders.ledger')
+    users = [f'user{i}' for i in range(20)]
+    record(path, [(user, f'{user}-0') for user in users]).close()
+
+    real_replace = os.replace
+    moves = []
+
+    def crash_after_one_move(src, dst):
+        if moves:
+            raise OSError('crashed')
+        moves.append(dst)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(ledger.os, 'replace', crash_after_one_move)
+    with pytest.raises(OSError):
+        rebalance(path, 2, owner_among(2))
+    monkeypatch.setattr(ledger.os, 'replace', real_replace)
+
+    rebalance(path, 2, owner_among(2))
+    for user in users:
+        assert history_ids(slot_path(path, owner_among(2)(user)), user) == [f'{user}-0']
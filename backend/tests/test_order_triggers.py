@@ -0,0 +1,63 @@
+import pytest
+
+from order_triggers import TriggerBook, TriggerEngine
+
+
+class _Engine:
+    def __init__(self):
+        self.order_listeners = []
+
+
+def order(order_id, order_type, stop_loss=None, take_profit=None):
+    return {'id': order_id, 'symbol': 'XAUUSD', 'type': order_type,
+            'stop_loss': stop_loss, 'take_profit': take_profit}
+
+
+def test_book_pops_only_crossed_levels_nearest_first():
+    book = TriggerBook()
+    for level in (1900.0, 1950.0, 1920.0):
+        book.add(level, True, f'below-{level:.0f}', 'stop_loss')
+    for level in (2000.0, 1980.0):
+        book.add(level, False, f'above-{level:.0f}', 'take_profit')
+
+    assert book.pop_crossed(1960.0) == []
+    assert book.pop_crossed(1915.0) == [('below-1950', 'stop_loss'), ('below-1920', 'stop_loss')]
+    assert book.pop_crossed(1990.0) == [('above-1980', 'take_profit')]
+    assert len(book) == 2
+
+
+def test_engine_fires_each_side_in_the_right_direction():
+    engine = TriggerEngine(_Engine())
+    engine.add_order('alice', order('long', 'buy', stop_loss=1900.0, take_profit=2000.0))
+    engine.add_order('bob', order('short', 'sell', stop_loss=2000.0, take_profit=1900.0))
+
+    assert engine.check('XAUUSD', 1950.0) == []
+    assert sorted(engine.check('XAUUSD', 2000.0)) == [('alice', 'long', 'take_profit'),
+                                                      ('bob', 'short', 'stop_loss')]
+    # Each order fires once, its other level is skipped
+    assert engine.check('XAUUSD', 1900.0) == []
+
+
+def test_orders_closed_elsewhere_do_not_fire():
+    engine = TriggerEngine(_Engine())
+    engine.add_order('alice', order('a', 'buy', stop_loss=1900.0))
+    engine.add_order('alice', order('b', 'buy', stop_loss=1890.0))
+    engine.remove_order('a')
+    assert engine.check('XAUUSD', 1850.0) == [('alice', 'b', 'stop_loss')]
+
+
+@pytest.mark.parametrize('key, offset', [('stop_loss', -5), ('take_profit', 5)])
+def test_crossed_level_closes_the_order_at_the_tick_price(app, client, key, offset):
+    components = app.extensions['trading']
+    live = components.data_fetcher.get_current_price('XAUUSD')
+    placed = client.post('/api/place-order', json={
+        'symbol': 'XAUUSD', 'type': 'buy', 'lot_size': 0.1, key: live + offset
+    }).get_json()
+    assert placed['success']
+
+    price = live + 2 * offset
+    components.trigger_engine.on_tick({'symbol': 'XAUUSD', 'price': price})
+
+    assert client.get('/api/portfolio').get_json()['open_orders'] == []
+    trade = client.get('/api/history').get_json()['trades'][0]
+    assert (trade['id'], trade['close_reason'], trade['close_price']) == (placed['order']['id'], key, price)
@@ -0,0 +1,33 @@
+from flask import session
+
+import ownership
+from ownership import OwnerRouter
+
+
+def router_owning_nothing(monkeypatch):
+    """OwnerRouter whose worker owns no account, recording forwards instead of sending them"""
+    monkeypatch.setattr(ownership, 'owns', lambda username: False)
+    monkeypatch.setattr(ownership, 'owner_of', lambda username: 1)
+    router = OwnerRouter.__new__(OwnerRouter)
+    router.forward = lambda slot: f'forwarded to {slot}'
+    return router
+
+
+def test_market_data_is_served_locally(app, monkeypatch):
+    router = router_owning_nothing(monkeypatch)
+    for path in ('/api/data/XAUUSD', '/api/current-price/XAUUSD', '/api/symbols',
+                 '/api/stream/prices', '/metrics'):
+        with app.test_request_context(path):
+            session['user_id'] = 'someone'
+            assert router.route() is None, path
+
+
+def test_account_requests_are_forwarded(app, monkeypatch):
+    router = router_owning_nothing(monkeypatch)
+    for path in ('/api/portfolio', '/api/history', '/api/stream/portfolio'):
+        with app.test_request_context(path):
+            session['user_id'] = 'someone'
+            assert router.route() == 'forwarded to 1', path
+    with app.test_request_context('/api/place-order', method='POST', json={'symbol': 'XAUUSD'}):
+        session['user_id'] = 'someone'
+        assert router.route() == 'forwarded to 1'
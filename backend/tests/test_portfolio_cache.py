@@ -0,0 +1,154 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from portfolio_cache import PortfolioCache, recover_worker_journals
+from storage import SQLiteStore, StorageError
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def journal(path, *entries):
+    with open(path, 'w') as f:
+        for user, balance in entries:
+            f.write(json.dumps({'user': user, 'data': {'balance': balance, 'open_orders': []}}) + '\n')
+
+
+def test_journals_of_every_worker_slot_are_replayed(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'users.db'))
+    base = str(tmp_path / 'portfolio.journal')
+    # A crash left journals for four slots; the restart runs fewer workers
+    journal(base, ('solo', 1.0))
+    journal(str(tmp_path / 'portfolio-0.journal'), ('alice', 10.0))
+    journal(str(tmp_path / 'portfolio-3.journal.1'), ('bob', 20.0))
+    journal(str(tmp_path / 'portfolio-3.journal'), ('bob', 30.0), ('carol', 40.0))
+
+    assert recover_worker_journals(base, store) == 4
+    assert {user: store.get_user(user)['balance'] for user in ('solo', 'alice', 'bob', 'carol')} == \
+        {'solo': 1.0, 'alice': 10.0, 'bob': 30.0, 'carol': 40.0}
+    assert not [name for name in os.listdir(tmp_path) if 'journal' in name]
+
+
+def open_cache(tmp_path, store, **options):
+    return PortfolioCache(store=store, journal_path=str(tmp_path / 'portfolio.journal'),
+                          flush_interval=3600, fsync=False, **options)
+
+
+def test_account_stays_cached_while_its_flush_is_in_flight(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'users.db'))
+    store.create_user('alice', {'balance': 0.0, 'open_orders': []})
+    cache = open_cache(tmp_path, store)
+    cache.put('alice', {'balance': 1.0, 'open_orders': []})
+
+    writing, release = threading.Event(), threading.Event()
+    put_users = store.put_users
+
+    def slow_put_users(users):
+        writing.set()
+        release.wait(5)
+        return put_users(users)
+
+    store.put_users = slow_put_users
+    flusher = threading.Thread(target=cache.flush)
+    flusher.start()
+    try:
+        assert writing.wait(5)
+        cache.invalidate('alice')
+        cache.evict_idle()
+        assert cache.get('alice')['balance'] == 1.0
+    finally:
+        release.set()
+        flusher.join()
+
+    cache.invalidate('alice')
+    assert cache.get('alice')['balance'] == 1.0
+    cache.close()
+
+
+def test_locks_do_not_grow_with_usernames(tmp_path):
+    cache = open_cache(tmp_path, SQLiteStore(str(tmp_path / 'users.db')), lock_stripes=64)
+    assert cache.lock('alice') is cache.lock('alice')
+    for i in range(1000):
+        assert cache.get(f'nobody{i}') == {}
+    assert len(cache._user_locks) == 64
+    cache.close()
+
+
+CRASHING_WRITER = '''
+import sys
+from portfolio_cache import PortfolioCache
+from storage import SQLiteStore
+
+cache = PortfolioCache(store=SQLiteStore(sys.argv[1]), journal_path=sys.argv[2], flush_interval=3600)
+cache.put('alice', {'balance': 42.0, 'open_orders': [{'id': 'o1'}]})
+cache.put('bob', {'balance': 7.0, 'open_orders': []})
+print('acknowledged', flush=True)
+sys.stdin.read()
+'''
+
+
+def test_acknowledged_writes_survive_a_killed_process(tmp_path):
+    db, journal_path = str(tmp_path / 'users.db'), str(tmp_path / 'portfolio.journal')
+    store = SQLiteStore(db)
+    store.create_user('alice', {'balance': 0.0, 'open_orders': []})
+
+    process = subprocess.Popen([sys.executable, '-c', CRASHING_WRITER, db, journal_path],
+                               cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    assert process.stdout.readline().strip() == 'acknowledged'
+    process.kill()
+    process.wait()
+    # Killed before its first flush, with a torn line after the acknowledged ones
+    assert store.get_user('alice')['balance'] == 0.0
+    with open(journal_path, 'a') as f:
+        f.write('{"user": "alice", "data": {"bal')
+
+    cache = open_cache(tmp_path, store)
+    assert store.get_user('alice') == {'balance': 42.0, 'open_orders': [{'id': 'o1'}]}
+    assert store.get_user('bob')['balance'] == 7.0
+    assert cache.get('alice')['balance'] == 42.0
+    cache.close()
+
+
+class FailingOnceStore(SQLiteStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.failures = 1
+
+    def put_users(self, users):
+        if self.failures:
+            self.failures -= 1
+            raise StorageError('store unavailable')
+        return super().put_users(users)
+
+
+def test_failed_flush_is_retried_and_its_journal_kept(tmp_path):
+    store = FailingOnceStore(str(tmp_path / 'users.db'))
+    cache = open_cache(tmp_path, store)
+    cache.put('alice', {'balance': 1.0, 'open_orders': []})
+
+    assert cache.flush() is False
+    assert not store.get_user('alice')
+    assert os.path.exists(cache.journal_path + '.1')
+
+    cache.put('bob', {'balance': 2.0, 'open_orders': []})
+    assert cache.flush() is True
+    assert store.get_user('alice')['balance'] == 1.0
+    assert store.get_user('bob')['balance'] == 2.0
+    assert not os.path.exists(cache.journal_path + '.1')
+    cache.close()
+
+
+def test_crash_after_a_failed_flush_replays_the_kept_journal(tmp_path):
+    store = FailingOnceStore(str(tmp_path / 'users.db'))
+    crashed = open_cache(tmp_path, store)
+    crashed.put('alice', {'balance': 1.0, 'open_orders': []})
+    assert crashed.flush() is False
+    crashed.put('alice', {'balance': 3.0, 'open_orders': []})
+
+    # A new process starts on the same files without the old one flushing
+    restarted = open_cache(tmp_path, store)
+    assert store.get_user('alice')['balance'] == 3.0
+    assert not [name for name in os.listdir(tmp_path) if 'journal' in name and name != 'portfolio.journal']
+    restarted.close()
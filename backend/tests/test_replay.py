@@ -0,0 +1,60 @@
+import pytest
+
+from replay import MAX_REPLAY_BARS
+
+
+def backtest(client, **fields):
+    payload = dict({'symbol': 'XAUUSD', 'start': '2024-01-01', 'end': '2024-01-10'}, **fields)
+    return client.post('/api/replay', json=payload)
+
+
+def test_replay_requires_login(app):
+    client = app.test_client()
+    assert backtest(client).status_code == 401
+    response = client.get('/api/replay/stream?symbol=XAUUSD&start=2024-01-01&end=2024-01-02')
+    assert response.status_code == 401
+
+
+def test_replay_is_capped(client):
+    response = backtest(client, end='2100-01-01', interval='1m')
+    assert response.status_code == 400
+    assert str(MAX_REPLAY_BARS) in response.get_json()['error']
+
+    response = client.get('/api/replay/stream?symbol=XAUUSD&start=2024-01-01&end=2100-01-01&interval=1m')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('order', [{'type': 'buy', 'bar': -1}, {'type': 'buy', 'close_bar': -5}])
+def test_negative_bar_index_is_rejected(client, order):
+    response = backtest(client, orders=[order])
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('seed', ['abc', 1.5, -1, [1]])
+def test_non_integer_seed_is_rejected(client, seed):
+    assert backtest(client, seed=seed).status_code == 400
+
+
+def test_non_integer_stream_seed_is_rejected(client):
+    response = client.get('/api/replay/stream?symbol=XAUUSD&start=2024-01-01&end=2024-01-02&seed=abc')
+    assert response.status_code == 400
+
+
+def test_seeded_backtest_is_reproducible(client):
+    orders = [{'type': 'buy', 'bar': 3, 'close_bar': 40}]
+    first = backtest(client, orders=orders, seed=7).get_json()
+    assert first['trades'][0]['close_reason'] in ('close_time', 'stop_loss', 'take_profit')
+    assert backtest(client, orders=orders, seed='7').get_json() == first
+
+
+def test_offline_backtests_are_not_capped_and_keep_off_the_ledger(monkeypatch, capsys):
+    import replay
+    import trading_engine
+
+    def no_shared_ledger():
+        raise AssertionError('offline backtest opened the shared order ledger')
+
+    monkeypatch.setattr(trading_engine, 'get_order_ledger', no_shared_ledger)
+    monkeypatch.setattr('sys.argv', ['replay.py', 'XAUUSD', '2024-01-01', '2024-03-01', '--interval', '1m'])
+    replay.main()
+    assert '86401 bars' in capsys.readouterr().out
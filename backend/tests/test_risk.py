@@ -0,0 +1,80 @@
+import numpy as np
+
+from risk import MarginBook, stop_out_orders
+from symbols import SYMBOLS
+
+
+def gold_order(order_id, lot_size=0.1, order_type='buy', open_price=1950.0):
+    return {'id': order_id, 'symbol': 'XAUUSD', 'type': order_type,
+            'lot_size': lot_size, 'open_price': open_price}
+
+
+def prices(gold):
+    return {symbol: spec.base_price for symbol, spec in SYMBOLS.items()} | {'XAUUSD': gold}
+
+
+def test_margin_is_a_share_of_notional_value():
+    book = MarginBook(SYMBOLS)
+    # 0.1 lot = 100 oz at 1950, 1% margin
+    assert book.order_margin(gold_order('a')) == 1950.0
+
+
+def test_breached_at_the_stop_out_level():
+    book = MarginBook(SYMBOLS)
+    book.load([('alice', {'balance': 10000.0, 'open_orders': [gold_order('a')]}),
+               ('bob', {'balance': 10000.0, 'open_orders': [gold_order('b', order_type='sell')]})])
+
+    # Alice's equity is 10000 + 100 * (price - 1950) against 1950 margin,
+    # so 50% is reached at 1859.75
+    assert book.breached(prices(1900.0), 50) == []
+    assert book.breached(prices(1859.0), 50) == ['alice']
+    assert book.breached(prices(2040.0), 50) == []
+    assert book.breached(prices(2041.0), 50) == ['bob']
+
+
+def test_summary_follows_opens_and_closes():
+    book = MarginBook(SYMBOLS)
+    first, second = gold_order('a'), gold_order('b', lot_size=0.3, open_price=1960.0)
+    book.order_opened('alice', first, {'balance': 10000.0, 'open_orders': [first]})
+    book.order_opened('alice', second, {'balance': 10000.0, 'open_orders': [first, second]})
+
+    summary = book.summary('alice', prices(1970.0))
+    position = summary['exposure']['XAUUSD']
+    assert position['orders'] == 2
+    assert np.isclose(position['net_lots'], 0.4)
+    assert np.isclose(position['avg_price'], 1957.5)
+    assert np.isclose(summary['unrealized_pnl'], 100 * 20 + 300 * 10)
+
+    book.order_closed('alice', first, {'balance': 10100.0, 'open_orders': [second]})
+    assert book.summary('alice', prices(1970.0))['exposure']['XAUUSD']['orders'] == 1
+    book.order_closed('alice', second, {'balance': 10200.0, 'open_orders': []})
+    assert book.summary('alice', prices(1970.0)) == {'unrealized_pnl': 0.0, 'exposure': {}}
+    assert book.account('alice', prices(1970.0)) is None
+
+
+def test_stop_out_closes_largest_losses_until_safe():
+    orders = [{'id': 'small'}, {'id': 'large'}, {'id': 'winner'}]
+    pnls = np.array([-50.0, -500.0, 20.0])
+    margins = np.array([100.0, 100.0, 100.0])
+
+    # Level after each close: 120 / 200, then 120 / 100
+    assert stop_out_orders(orders, pnls, margins, equity=120.0, level=50) == ['large']
+    assert stop_out_orders(orders, pnls, margins, equity=80.0, level=50) == ['large', 'small']
+    assert stop_out_orders(orders, pnls, margins, equity=-10.0, level=50) == ['large', 'small', 'winner']
+
+
+def test_stop_out_engine_liquidates_breached_accounts(app, client, monkeypatch):
+    components = app.extensions['trading']
+    data_fetcher = components.data_fetcher
+    live = data_fetcher.get_current_price('XAUUSD')
+    placed = client.post('/api/place-order', json={'symbol': 'XAUUSD', 'type': 'buy', 'lot_size': 0.4})
+    assert placed.get_json()['success']
+
+    # 400 oz lose the whole balance 25 lower
+    monkeypatch.setitem(data_fetcher.current_prices, 'XAUUSD', live - 25)
+    components.stop_out_engine.on_ticks([])
+
+    portfolio = client.get('/api/portfolio').get_json()
+    assert portfolio['open_orders'] == []
+    history = client.get('/api/history').get_json()
+    assert history['trades'][0]['close_reason'] == 'stop_out'
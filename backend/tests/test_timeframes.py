@@ -0,0 +1,29 @@
+import time
+
+from data_fetcher import DataFetcher
+from timeframes import HistoryStore
+
+
+def test_default_store_keeps_every_symbol():
+    data_fetcher = DataFetcher()
+    store = HistoryStore(data_fetcher)
+    store.warm(data_fetcher.symbols)
+    first = {symbol: store.get(symbol) for symbol in data_fetcher.symbols}
+    assert all(store.get(symbol) is history for symbol, history in first.items())
+
+
+def test_evicted_history_reloads_at_the_live_price():
+    data_fetcher = DataFetcher()
+    store = HistoryStore(data_fetcher, max_symbols=1)
+    store.get('XAUUSD')
+
+    # The live price moves on, then the history is evicted and reloaded
+    live = data_fetcher.current_prices['XAUUSD'] * 1.01
+    data_fetcher.current_prices['XAUUSD'] = live
+    store.on_tick('XAUUSD', live, time.time())
+    store.get('EURUSD')
+    assert store.get('XAUUSD').base.last_close == live
+    assert data_fetcher.current_prices['XAUUSD'] == live
+
+    closes = store.slice('XAUUSD', '1m', 2)['close']
+    assert abs(closes[-1] / closes[-2] - 1) < 0.01
@@ -0,0 +1,55 @@
+import pytest
+
+
+def test_forged_open_price_is_ignored(app, client):
+    data_fetcher = app.extensions['trading'].data_fetcher
+    live = data_fetcher.get_current_price('XAUUSD')
+
+    response = client.post('/api/place-order', json={
+        'symbol': 'XAUUSD', 'type': 'buy', 'lot_size': 0.1, 'current_price': 1.0
+    })
+    order = response.get_json()['order']
+    assert order['open_price'] == live
+
+    closed = client.post('/api/close-order', json={'order_id': order['id']}).get_json()
+    assert closed['success']
+    assert abs(closed['pnl']) < 1e-6
+
+
+@pytest.mark.parametrize('fields', [
+    {'lot_size': float('nan')},
+    {'lot_size': float('inf')},
+    {'lot_size': True},
+    {'lot_size': 0},
+    {'lot_size': '1'},
+    {'stop_loss': 'abc'},
+    {'stop_loss': float('nan')},
+    {'take_profit': float('inf')},
+    {'take_profit': False},
+])
+def test_invalid_order_values_are_rejected(client, fields):
+    response = client.post('/api/place-order', json=dict({'symbol': 'XAUUSD', 'type': 'buy'}, **fields))
+    assert response.status_code == 400
+    assert not response.get_json()['success']
+
+
+@pytest.mark.parametrize('order_type, key, offset', [
+    ('buy', 'stop_loss', 10), ('buy', 'take_profit', -10),
+    ('sell', 'stop_loss', -10), ('sell', 'take_profit', 10),
+])
+def test_levels_on_the_wrong_side_are_rejected(app, client, order_type, key, offset):
+    live = app.extensions['trading'].data_fetcher.get_current_price('XAUUSD')
+    response = client.post('/api/place-order', json={
+        'symbol': 'XAUUSD', 'type': order_type, key: live + offset
+    })
+    assert response.status_code == 400
+
+
+def test_valid_levels_are_accepted(app, client):
+    live = app.extensions['trading'].data_fetcher.get_current_price('XAUUSD')
+    response = client.post('/api/place-order', json={
+        'symbol': 'XAUUSD', 'type': 'sell', 'lot_size': 0.1, 'stop_loss': live + 10, 'take_profit': live - 10
+    })
+    order = response.get_json()['order']
+    assert (order['stop_loss'], order['take_profit']) == (live + 10, live - 10)
+    client.post('/api/close-order', json={'order_id': order['id']})
@@ -0,0 +1,249 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Bar length in seconds for each supported interval
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '1h': 3600,
+    '4h': 14400,
+    '1d': 86400
+}
+
+BASE_INTERVAL = '1m'
+ROLLUP_INTERVALS = ('5m', '15m', '1h', '4h', '1d')
+
+# Bars served for each (interval, period); the longest period per interval
+# sets the size of that interval's ring buffer
+PERIOD_POINTS = {
+    '1m': {'1d': 1440},
+    '5m': {'1d': 288, '5d': 288 * 5},
+    '15m': {'1d': 96, '5d': 96 * 5, '1mo': 96 * 30},
+    '1h': {'1d': 24, '5d': 24 * 5, '1mo': 24 * 30},
+    '4h': {'5d': 6 * 5, '1mo': 6 * 30, '3mo': 6 * 90},
+    '1d': {'1mo': 30, '3mo': 90}
+}
+DEFAULT_PERIOD = {'1m': '1d', '5m': '5d', '15m': '1mo', '1h': '1mo', '4h': '3mo', '1d': '3mo'}
+
+# History generated for a symbol on first use: enough to fill every ring,
+# plus a spare day so the oldest daily bar kept is a complete one
+SEED_SECONDS = 92 * 86400
+
+# Maximum number of symbols whose history is kept in memory; 0 keeps every
+# registered symbol, which the bounded registry makes the default
+SERIES_CACHE_SIZE = int(os.getenv('SERIES_CACHE_SIZE', '0'))
+
+COLUMNS = (
+    ('timestamp', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.int64)
+)
+
+
+def rollup(bars, step):
+    """Aggregate time-ordered bars into bars of step seconds"""
+    buckets = bars['timestamp'] // step * step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return {
+        'timestamp': buckets[starts],
+        'open': bars['open'][starts],
+        'high': np.maximum.reduceat(bars['high'], starts),
+        'low': np.minimum.reduceat(bars['low'], starts),
+        'close': bars['close'][ends],
+        'volume': np.add.reduceat(bars['volume'], starts)
+    }
+
+
+class RingBuffer:
+    """Fixed-capacity columnar bar storage, oldest bars are overwritten"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self._end = 0  # Bars ever written; the newest sits at (_end - 1) % capacity
+
+    def __len__(self):
+        return min(self._end, self.capacity)
+
+    @property
+    def last_timestamp(self):
+        return int(self._columns['timestamp'][(self._end - 1) % self.capacity]) if self._end else None
+
+    @property
+    def last_close(self):
+        return float(self._columns['close'][(self._end - 1) % self.capacity])
+
+    def extend(self, bars):
+        count = len(bars['timestamp'])
+        if count > self.capacity:
+            bars = {name: values[-self.capacity:] for name, values in bars.items()}
+            self._end += count - self.capacity
+            count = self.capacity
+        positions = (self._end + np.arange(count)) % self.capacity
+        for name, values in bars.items():
+            self._columns[name][positions] = values
+        self._end += count
+
+    def merge_last(self, high, low, close, volume):
+        """Fold more activity into the newest bar"""
+        i = (self._end - 1) % self.capacity
+        columns = self._columns
+        if high > columns['high'][i]:
+            columns['high'][i] = high
+        if low < columns['low'][i]:
+            columns['low'][i] = low
+        columns['close'][i] = close
+        columns['volume'][i] += volume
+
+    def tail(self, count):
+        """Copy of the newest count bars, oldest first"""
+        count = min(count, len(self))
+        positions = (self._end - count + np.arange(count)) % self.capacity
+        return {name: values[positions] for name, values in self._columns.items()}
+
+
+class MarketHistory:
+    """One symbol's 1m base bars plus every higher timeframe rolled up from them.
+
+    Live ticks update the forming 1m bar and the forming bar of each higher
+    timeframe in place; minutes without ticks are filled with generated bars
+    when the history is next touched. Every interval is therefore derived from
+    the same base bars and they always agree.
+    """
+
+    def __init__(self, symbol, data_fetcher, now=None, anchor=None):
+        self.symbol = symbol
+        self.spec = data_fetcher.symbols[symbol]
+        self.data_fetcher = data_fetcher
+        self._lock = threading.Lock()
+        self._last_tick = None
+        self._reset(time.time() if now is None else now, anchor)
+
+    def _reset(self, now, anchor=None):
+        """Generate the seed history, ending at anchor when one is given"""
+        self.base = RingBuffer(max(PERIOD_POINTS[BASE_INTERVAL].values()))
+        self.frames = {
+            interval: RingBuffer(max(PERIOD_POINTS[interval].values()))
+            for interval in ROLLUP_INTERVALS
+        }
+        minute = int(now) // 60 * 60
+        bars = self.data_fetcher.generate_series(
+            self.symbol, SEED_SECONDS // 60, BASE_INTERVAL, end_time=minute
+        )
+        if anchor is not None:
+            # Rescale so the history joins the price it continues from
+            ratio = anchor / bars['close'][-1]
+            for column in ('open', 'high', 'low', 'close'):
+                bars[column] = bars[column] * ratio
+            bars['close'][-1] = anchor
+        self._append(bars)
+
+    def _append(self, bars):
+        """Add closed or new base bars and roll them into every timeframe"""
+        self.base.extend(bars)
+        for interval, ring in self.frames.items():
+            rolled = rollup(bars, INTERVAL_SECONDS[interval])
+            if ring.last_timestamp == int(rolled['timestamp'][0]):
+                ring.merge_last(rolled['high'][0], rolled['low'][0], rolled['close'][0], rolled['volume'][0])
+                rolled = {name: values[1:] for name, values in rolled.items()}
+            if len(rolled['timestamp']):
+                ring.extend(rolled)
+
+    def _catch_up(self, minute):
+        """Generate bars for minutes before minute that saw no ticks"""
+        missing = (minute - self.base.last_timestamp) // 60
+        if missing > SEED_SECONDS // 60:
+            self._reset(minute, anchor=self.base.last_close)
+        elif missing > 0:
+            self._append(self.data_fetcher.generate_series(
+                self.symbol, missing, BASE_INTERVAL,
+                start_price=self.base.last_close,
+                end_time=minute
+            ))
+
+    def on_tick(self, price, now):
+        minute = int(now) // 60 * 60
+        # Synthetic volume for the time since the previous tick
+        elapsed = min(60.0, now - self._last_tick) if self._last_tick else 1.0
+        self._last_tick = now
+        activity = self.spec.hourly_activity[time.localtime(now).tm_hour]
+        volume = int(self.spec.base_volume * activity * random.uniform(0.8, 1.2) * elapsed / 3600)
+
+        with self._lock:
+            if minute > self.base.last_timestamp:
+                self._catch_up(minute - 60)
+                self._append({
+                    'timestamp': np.array([minute], dtype=np.int64),
+                    'open': np.array([price]),
+                    'high': np.array([price]),
+                    'low': np.array([price]),
+                    'close': np.array([price]),
+                    'volume': np.array([volume], dtype=np.int64)
+                })
+            else:
+                self.base.merge_last(price, price, price, volume)
+                for ring in self.frames.values():
+                    ring.merge_last(price, price, price, volume)
+
+    def bars(self, interval, count, now=None):
+        """Newest count bars of an interval, brought up to date first"""
+        minute = int(time.time() if now is None else now) // 60 * 60
+        with self._lock:
+            self._catch_up(minute)
+            ring = self.base if interval == BASE_INTERVAL else self.frames[interval]
+            return ring.tail(count)
+
+
+class HistoryStore:
+    """MarketHistory per symbol.
+
+    With a max_symbols limit the least recently used symbols are dropped; a
+    dropped symbol's history is regenerated ending at its live price, so its
+    charts still join the price being traded.
+    """
+
+    def __init__(self, data_fetcher, max_symbols=SERIES_CACHE_SIZE):
+        self.data_fetcher = data_fetcher
+        self.max_symbols = max_symbols
+        self._histories = OrderedDict()
+        self._anchored = set()
+        self._lock = threading.Lock()
+
+    def get(self, symbol):
+        with self._lock:
+            history = self._histories.get(symbol)
+            if history is None:
+                anchor = self.data_fetcher.current_prices[symbol] if symbol in self._anchored else None
+                history = self._histories[symbol] = MarketHistory(symbol, self.data_fetcher, anchor=anchor)
+                if anchor is None:
+                    # The live price picks up where the generated history ends
+                    self._anchored.add(symbol)
+                    self.data_fetcher.current_prices[symbol] = history.base.last_close
+            self._histories.move_to_end(symbol)
+            while self.max_symbols and len(self._histories) > self.max_symbols:
+                self._histories.popitem(last=False)
+        return history
+
+    def warm(self, symbols):
+        """Load histories up front, as many as the cache keeps"""
+        for symbol in list(symbols)[:self.max_symbols or None]:
+            self.get(symbol)
+
+    def slice(self, symbol, interval, points):
+        return self.get(symbol).bars(interval, points)
+
+    def on_tick(self, symbol, price, now):
+        """Feed a live tick to the symbol's history if it is loaded"""
+        history = self._histories.get(symbol)
+        if history is not None:
+            history.on_tick(price, now)
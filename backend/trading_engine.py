@@ -1,11 +1,53 @@
-from auth import get_user_data, update_user_data
+from auth import get_user_data, update_user_data, user_lock
+from ledger import get_order_ledger
+from metrics import orders_opened, orders_closed
+from risk import MarginBook, stop_out_orders
+import logging
+import math
 import uuid
+import numpy as np
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+
+class InvalidOrder(ValueError):
+    """An order request that can never be filled as given"""
+
+
+def _is_finite_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
 class TradingEngine:
-    def __init__(self):
-        self.lot_size = 1000  # $10 per pip for mini lot
-        
+    def __init__(self, data_fetcher, ledger=None):
+        self.data_fetcher = data_fetcher
+        # Contract size and margin per instrument
+        self.symbols = data_fetcher.symbols
+        # Objects notified with order_opened/order_closed(user_id, order, user_data)
+        # after each successful update
+        self.order_listeners = []
+
+        # Used and free margin and net position per account and symbol,
+        # re-valued on every tick
+        self.margin = MarginBook(self.symbols)
+        self.order_listeners.append(self.margin)
+
+        # Order events and trade history, kept out of the account record
+        self.ledger = ledger if ledger is not None else get_order_ledger()
+        self.order_listeners.append(self.ledger)
+
+    def _notify(self, event, user_id, order, user_data):
+        if event == 'order_opened':
+            orders_opened.inc(order['symbol'])
+        else:
+            orders_closed.inc(order['symbol'], order.get('close_reason', 'manual'))
+        for listener in self.order_listeners:
+            try:
+                getattr(listener, event)(user_id, order, user_data)
+            except Exception:
+                logger.exception('order listener failed event=%s order=%s', event, order['id'])
+
     def calculate_pnl(self, order_type, open_price, close_price, lot_size):
         if order_type == 'buy':
             return (close_price - open_price) * lot_size
@@ -13,85 +55,283 @@ class TradingEngine:
             return (open_price - close_price) * lot_size
     
     def place_order(self, user_id, order_data):
+        with user_lock(user_id):
+            return self._place_order(user_id, order_data)
+
+    def _place_order(self, user_id, order_data):
         user_data = get_user_data(user_id)
         if not user_data:
             return {'success': False, 'error': 'User not found'}
-        
-        symbol = order_data['symbol']
-        order_type = order_data['type']
+
+        order = self._build_order(order_data)
+        if 'error' in order:
+            raise InvalidOrder(order['error'])
+
+        if self._free_margin(user_id, user_data) < self._required_margin(order):
+            return {'success': False, 'error': 'Insufficient margin'}
+
+        user_data['open_orders'].append(order)
+
+        if not update_user_data(user_id, user_data):
+            return {'success': False, 'error': 'Failed to place order'}
+
+        self._notify('order_opened', user_id, order, user_data)
+        return {'success': True, 'order': order}
+
+    def place_orders(self, user_id, orders_data):
+        """Place a batch of orders with one margin check and one account write"""
+        with user_lock(user_id):
+            user_data = get_user_data(user_id)
+            if not user_data:
+                return {'success': False, 'error': 'User not found'}
+
+            results = []
+            orders = []
+            for order_data in orders_data:
+                order = self._build_order(order_data)
+                if 'error' in order:
+                    results.append({'success': False, 'error': order['error']})
+                else:
+                    results.append(None)
+                    orders.append(order)
+
+            # Margin is checked against the whole batch, not order by order
+            required_margin = sum(self._required_margin(order) for order in orders)
+            if orders and self._free_margin(user_id, user_data) < required_margin:
+                return {
+                    'success': False,
+                    'error': 'Insufficient margin',
+                    'results': [result or {'success': False, 'error': 'Insufficient margin'}
+                                for result in results]
+                }
+
+            if orders:
+                user_data['open_orders'].extend(orders)
+                if not update_user_data(user_id, user_data):
+                    return {'success': False, 'error': 'Failed to place orders'}
+
+            placed = iter(orders)
+            for i, result in enumerate(results):
+                if result is None:
+                    order = next(placed)
+                    self._notify('order_opened', user_id, order, user_data)
+                    results[i] = {'success': True, 'order': order}
+
+            return {'success': True, 'placed': len(orders), 'results': results}
+
+    def _build_order(self, order_data):
+        """Validate an order request and turn it into an open order"""
+        symbol = order_data.get('symbol')
+        order_type = order_data.get('type')
         lot_size = order_data.get('lot_size', 1)
-        stop_loss = order_data.get('stop_loss')
-        take_profit = order_data.get('take_profit')
-        current_price = order_data['current_price']
-        
-        # Check if user has enough balance
-        required_margin = lot_size * self.lot_size * 0.01  # 1% margin
-        if user_data['balance'] < required_margin:
-            return {'success': False, 'error': 'Insufficient balance'}
-        
-        order = {
+
+        if symbol not in self.symbols:
+            return {'error': 'Invalid symbol'}
+        if order_type not in ('buy', 'sell'):
+            return {'error': 'Invalid order type'}
+        if not _is_finite_number(lot_size) or lot_size <= 0:
+            return {'error': 'Invalid lot size'}
+
+        # Orders always fill at the live price; a price sent by the client is ignored
+        current_price = self.data_fetcher.get_current_price(symbol)
+
+        # Stops sit on the losing side of the open price, targets on the winning side
+        levels = {}
+        for key, below in (('stop_loss', order_type == 'buy'), ('take_profit', order_type == 'sell')):
+            level = order_data.get(key)
+            if level is None:
+                levels[key] = None
+                continue
+            if not _is_finite_number(level) or level <= 0:
+                return {'error': f'Invalid {key}'}
+            if (level >= current_price) if below else (level <= current_price):
+                side = 'below' if below else 'above'
+                return {'error': f'{key} must be {side} the open price {current_price}'}
+            levels[key] = float(level)
+
+        return {
             'id': str(uuid.uuid4()),
             'symbol': symbol,
             'type': order_type,
             'lot_size': lot_size,
             'open_price': current_price,
-            'stop_loss': stop_loss,
-            'take_profit': take_profit,
+            'stop_loss': levels['stop_loss'],
+            'take_profit': levels['take_profit'],
             'open_time': datetime.now().isoformat(),
             'status': 'open'
         }
-        
-        user_data['open_orders'].append(order)
-        
-        if not update_user_data(user_id, user_data):
-            return {'success': False, 'error': 'Failed to place order'}
-        
-        return {'success': True, 'order': order}
-    
-    def close_order(self, user_id, order_id):
+
+    def units(self, symbol, lots):
+        """Contract units held by lots of symbol"""
+        return lots * self.symbols[symbol].contract_size
+
+    def _required_margin(self, order):
+        return self.margin.order_margin(order)
+
+    def _free_margin(self, user_id, user_data):
+        """Equity at live prices less the margin of open positions.
+
+        Call with the user's lock held.
+        """
+        self.margin.ensure(user_id, user_data)
+        account = self.margin.account(user_id, self.data_fetcher.current_prices)
+        return account['free_margin'] if account else user_data['balance']
+
+    def close_order(self, user_id, order_id, close_price=None, reason='manual'):
+        with user_lock(user_id):
+            return self._close_order(user_id, order_id, close_price, reason)
+
+    def _close_order(self, user_id, order_id, close_price, reason):
         user_data = get_user_data(user_id)
         if not user_data:
             return {'success': False, 'error': 'User not found'}
-        
-        # Find the order
-        order_index = None
-        order_to_close = None
-        
-        for i, order in enumerate(user_data['open_orders']):
-            if order['id'] == order_id:
-                order_index = i
-                order_to_close = order
-                break
-        
-        if order_index is None:
+
+        closed = self._close_in_account(user_data, [order_id], close_price, reason)
+        closed_order = closed[order_id]
+        if closed_order is None:
             return {'success': False, 'error': 'Order not found'}
-        
-        # Get current price (in real scenario, this would be from market data)
-        # For demo, we'll use a placeholder - you should pass current price from frontend
-        current_price = order_to_close['open_price']  # This should be updated
-        
-        # Calculate P&L
-        pnl = self.calculate_pnl(
-            order_to_close['type'],
-            order_to_close['open_price'],
-            current_price,
-            order_to_close['lot_size'] * self.lot_size
-        )
-        
-        # Update balance
-        user_data['balance'] += pnl
-        
-        # Close order
-        closed_order = order_to_close.copy()
-        closed_order['close_price'] = current_price
-        closed_order['close_time'] = datetime.now().isoformat()
-        closed_order['status'] = 'closed'
-        closed_order['pnl'] = pnl
-        
-        user_data['closed_orders'].append(closed_order)
-        user_data['open_orders'].pop(order_index)
-        
+
         if not update_user_data(user_id, user_data):
             return {'success': False, 'error': 'Failed to close order'}
-        
-        return {'success': True, 'pnl': pnl, 'balance': user_data['balance']}
\ No newline at end of file
+
+        self._notify('order_closed', user_id, closed_order, user_data)
+        return {'success': True, 'pnl': closed_order['pnl'], 'balance': user_data['balance']}
+
+    def close_orders(self, user_id, order_ids, reason='manual'):
+        """Close several orders with one account write"""
+        with user_lock(user_id):
+            user_data = get_user_data(user_id)
+            if not user_data:
+                return {'success': False, 'error': 'User not found'}
+            return self._close_batch(user_id, user_data, order_ids, reason)
+
+    def stop_out(self, user_id, level):
+        """Close positions largest loss first until the margin level is above level percent.
+
+        Returns None when the account is no longer at the stop-out level.
+        """
+        with user_lock(user_id):
+            user_data = get_user_data(user_id)
+            if not user_data or not user_data['open_orders']:
+                return None
+            self.margin.ensure(user_id, user_data)
+            prices = self.data_fetcher.current_prices
+            account = self.margin.account(user_id, prices)
+            if account is None or account['margin_level'] > level:
+                return None
+
+            orders = user_data['open_orders']
+            pnls = np.array([
+                self.calculate_pnl(order['type'], order['open_price'], prices[order['symbol']],
+                                   self.units(order['symbol'], order['lot_size']))
+                for order in orders
+            ])
+            margins = np.array([self._required_margin(order) for order in orders])
+            order_ids = stop_out_orders(orders, pnls, margins, account['equity'], level)
+            result = self._close_batch(user_id, user_data, order_ids, 'stop_out')
+            result['margin_level'] = account['margin_level']
+            return result
+
+    def close_all(self, user_id, symbol=None, reason='manual'):
+        """Close every open order, or every open order on one symbol"""
+        with user_lock(user_id):
+            user_data = get_user_data(user_id)
+            if not user_data:
+                return {'success': False, 'error': 'User not found'}
+            order_ids = [order['id'] for order in user_data['open_orders']
+                         if symbol is None or order['symbol'] == symbol]
+            return self._close_batch(user_id, user_data, order_ids, reason)
+
+    def _close_batch(self, user_id, user_data, order_ids, reason):
+        closed = self._close_in_account(user_data, order_ids, None, reason)
+        closed_orders = [order for order in closed.values() if order is not None]
+
+        if closed_orders and not update_user_data(user_id, user_data):
+            return {'success': False, 'error': 'Failed to close orders'}
+
+        results = []
+        for order_id in order_ids:
+            closed_order = closed[order_id]
+            if closed_order is None:
+                results.append({'order_id': order_id, 'success': False, 'error': 'Order not found'})
+            else:
+                self._notify('order_closed', user_id, closed_order, user_data)
+                results.append({'order_id': order_id, 'success': True, 'pnl': closed_order['pnl']})
+
+        return {
+            'success': True,
+            'closed': len(closed_orders),
+            'pnl': sum(order['pnl'] for order in closed_orders),
+            'balance': user_data['balance'],
+            'results': results
+        }
+
+    def _close_in_account(self, user_data, order_ids, close_price, reason):
+        """Close orders inside user_data, returns {order_id: closed order or None}"""
+        wanted = set(order_ids)
+        closed = dict.fromkeys(order_ids)
+        close_time = datetime.now().isoformat()
+        still_open = []
+
+        for order in user_data['open_orders']:
+            if order['id'] not in wanted:
+                still_open.append(order)
+                continue
+
+            if close_price is not None:
+                current_price = close_price
+            else:
+                # Fill at the live market price
+                current_price = self.data_fetcher.get_current_price(order['symbol'])
+
+            # Calculate P&L
+            pnl = self.calculate_pnl(
+                order['type'],
+                order['open_price'],
+                current_price,
+                self.units(order['symbol'], order['lot_size'])
+            )
+
+            # Update balance
+            user_data['balance'] += pnl
+
+            # Close order
+            closed_order = order.copy()
+            closed_order['close_price'] = current_price
+            closed_order['close_time'] = close_time
+            closed_order['status'] = 'closed'
+            closed_order['pnl'] = pnl
+            closed_order['close_reason'] = reason
+
+            closed[order['id']] = closed_order
+            wanted.discard(order['id'])
+
+        user_data['open_orders'] = still_open
+        return closed
+
+    def get_portfolio(self, user_id):
+        """Account state valued at live prices"""
+        with user_lock(user_id):
+            user_data = get_user_data(user_id)
+            self.margin.ensure(user_id, user_data)
+
+        valuation = self.margin.summary(user_id, self.data_fetcher.current_prices)
+        balance = user_data.get('balance', 10000)
+        equity = balance + valuation['unrealized_pnl']
+        account = self.margin.account(user_id, self.data_fetcher.current_prices)
+        used_margin = account['used_margin'] if account else 0.0
+
+        return {
+            'balance': balance,
+            'equity': equity,
+            'unrealized_pnl': valuation['unrealized_pnl'],
+            'used_margin': used_margin,
+            'free_margin': equity - used_margin,
+            'margin_level': account['margin_level'] if account else None,
+            'exposure': valuation['exposure'],
+            'open_orders': user_data.get('open_orders', [])
+        }
+
+    def get_history(self, user_id, limit=50, before=None, since=None, until=None):
+        """A page of closed trades from the order ledger, newest first"""
+        return self.ledger.history(user_id, limit, before, since, until)
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""Compact encodings for bar series sent to the chart.
+
+'columns' is JSON with parallel arrays and epoch-second timestamps:
+    {"t": [...], "o": [...], "h": [...], "l": [...], "c": [...], "v": [...]}
+plus one array per requested indicator column.
+
+'binary' is a little-endian block readable with typed arrays:
+    16-byte header: b'OHLC', version (u8), float width in bytes (u8),
+                    2 reserved bytes, bar count (u32), 4 reserved bytes
+    t: int64[count], o/h/l/c: float32 or float64[count], v: uint32[count]
+"""
+import hashlib
+import struct
+
+import numpy as np
+
+BINARY_MAGIC = b'OHLC'
+BINARY_VERSION = 1
+BINARY_MIMETYPE = 'application/octet-stream'
+
+# Column name in the series -> key in the compact payload
+COLUMN_KEYS = (
+    ('timestamp', 't'),
+    ('open', 'o'),
+    ('high', 'h'),
+    ('low', 'l'),
+    ('close', 'c'),
+    ('volume', 'v')
+)
+
+
+def indicator_columns(series):
+    """(column, values) for columns beyond the bars, rounded, with None before warm-up"""
+    bar_columns = {column for column, _ in COLUMN_KEYS}
+    for column, values in series.items():
+        if column not in bar_columns:
+            rounded = np.round(values, 4).astype(object)
+            rounded[np.isnan(values)] = None
+            yield column, rounded.tolist()
+
+
+def encode_columns(series):
+    """Parallel-array JSON payload with prices rounded like the record format.
+
+    Indicator columns keep their own names, e.g. "sma_20".
+    """
+    payload = {}
+    for column, key in COLUMN_KEYS:
+        values = series[column]
+        if values.dtype.kind == 'f':
+            values = np.round(values, 4)
+        payload[key] = values.tolist()
+    payload.update(indicator_columns(series))
+    return payload
+
+
+def encode_binary(series, precision=64):
+    """Pack the series into the binary layout described above"""
+    float_type = np.dtype('<f4') if precision == 32 else np.dtype('<f8')
+    count = len(series['timestamp'])
+
+    parts = [
+        struct.pack('<4sBBxxIxxxx', BINARY_MAGIC, BINARY_VERSION, float_type.itemsize, count),
+        series['timestamp'].astype('<i8').tobytes()
+    ]
+    for column in ('open', 'high', 'low', 'close'):
+        parts.append(series[column].astype(float_type).tobytes())
+    parts.append(series['volume'].astype('<u4').tobytes())
+    return b''.join(parts)
+
+
+def decode_binary(payload):
+    """Inverse of encode_binary, returns a columnar series"""
+    magic, version, width, count = struct.unpack_from('<4sBBxxIxxxx', payload)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError('Not an OHLC payload')
+    float_type = np.dtype('<f4') if width == 4 else np.dtype('<f8')
+
+    offset = struct.calcsize('<4sBBxxIxxxx')
+    series = {'timestamp': np.frombuffer(payload, '<i8', count, offset)}
+    offset += count * 8
+    for column in ('open', 'high', 'low', 'close'):
+        series[column] = np.frombuffer(payload, float_type, count, offset).astype(np.float64)
+        offset += count * width
+    series['volume'] = np.frombuffer(payload, '<u4', count, offset).astype(np.int64)
+    return series
+
+
+def series_etag(*parts):
+    """Short strong validator for a response built from the given parts"""
+    return hashlib.blake2b('|'.join(str(part) for part in parts).encode(), digest_size=12).hexdigest()
@@ -119,6 +119,9 @@ class AuthManager {
             console.error('Logout error:', error);
         } finally {
             this.currentUser = null;
+            if (window.tradingManager) {
+                window.tradingManager.disconnectPortfolio();
+            }
             this.showScreen('login-screen');
         }
     }
@@ -146,8 +149,17 @@ class AuthManager {
 
     updateBalance() {
         if (this.currentUser) {
-            document.getElementById('user-balance').textContent = 
-                `Balance: $${this.currentUser.balance.toFixed(2)}`;
+            let text = `Balance: $${this.currentUser.balance.toFixed(2)}`;
+            if (this.currentUser.equity !== undefined) {
+                text += ` | Equity: $${this.currentUser.equity.toFixed(2)}`;
+            }
+            if (this.currentUser.free_margin !== undefined) {
+                text += ` | Free margin: $${this.currentUser.free_margin.toFixed(2)}`;
+            }
+            if (this.currentUser.margin_level != null) {
+                text += ` | Margin level: ${this.currentUser.margin_level.toFixed(0)}%`;
+            }
+            document.getElementById('user-balance').textContent = text;
         }
     }
 }
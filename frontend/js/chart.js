@@ -2,11 +2,77 @@ class ChartManager {
     constructor() {
         this.chart = null;
         this.currentSymbol = 'XAUUSD';
-        this.currentData = [];
+        this.currentData = null; // Columnar bars: {t, o, h, l, c, v}
         this.isDemoData = true; // Track if we're using demo data
+        this.replaySource = null; // Open replay stream, if any
+        this.replayMode = false; // Live ticks are ignored while replaying
         this.initChart();
         this.initEventListeners();
+        this.loadSymbols();
         this.loadChartData();
+
+        // Pick up newly closed bars; the server only sends what changed
+        setInterval(() => this.refreshChartData(), 30000);
+    }
+
+    initEventListeners() {
+        document.getElementById('symbol-select').addEventListener('change', (e) => {
+            this.currentSymbol = e.target.value;
+            this.loadChartData();
+        });
+
+        document.getElementById('timeframe-select').addEventListener('change', () => {
+            this.loadChartData();
+        });
+
+        document.getElementById('indicator-select').addEventListener('change', () => {
+            this.loadChartData();
+        });
+
+        document.getElementById('replay-btn').addEventListener('click', () => {
+            this.startReplay();
+        });
+
+        document.getElementById('live-btn').addEventListener('click', () => {
+            this.stopReplay();
+            this.replayMode = false;
+            this.loadChartData();
+        });
+
+        // Live prices are pushed by the server instead of polled
+        window.priceStream.onTick((tick) => {
+            if (tick.symbol === this.currentSymbol && !this.replayMode) {
+                this.handleTick(tick);
+            }
+        });
+    }
+
+    async loadSymbols() {
+        // The server's instrument list replaces the built-in options
+        try {
+            const response = await fetch(`${API_BASE}/symbols`);
+            if (!response.ok) return;
+            const symbols = await response.json();
+
+            const select = document.getElementById('symbol-select');
+            select.innerHTML = symbols.map(spec =>
+                `<option value="${spec.symbol}">${spec.name}</option>`
+            ).join('');
+            select.value = this.currentSymbol;
+        } catch (error) {
+            console.error('Symbol list failed:', error);
+        }
+    }
+
+    handleTick(tick) {
+        this.updatePriceDisplay(tick.price);
+
+        // Keep the forming bar in step with the live price
+        const points = this.chart.data.datasets[0].data;
+        if (points.length > 0) {
+            points[points.length - 1].y = tick.price;
+            this.chart.update('none');
+        }
     }
 
     initChart() {
@@ -53,6 +119,17 @@ class ChartManager {
                                 return value.toFixed(2);
                             }
                         }
+                    },
+                    // RSI and ATR are not in price units
+                    oscillator: {
+                        position: 'left',
+                        display: false,
+                        grid: {
+                            drawOnChartArea: false
+                        },
+                        ticks: {
+                            color: '#ccc'
+                        }
                     }
                 },
                 plugins: {
@@ -68,24 +145,72 @@ class ChartManager {
         });
     }
 
+    startReplay() {
+        const replayDate = document.getElementById('replay-date').value;
+        if (!replayDate) {
+            this.showMessage('Pick a date to replay from', 'warning');
+            return;
+        }
+
+        this.stopReplay();
+        this.replayMode = true;
+
+        // Scrub a span that suits the timeframe, e.g. five days of hourly bars
+        const timeframe = document.getElementById('timeframe-select').value;
+        const start = new Date(replayDate);
+        const days = { '1m': 1, '5m': 5, '15m': 5, '1h': 5, '4h': 30, '1d': 90 }[timeframe];
+        const end = new Date(start.getTime() + days * 24 * 60 * 60 * 1000);
+        const params = new URLSearchParams({
+            symbol: this.currentSymbol,
+            start: replayDate,
+            end: end.toISOString().slice(0, 19),
+            interval: timeframe,
+            speed: 20
+        });
+
+        this.chart.data.datasets.length = 1;
+        this.chart.options.scales.oscillator.display = false;
+        this.chart.data.datasets[0].data = [];
+        this.chart.data.datasets[0].label = `${this.currentSymbol} (Replay)`;
+        this.chart.update();
+        this.showMessage(`⏪ Replaying ${this.currentSymbol} from ${replayDate}`, 'info');
+
+        this.replaySource = new EventSource(`${API_BASE}/replay/stream?${params}`, { withCredentials: true });
+        this.replaySource.onmessage = (event) => {
+            const bar = JSON.parse(event.data);
+            this.chart.data.datasets[0].data.push({ x: new Date(bar.timestamp), y: bar.close });
+            this.chart.update('none');
+            this.updatePriceDisplay(bar.close);
+        };
+        this.replaySource.addEventListener('end', () => {
+            this.stopReplay();
+            this.showMessage('Replay finished - press Live to return', 'success');
+        });
+        this.replaySource.onerror = () => {
+            this.stopReplay();
+        };
+    }
+
+    stopReplay() {
+        if (this.replaySource) {
+            this.replaySource.close();
+            this.replaySource = null;
+        }
+    }
+
     async loadChartData() {
         try {
             this.showMessage('Loading market data...', 'info');
             
-            const timeframe = document.getElementById('timeframe-select').value;
-            const period = timeframe === '1h' ? '5d' : '1mo';
-            
-            const response = await fetch(
-                `${API_BASE}/data/${this.currentSymbol}?period=${period}&interval=${timeframe}`
-            );
+            const response = await fetch(this.dataUrl());
             
             const data = await response.json();
             
-            if (data && data.length > 0) {
+            if (data && data.t && data.t.length > 0) {
                 this.currentData = data;
                 this.updateChart(data);
                 this.updateCurrentPrice();
-                this.showMessage(`✅ Live demo trading active - ${data.length} data points loaded`, 'success');
+                this.showMessage(`✅ Live demo trading active - ${data.t.length} data points loaded`, 'success');
                 this.isDemoData = true;
             } else {
                 throw new Error('No data received');
@@ -98,18 +223,91 @@ class ChartManager {
         }
     }
 
+    dataUrl(since) {
+        const timeframe = document.getElementById('timeframe-select').value;
+        const period = { '1m': '1d', '5m': '1d', '15m': '5d', '1h': '5d', '4h': '1mo', '1d': '1mo' }[timeframe];
+        const indicator = document.getElementById('indicator-select').value;
+        let url = `${API_BASE}/data/${this.currentSymbol}?period=${period}&interval=${timeframe}&format=columns`;
+        if (indicator) {
+            // Computed server side over the whole period
+            url += `&indicators=${encodeURIComponent(indicator)}`;
+        }
+        if (since !== undefined) {
+            url += `&since=${since}`;
+        }
+        return url;
+    }
+
+    async refreshChartData() {
+        if (this.replayMode || !this.currentData || this.currentData.t.length === 0) return;
+
+        const symbol = this.currentSymbol;
+        const indicator = document.getElementById('indicator-select').value;
+        const since = this.currentData.t[this.currentData.t.length - 1];
+
+        try {
+            const response = await fetch(this.dataUrl(since));
+            if (!response.ok) return;
+            const delta = await response.json();
+            if (symbol !== this.currentSymbol || !delta.t || delta.t.length === 0) return;
+            if (indicator !== document.getElementById('indicator-select').value) return;
+
+            // The delta starts with the bar we already hold, replace it
+            const keep = this.currentData.t.findIndex(t => t >= delta.t[0]);
+            const merged = {};
+            Object.keys(this.currentData).forEach(key => {
+                const head = keep === -1 ? this.currentData[key] : this.currentData[key].slice(0, keep);
+                merged[key] = head.concat(delta[key]).slice(-this.currentData.t.length);
+            });
+            this.currentData = merged;
+            this.updateChart(merged);
+        } catch (error) {
+            console.error('Chart refresh failed:', error);
+        }
+    }
+
     updateChart(data) {
-        const chartData = data.map(item => ({
-            x: new Date(item.timestamp),
-            y: item.close
+        const chartData = data.t.map((t, i) => ({
+            x: new Date(t * 1000),
+            y: data.c[i]
         }));
 
         this.chart.data.datasets[0].data = chartData;
         this.chart.data.datasets[0].label = `${this.currentSymbol} ${this.isDemoData ? '(Demo)' : ''}`;
+        this.updateIndicators(data);
         this.chart.update();
     }
 
+    updateIndicators(data) {
+        // Every column beyond the bars is an indicator, e.g. sma_20 or bb_20_2_upper
+        const columns = Object.keys(data).filter(key => !['t', 'o', 'h', 'l', 'c', 'v'].includes(key));
+        const colors = ['#ffa726', '#42a5f5', '#ab47bc'];
+        let oscillator = false;
+
+        this.chart.data.datasets.length = 1;
+        columns.forEach((column, i) => {
+            const separateAxis = column.startsWith('rsi_') || column.startsWith('atr_');
+            oscillator = oscillator || separateAxis;
+            this.chart.data.datasets.push({
+                label: column,
+                data: data.t.map((t, j) => ({ x: new Date(t * 1000), y: data[column][j] })),
+                borderColor: colors[i % colors.length],
+                borderWidth: 1,
+                pointRadius: 0,
+                fill: false,
+                yAxisID: separateAxis ? 'oscillator' : 'y'
+            });
+        });
+        this.chart.options.scales.oscillator.display = oscillator;
+    }
+
     async updateCurrentPrice() {
+        const streamedPrice = window.priceStream.getPrice(this.currentSymbol);
+        if (streamedPrice !== undefined) {
+            this.updatePriceDisplay(streamedPrice);
+            return;
+        }
+
         try {
             const response = await fetch(`${API_BASE}/current-price/${this.currentSymbol}`);
             if (response.ok) {
@@ -119,8 +317,8 @@ class ChartManager {
         } catch (error) {
             console.error('Price update failed:', error);
             // Use the last data point if available
-            if (this.currentData.length > 0) {
-                const lastPrice = this.currentData[this.currentData.length - 1].close;
+            if (this.currentData && this.currentData.c.length > 0) {
+                const lastPrice = this.currentData.c[this.currentData.c.length - 1];
                 this.updatePriceDisplay(lastPrice);
             }
         }
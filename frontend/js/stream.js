@@ -0,0 +1,34 @@
+class PriceStream {
+    constructor() {
+        this.prices = {};
+        this.listeners = [];
+        this.source = null;
+        this.connect();
+    }
+
+    connect() {
+        // One connection for every symbol; EventSource reconnects by itself
+        this.source = new EventSource(`${API_BASE}/stream/prices`);
+
+        this.source.onmessage = (event) => {
+            const tick = JSON.parse(event.data);
+            this.prices[tick.symbol] = tick.price;
+            this.listeners.forEach(listener => listener(tick));
+        };
+
+        this.source.onerror = () => {
+            console.log('Price stream interrupted, reconnecting...');
+        };
+    }
+
+    onTick(listener) {
+        this.listeners.push(listener);
+    }
+
+    getPrice(symbol) {
+        return this.prices[symbol];
+    }
+}
+
+// Start streaming as soon as the script loads so other managers can subscribe
+window.priceStream = new PriceStream();
@@ -2,6 +2,7 @@ class TradingManager {
     constructor() {
         this.currentPrice = 0;
         this.openPositions = [];
+        this.portfolioSource = null; // Open portfolio event stream, if any
         this.initEventListeners();
     }
 
@@ -14,16 +15,12 @@ class TradingManager {
             });
         });
 
-        // Periodically update prices and portfolio
-        setInterval(() => {
-            this.updateCurrentPrice();
-            this.loadPortfolio();
-        }, 5000);
-    }
-
-    async updateCurrentPrice() {
-        // This would be called from chart manager in real implementation
-        // For now, we'll rely on the chart manager to update the price display
+        // Prices arrive over the shared stream
+        window.priceStream.onTick((tick) => {
+            if (tick.symbol === document.getElementById('symbol-select').value) {
+                this.currentPrice = tick.price;
+            }
+        });
     }
 
     async placeOrder(type) {
@@ -38,8 +35,6 @@ class TradingManager {
             parseFloat(document.getElementById('stop-loss').value) : null;
         const takeProfit = document.getElementById('take-profit').value ? 
             parseFloat(document.getElementById('take-profit').value) : null;
-        
-        const currentPrice = parseFloat(document.getElementById('current-price').textContent);
 
         try {
             const response = await fetch(`${API_BASE}/place-order`, {
@@ -53,17 +48,15 @@ class TradingManager {
                     type,
                     lot_size: lotSize,
                     stop_loss: stopLoss,
-                    take_profit: takeProfit,
-                    current_price: currentPrice
+                    take_profit: takeProfit
                 })
             });
 
             const data = await response.json();
 
             if (data.success) {
+                // The portfolio stream delivers the new position
                 alert(`Order placed successfully!`);
-                this.loadPortfolio();
-                window.authManager.updateBalance();
             } else {
                 alert(`Order failed: ${data.error}`);
             }
@@ -88,8 +81,6 @@ class TradingManager {
 
             if (data.success) {
                 alert(`Order closed! P&L: $${data.pnl.toFixed(2)}`);
-                this.loadPortfolio();
-                window.authManager.updateBalance();
             } else {
                 alert(`Close order failed: ${data.error}`);
             }
@@ -99,23 +90,66 @@ class TradingManager {
         }
     }
 
-    async loadPortfolio() {
+    loadPortfolio() {
+        // The server sends the whole portfolio once, then only what changes
+        this.disconnectPortfolio();
         if (!window.authManager.currentUser) return;
 
+        this.portfolioSource = new EventSource(`${API_BASE}/stream/portfolio`, { withCredentials: true });
+        this.portfolioSource.onmessage = (event) => this.handlePortfolioEvent(JSON.parse(event.data));
+        this.portfolioSource.onerror = () => {
+            console.log('Portfolio stream interrupted, reconnecting...');
+        };
+    }
+
+    disconnectPortfolio() {
+        if (this.portfolioSource) {
+            this.portfolioSource.close();
+            this.portfolioSource = null;
+        }
+    }
+
+    handlePortfolioEvent(event) {
+        const user = window.authManager.currentUser;
+        if (!user) return;
+
+        if (event.type === 'snapshot') {
+            this.openPositions = event.open_orders;
+            this.displayOpenPositions(this.openPositions);
+            this.loadHistory();
+        } else if (event.type === 'order_opened') {
+            this.openPositions.push(event.order);
+            this.displayOpenPositions(this.openPositions);
+        } else if (event.type === 'order_closed') {
+            // Manual closes as well as stop loss / take profit fills
+            this.openPositions = this.openPositions.filter(order => order.id !== event.order.id);
+            this.displayOpenPositions(this.openPositions);
+            this.loadHistory();
+        }
+
+        if (event.balance !== undefined) {
+            user.balance = event.balance;
+        }
+        if (event.equity !== undefined) {
+            user.equity = event.equity;
+            user.free_margin = event.free_margin;
+            user.margin_level = event.margin_level;
+        }
+        window.authManager.updateBalance();
+    }
+
+    async loadHistory() {
         try {
-            const response = await fetch(`${API_BASE}/portfolio`, {
+            const response = await fetch(`${API_BASE}/history?limit=10`, {
                 credentials: 'include'
             });
 
             if (response.ok) {
                 const data = await response.json();
-                this.displayOpenPositions(data.open_orders);
-                this.displayTradeHistory(data.closed_orders);
-                window.authManager.currentUser.balance = data.balance;
-                window.authManager.updateBalance();
+                this.displayTradeHistory(data.trades);
             }
         } catch (error) {
-            console.error('Error loading portfolio:', error);
+            console.error('Error loading trade history:', error);
         }
     }
 
@@ -154,10 +188,8 @@ class TradingManager {
             return;
         }
 
-        // Show last 10 trades
-        const recentHistory = history.slice(-10).reverse();
-        
-        container.innerHTML = recentHistory.map(trade => {
+        // Newest first, as returned by /api/history
+        container.innerHTML = history.map(trade => {
             const pnlClass = trade.pnl >= 0 ? 'positive' : 'negative';
             return `
                 <div class="history-item ${trade.type}">